@@ -0,0 +1,52 @@
+# file: benchmarks/bench_backfill.py
+"""
+Time importing 100,000 historical drinks in one run, as
+`caffeine_monitor.py import FILE` does.
+
+Run from the project root:  python -m benchmarks.bench_backfill
+"""
+from argparse import Namespace
+from datetime import datetime, timedelta
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+from src.backfill import backfill, load_drinks
+from src.caffeine_monitor import CaffeineMonitor
+from src.storage import SqliteStorage
+from src.timestamps import format_datetime
+
+ROWS = 100_000
+BEVERAGES = ('coffee', 'soda', 'chocolate')
+
+
+def write_csv(fname, rows):
+    """Write rows drinks, one every 90 minutes, ending now"""
+    start = datetime.today() - timedelta(minutes=90 * rows)
+    with open(fname, 'w') as outfile:
+        print('timestamp,mg,beverage', file=outfile)
+        for i in range(rows):
+            print(f'{format_datetime(start + timedelta(minutes=90 * i))},{60 + i % 50},{BEVERAGES[i % 3]}',
+                  file=outfile)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        fname = os.path.join(tmp, 'drinks.csv')
+        write_csv(fname, ROWS)
+        logging.basicConfig(filename=os.path.join(tmp, 'caffeine.log'), level=logging.INFO,
+                            format='%(levelname)s: %(message)s')
+        storage = SqliteStorage(sqlite3.connect(os.path.join(tmp, 'caffeine.db')))
+        began = time.perf_counter()
+        drinks = load_drinks(fname)
+        read = time.perf_counter()
+        backfill(CaffeineMonitor(storage, True, Namespace(mg=0, mins=0, bev='coffee')), drinks)
+        done = time.perf_counter()
+    print(f'load_drinks(): {(read - began) * 1000:8.1f} ms for {ROWS} rows')
+    print(f'backfill():    {(done - read) * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
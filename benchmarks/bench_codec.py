@@ -0,0 +1,69 @@
+# file: benchmarks/bench_codec.py
+"""
+Compare the installed JSON codecs (see src/codec.py) on future files
+of 1,000, 100,000 and 1,000,000 entries: writing the file, indented
+and compact, as write_future() does, and decoding every entry into a
+DoseBatch through the mmap, as load_pending() does. Times include
+formatting and parsing the timestamps, which every codec shares.
+
+Run from the project root:  python -m benchmarks.bench_codec
+"""
+import os
+import tempfile
+import time
+
+from src import future_map
+from src.codec import available, get_codec
+from src.doses import Dose, DoseBatch
+from src.future_queue import FutureQueue
+from src.storage import COMPACT_FORMAT, INDENTED_FORMAT, future_entries
+from src.timestamps import parse_epoch
+
+SIZES = (1_000, 100_000, 1_000_000)
+REPEAT = 3  # the best of REPEAT runs is reported
+START = parse_epoch('2023-06-08 09:00:00')
+
+
+def make_queue(n):
+    """n doses, one a minute, latest first"""
+    return FutureQueue(DoseBatch.from_doses(Dose(START + 60 * i, START, 25.0 + i % 7 / 4)
+                                            for i in reversed(range(n))))
+
+
+def time_write(codec, queue, fname, layout):
+    """:return: seconds to write the future file for queue"""
+    began = time.perf_counter()
+    with open(fname, 'w') as outfile:
+        codec.dump(future_entries(queue), outfile, **layout)
+    return time.perf_counter() - began
+
+
+def time_read(codec, fname):
+    """:return: (seconds to decode every entry, the number decoded)"""
+    began = time.perf_counter()
+    with open(fname) as infile, future_map.map_file(infile) as buf:
+        first, end = future_map.array_bounds(buf)
+        doses = future_map.read_doses(buf, first, end, codec)
+    return time.perf_counter() - began, len(doses.when)
+
+
+def main():
+    names = available()
+    print(f'{"entries":>9}  {"codec":8} {"write":>10} {"compact":>10} {"read":>10} {"size":>10}')
+    with tempfile.TemporaryDirectory() as tmp:
+        fname = os.path.join(tmp, 'future.json')
+        for n in SIZES:
+            queue = make_queue(n)
+            for name in names:
+                codec = get_codec(name)
+                write_time = min(time_write(codec, queue, fname, INDENTED_FORMAT) for __ in range(REPEAT))
+                compact_time = min(time_write(codec, queue, fname, COMPACT_FORMAT) for __ in range(REPEAT))
+                reads = [time_read(codec, fname) for __ in range(REPEAT)]  # of the compact file
+                assert all(count == n for __, count in reads)
+                read_time = min(seconds for seconds, __ in reads)
+                print(f'{n:9d}  {name:8} {write_time * 1000:8.1f}ms {compact_time * 1000:8.1f}ms '
+                      f'{read_time * 1000:8.1f}ms {os.path.getsize(fname) / 1e6:8.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# file: benchmarks/bench_history.py
+"""
+Time re-deriving the level from a year of logged doses, as
+`caffeine_monitor.py --recompute` does after a half-life change.
+
+Run from the project root:  python -m benchmarks.bench_history
+"""
+from datetime import datetime, timedelta
+import timeit
+
+from src.history import history_level
+from src.timestamps import format_datetime, to_epoch
+
+DAYS = 365
+DRINKS_PER_DAY = 4
+
+
+def make_log(days):
+    """:return: log lines for four coffees a day, each logged as four doses"""
+    lines = ['Start of log file']
+    start = datetime(2023, 1, 1, 8, 0)
+    for day in range(days):
+        for drink in range(DRINKS_PER_DAY):
+            for dose in range(4):
+                time = start + timedelta(days=day, hours=3 * drink, minutes=15 * dose + 7)
+                lines.append(f'INFO: 24.8 mg added (25.0 mg, decayed 7.0 mins): '
+                             f'level is 100.0 at {format_datetime(time)}')
+    return lines
+
+
+def main():
+    lines = make_log(DAYS)
+    now = to_epoch(datetime(2024, 1, 1))
+    elapsed = min(timeit.repeat(lambda: history_level(lines, now, 480), number=1, repeat=5))
+    print(f'history_level(): {elapsed * 1000:8.1f} ms for {len(lines) - 1} logged doses')
+
+
+if __name__ == '__main__':
+    main()
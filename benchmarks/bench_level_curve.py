@@ -0,0 +1,65 @@
+# file: benchmarks/bench_level_curve.py
+"""
+Compare a chart of the level sampled every minute for 24 hours, for
+many profiles, computed one level_at() call per sample and computed
+by CaffeineMonitor.level_curve(); then compare decay factors for a
+million elapsed times from np.power() and from decay_table().
+
+Run from the project root:  python -m benchmarks.bench_level_curve
+"""
+from argparse import Namespace
+from datetime import datetime, timedelta
+import timeit
+
+import numpy as np
+
+from src.decay import decay_factors_seconds
+from src.caffeine_monitor import CaffeineMonitor
+from src.doses import Dose, DoseBatch
+from src.storage import MemoryStorage
+from src.timestamps import from_epoch, to_epoch
+
+N_PROFILES = 100
+N_FACTORS = 1_000_000
+START = datetime(2023, 6, 8, 9, 0)
+END = START + timedelta(days=1)
+
+
+def make_monitors(n):
+    start = to_epoch(START)
+    monitors = []
+    for i in range(n):
+        doses = DoseBatch.from_doses(Dose(start + 60 * (15 * j + i % 15), start, 25.0) for j in range(8, -1, -1))
+        storage = MemoryStorage({'time': '2023-06-08 09:00:00', 'level': float(i)}, doses)
+        monitors.append(CaffeineMonitor(storage, False, Namespace(mg=0, mins=0, bev='coffee')))
+    return monitors
+
+
+def per_sample(monitors):
+    times = range(to_epoch(START), to_epoch(END) + 1, 60)
+    return [[monitor.level_at(from_epoch(t)) for t in times] for monitor in monitors]
+
+
+def vectorized(monitors):
+    return [monitor.level_curve(START, END)[1] for monitor in monitors]
+
+
+def main():
+    monitors = make_monitors(N_PROFILES)
+    results = {}
+    for name, func in [('per-sample level_at()', per_sample), ('level_curve()', vectorized)]:
+        results[name] = min(timeit.repeat(lambda: func(monitors), number=1, repeat=3))
+        print(f'{name}: {results[name] * 1000:8.1f} ms for {N_PROFILES} profiles x 1441 samples')
+
+    print(f'speedup: {results["per-sample level_at()"] / results["level_curve()"]:.1f}x')
+
+    seconds = np.random.default_rng(0).integers(0, 86400, N_FACTORS)
+    for name, func in [('np.power()', lambda: np.power(0.5, seconds / 60 / CaffeineMonitor.half_life)),
+                       ('decay_table()', lambda: decay_factors_seconds(seconds, CaffeineMonitor.half_life))]:
+        results[name] = min(timeit.repeat(func, number=1, repeat=5))
+        print(f'{name}: {results[name] * 1000:8.1f} ms for {N_FACTORS} decay factors')
+    print(f'speedup: {results["np.power()"] / results["decay_table()"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# file: benchmarks/bench_timestamps.py
+"""
+Compare datetime.strptime()/strftime() with the fixed-format codec
+in src/timestamps.py on the timestamps of a 100k-entry future file.
+The timestamps have second resolution and spread over a year, and
+the codec's caches are cleared before every run, so each run starts
+cold as in a fresh process.
+
+Run from the project root:  python -m benchmarks.bench_timestamps
+"""
+from datetime import datetime, timedelta
+import random
+import timeit
+
+from src.timestamps import TIME_FORMAT, clear_caches, format_epoch, parse_epoch, to_epoch
+
+N_ENTRIES = 100_000
+SPAN_SECONDS = 365 * 86400
+
+
+def make_timestamps(n):
+    """n timestamps at random seconds within a year of the start"""
+    start = datetime(2023, 6, 8, 9, 0)
+    rng = random.Random(1)
+    return [(start + timedelta(seconds=rng.randrange(SPAN_SECONDS))).strftime(TIME_FORMAT)
+            for __ in range(n)]
+
+
+def main():
+    stamps = make_timestamps(N_ENTRIES)
+    epochs = [parse_epoch(s) for s in stamps]
+    datetimes = [datetime.strptime(s, TIME_FORMAT) for s in stamps]
+
+    cases = [
+        ('parse  strptime', lambda: [to_epoch(datetime.strptime(s, TIME_FORMAT)) for s in stamps]),
+        ('parse  codec', lambda: [parse_epoch(s) for s in stamps]),
+        ('format strftime', lambda: [dt.strftime(TIME_FORMAT) for dt in datetimes]),
+        ('format codec', lambda: [format_epoch(e) for e in epochs]),
+    ]
+    results = {}
+    for name, func in cases:
+        results[name] = min(timeit.repeat(func, setup=clear_caches, number=1, repeat=5))
+        print(f'{name}: {results[name] * 1000:8.1f} ms for {N_ENTRIES} timestamps')
+
+    print(f'parse speedup:  {results["parse  strptime"] / results["parse  codec"]:.1f}x')
+    print(f'format speedup: {results["format strftime"] / results["format codec"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
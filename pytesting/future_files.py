@@ -0,0 +1,14 @@
+# file: pytesting/future_files.py
+import json
+
+from src.timestamps import format_epoch, parse_epoch
+
+START = parse_epoch('2023-06-08 09:00:00')
+
+
+def future_text(n, indent=4):
+    """n entries 15 minutes apart, latest first"""
+    return json.dumps([
+        {"when_to_process": format_epoch(START + 900 * i), "time_entered": format_epoch(START), "level": float(i)}
+        for i in reversed(range(n))
+    ], indent=indent)
@@ -4,6 +4,7 @@ import pytest
 from datetime import datetime, timedelta
 from argparse import Namespace
 from src.caffeine_monitor import CaffeineMonitor
+from src.storage import JsonStorage
 
 
 class TestCaffeineMonitorMain:
@@ -19,7 +20,7 @@ class TestCaffeineMonitorMain:
     ])
     def test_main_with_different_data_dict(self, data_dict):
         nmspc = Namespace(mg=100, mins=0, bev='coffee')
-        cm_obj = CaffeineMonitor(self.open_mock, self.json_load_mock, self.json_load_mock, True, nmspc)
+        cm_obj = CaffeineMonitor(JsonStorage(self.open_mock, self.json_load_mock, self.json_load_mock), True, nmspc)
         self.mocker.patch.object(cm_obj, 'read_file', return_value=None)
         cm_obj.data_dict = data_dict  # Populate data_dict directly
         self.mock_main_sub_methods(cm_obj)
@@ -34,7 +35,7 @@ class TestCaffeineMonitorMain:
     ])
     def test_main_with_different_params(self, mg, mins, bev, first_run):
         nmspc = Namespace(mg=mg, mins=mins, bev=bev)
-        cm_obj = CaffeineMonitor(self.open_mock, self.json_load_mock, self.json_load_mock, first_run, nmspc)
+        cm_obj = CaffeineMonitor(JsonStorage(self.open_mock, self.json_load_mock, self.json_load_mock), first_run, nmspc)
         self.mocker.patch.object(cm_obj, 'read_file', return_value=None)
         cm_obj.data_dict = {'time': datetime.now().strftime('%Y-%m-%d_%H:%M'), 'level': 0.0}  # Populate data_dict
         self.mock_main_sub_methods(cm_obj)
@@ -46,8 +47,7 @@ class TestCaffeineMonitorMain:
         self.read_file_mock = self.mocker.patch.object(cm_obj, 'read_file')
         self.read_future_file_mock = self.mocker.patch.object(cm_obj, 'read_future_file')
         self.decay_prev_level_mock = self.mocker.patch.object(cm_obj, 'decay_prev_level')
-        self.add_coffee_mock = self.mocker.patch.object(cm_obj, 'add_coffee')
-        self.add_soda_mock = self.mocker.patch.object(cm_obj, 'add_soda')
+        self.add_beverage_mock = self.mocker.patch.object(cm_obj, 'add_beverage')
         self.process_future_list_mock = self.mocker.patch.object(cm_obj, 'process_future_list')
         self.update_time_mock = self.mocker.patch.object(cm_obj, 'update_time')
         self.write_future_file_mock = self.mocker.patch.object(cm_obj, 'write_future_file')
@@ -61,12 +61,4 @@ class TestCaffeineMonitorMain:
             self.decay_prev_level_mock.assert_called_once()
         else:
             self.decay_prev_level_mock.assert_not_called()
-        if cm_obj.beverage == 'coffee':
-            self.add_coffee_mock.assert_called_once()
-            self.add_soda_mock.assert_not_called()
-        elif cm_obj.beverage == 'soda':
-            self.add_soda_mock.assert_called_once()
-            self.add_coffee_mock.assert_not_called()
-        else:
-            self.add_coffee_mock.assert_not_called()
-            self.add_soda_mock.assert_not_called()
+        self.add_beverage_mock.assert_called_once()
@@ -0,0 +1,66 @@
+# file: pytesting/unit/test_absorption.py
+
+import configparser
+
+import pytest
+
+from src.absorption import DEFAULT_PROFILES, AbsorptionProfile, BatemanProfile, load_profiles
+
+NOW = 1686225600  # 2023-06-08 12:00:00
+
+
+def test_expand():
+    profile = AbsorptionProfile.parse('20:0.25, 0:0.65, 40:0.1')
+    doses = profile.expand(200, NOW)
+    assert list(doses.when) == [NOW + 2400, NOW + 1200, NOW]
+    assert list(doses.entered) == [NOW] * 3
+    assert list(doses.level) == [200 * 0.1, 200 * 0.25, 200 * 0.65]
+
+
+def test_expand_many_steps():
+    profile = AbsorptionProfile([(minutes, 1 / 48) for minutes in range(0, 240, 5)])
+    doses = profile.expand(96, NOW)
+    assert len(profile) == len(doses) == 48
+    assert sum(doses.level) == pytest.approx(96.0)
+    assert doses.when[0] == NOW + 235 * 60
+
+
+@pytest.mark.parametrize("text", ['', '0:0.5', '0:0.5, 10', '0:1.5, 10:-0.5', '-5:1', 'x:1', '0:one'])
+def test_parse_invalid(text):
+    with pytest.raises(ValueError):
+        AbsorptionProfile.parse(text)
+
+
+def test_load_profiles():
+    config = configparser.ConfigParser()
+    config.read_string('[beverages]\ncoffee = 0:0.5, 10:0.5\ntea = 0:0.4, 30:0.3, 60:0.3\n')
+    profiles = load_profiles(config)
+    assert set(profiles) == set(DEFAULT_PROFILES) | {'tea'}
+    assert list(profiles['coffee'].offsets) == [600, 0]
+    assert list(load_profiles()['coffee'].offsets) == [2700, 1800, 900, 0]
+
+
+def test_load_profiles_invalid():
+    config = configparser.ConfigParser()
+    config.read_string('[beverages]\ntea = 0:0.4\n')
+    with pytest.raises(ValueError, match='tea'):
+        load_profiles(config)
+
+
+def test_bateman_profiles():
+    config = configparser.ConfigParser()
+    config.read_string('[beverages]\ntea = bateman:20\n')
+    profile = load_profiles(config)['tea']
+    assert isinstance(profile, BatemanProfile) and profile.continuous
+    assert profile.absorption_half_life == 20.0
+    state = {'level': 0.0}
+    profile.add(state, 100, 0, 360)
+    assert state == {'level': 0.0, 'absorbing': {'1200': 100.0}}
+
+
+@pytest.mark.parametrize("text", ['bateman:0', 'bateman:', 'bateman:-3', 'bateman:fast'])
+def test_bateman_profile_invalid(text):
+    config = configparser.ConfigParser()
+    config.read_string(f'[beverages]\ntea = {text}\n')
+    with pytest.raises(ValueError, match='tea'):
+        load_profiles(config)
@@ -0,0 +1,105 @@
+# file: pytesting/unit/test_backfill.py
+
+from argparse import Namespace
+from array import array
+from datetime import datetime, timedelta
+import sqlite3
+
+from freezegun import freeze_time
+import pytest
+
+from src.absorption import AbsorptionProfile, BatemanProfile
+from src.backfill import backfill, load_drinks
+from src.caffeine_monitor import CaffeineMonitor
+from src.storage import SqliteStorage
+from src.timestamps import parse_epoch
+
+START = datetime(2023, 6, 8, 9, 0, 0)
+ROWS = [('2023-06-08 09:00:00', 100, 'coffee'), ('2023-06-08 09:30:00', 60, 'soda'),
+        ('2023-06-08 10:30:00', 100, 'coffee'), ('2023-06-08 11:05:00', 40, 'tea')]
+
+
+def monitor_for(storage, first_run):
+    return CaffeineMonitor(storage, first_run, Namespace(mg=0, mins=0, bev='coffee'))
+
+
+def test_expand_many():
+    profile = AbsorptionProfile.parse('0:0.5, 20:0.5')
+    batch = profile.expand_many(array('d', [100.0, 40.0]), array('q', [1000, 5000]))
+    expected = [profile.expand(100, 1000), profile.expand(40, 5000)]
+    assert sorted(zip(batch.when, batch.entered, batch.level)) == sorted(
+        (dose.when, dose.entered, dose.level) for doses in expected for dose in doses)
+
+
+def test_load_drinks(tmp_path):
+    csv_file = tmp_path / 'doses.csv'
+    csv_file.write_text('timestamp,mg,beverage\n2023-06-08 09:00:00,95,coffee\n\n'
+                        '2023-06-08 13:30:00,40,soda\n2023-06-08 15:00:00,50\n')
+    jsonl_file = tmp_path / 'doses.jsonl'
+    jsonl_file.write_text('{"timestamp": "2023-06-08 09:00:00", "mg": 95, "beverage": "coffee"}\n'
+                          '{"timestamp": "2023-06-08 13:30:00", "mg": 40, "beverage": "soda"}\n\n'
+                          '{"timestamp": "2023-06-08 15:00:00", "mg": 50}\n')
+    expected = {'coffee': ([parse_epoch('2023-06-08 09:00:00'), parse_epoch('2023-06-08 15:00:00')], [95.0, 50.0]),
+                'soda': ([parse_epoch('2023-06-08 13:30:00')], [40.0])}
+    for fname in (csv_file, jsonl_file):
+        drinks = load_drinks(str(fname))
+        assert {bev: (list(times), list(mgs)) for bev, (times, mgs) in drinks.items()} == expected
+
+
+@pytest.mark.parametrize("name, text, line", [
+    ('bad.csv', 'timestamp,mg\n2023-06-08 09:00:00,95\n2023-06-08 9:00,95\n', 3),
+    ('bad.csv', '2023-06-08 09:00:00,95\n2023-06-08 10:00:00,lots\n', 2),
+    ('bad.csv', '2023-06-08 09:00:00,95\n2023-06-08 10:00:00\n', 2),
+    ('bad.jsonl', '{"timestamp": "2023-06-08 09:00:00", "mg": 95}\n{"time": "2023-06-08 10:00:00", "mg": 95}\n', 2),
+    ('bad.jsonl', '{"timestamp": "2023-06-08 09:00:00", "mg": 95}\nnot json\n', 2),
+    ('bad.csv', '2023-06-08 09:00:00,95\n2023-06-08 10:00:00,nan,coffee\n', 2),
+    ('bad.csv', '2023-06-08 09:00:00,-inf\n', 1),
+    ('bad.jsonl', '{"timestamp": "2023-06-08 09:00:00", "mg": Infinity}\n', 1),
+])
+def test_load_drinks_invalid(tmp_path, name, text, line):
+    (tmp_path / name).write_text(text)
+    with pytest.raises(ValueError, match=f'line {line}'):
+        load_drinks(str(tmp_path / name))
+
+
+def test_backfill_matches_runs(mocker):
+    """One backfill leaves the same level and pending doses as a run per drink"""
+    mocker.patch.dict(CaffeineMonitor.beverages, {'tea': BatemanProfile(20)})
+    now = START + timedelta(hours=2, minutes=10)
+    by_run = SqliteStorage(sqlite3.connect(':memory:'))
+    for i, (timestamp, mg, bev) in enumerate(ROWS):
+        with freeze_time(timestamp):
+            CaffeineMonitor(by_run, i == 0, Namespace(mg=mg, mins=0, bev=bev)).run()
+    with freeze_time(now):
+        last_run = monitor_for(by_run, False)
+        last_run.run()  # writes storage only if a dose falls due
+
+    by_backfill = SqliteStorage(sqlite3.connect(':memory:'))
+    drinks = {}
+    for timestamp, mg, bev in ROWS:
+        times, mgs = drinks.setdefault(bev, (array('q'), array('d')))
+        times.append(parse_epoch(timestamp))
+        mgs.append(mg)
+    with freeze_time(now):
+        assert backfill(monitor_for(by_backfill, True), drinks) == len(ROWS)
+
+    expected, actual = last_run.data_dict, by_backfill.read_state()
+    assert actual['time'] == expected['time']
+    assert actual['level'] == pytest.approx(expected['level'], abs=0.5)
+    assert actual['absorbing'] == pytest.approx(expected['absorbing'])
+    pending = by_run.read_future(0), by_backfill.read_future(0)
+    for queue in pending:
+        by_run.load_pending(queue)
+    assert list(pending[1].doses) == list(pending[0].doses)
+
+
+def test_backfill_invalid(mocker):
+    mocker.patch.dict(CaffeineMonitor.beverages, {'tea': BatemanProfile(20)})
+    storage = SqliteStorage(sqlite3.connect(':memory:'))
+    with freeze_time(START):
+        with pytest.raises(ValueError, match='No absorption profile for whiskey'):
+            backfill(monitor_for(storage, True), {'whiskey': (array('q', [0]), array('d', [10.0]))})
+        later = parse_epoch('2023-06-08 10:00:00')
+        with pytest.raises(ValueError, match='in advance'):
+            backfill(monitor_for(storage, True), {'tea': (array('q', [later]), array('d', [10.0]))})
+    assert storage.read_state() == {}
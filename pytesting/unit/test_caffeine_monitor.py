@@ -4,22 +4,43 @@ from argparse import Namespace
 from datetime import datetime, timedelta, MINYEAR
 
 from freezegun import freeze_time
+import io
 import json
 import pytest
 from pytest_mock import MockerFixture
 import sys
 
+from caffeine_monitor.src.absorption import BatemanProfile
 from caffeine_monitor.src.caffeine_monitor import CaffeineMonitor
+from caffeine_monitor.src.doses import Dose, DoseBatch
+from caffeine_monitor.src.future_queue import FutureQueue
+from caffeine_monitor.src.kinetics import bateman
+from caffeine_monitor.src.storage import JsonStorage, MemoryStorage
+from caffeine_monitor.src.timestamps import from_epoch, to_epoch
 from caffeine_monitor.src.utils import parse_clas
 
 
+def to_dose(item):
+    """dict with datetime values -> Dose"""
+    return Dose(to_epoch(item['when_to_process']), to_epoch(item['time_entered']), item['level'])
+
+
+def to_item(dose):
+    """Dose -> dict with datetime values"""
+    return {'when_to_process': from_epoch(dose.when), 'time_entered': from_epoch(dose.entered), 'level': dose.level}
+
+
+def make_queue(items):
+    return FutureQueue(DoseBatch.from_doses(map(to_dose, items)))
+
+
 def test_can_make_caffeine_monitor_instance_mocked(files_mocked):
     """
     Check CaffeineMonitor ctor makes instance
     """
     open_mock, json_load_mock, json_dump_mock = files_mocked
     nmspc = Namespace(mg=100, mins=180, bev='coffee')
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, True, nmspc)
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), True, nmspc)
     assert isinstance(cm_obj, CaffeineMonitor)
     assert cm_obj.mg_to_add == 100
     assert cm_obj.mins_ago == 180
@@ -31,7 +52,7 @@ def test_read_file(files_mocked):
     """
     nmspc = Namespace(mg=100, mins=180, bev='coffee')
     open_mock, json_load_mock, json_dump_mock = files_mocked
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, True, nmspc)
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), True, nmspc)
     assert(isinstance(cm_obj, CaffeineMonitor))
     assert cm_obj.data_dict == {}
     cm_obj.read_file()
@@ -55,7 +76,7 @@ def test_write_file_add_mg(files_mocked, caplog, mg_to_add, mins, bev):
     """
     nmspc = Namespace(mg=mg_to_add, mins=mins, bev=bev)
     open_mock, json_load_mock, json_dump_mock = files_mocked
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, True, nmspc)
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), True, nmspc)
     cur_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     orig_level = 100.0
 
@@ -88,14 +109,14 @@ def test_add_no_mg_updates_time(files_mocked):
         []
     ]
 
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, False, nmspc)
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), False, nmspc)
     cur_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     cm_obj.data_dict = {"time": cur_time, "level": initial_level}
 
     expected = {"time": cur_time, "level": initial_level}
     cm_obj.write_file()
 
-    json_dump_mock.assert_called_once_with(expected, cm_obj.iofile)
+    json_dump_mock.assert_called_once_with(expected, cm_obj.storage.iofile)
 
 
 @pytest.mark.parametrize("initial_level, initial_time, time_elapsed, expected_level, mg, mins, bev", [
@@ -116,7 +137,7 @@ def test_decay_prev_level(files_mocked_with_initial_values, initial_level, initi
     # Set the initial data_dict values based on the test case parameters
     json_load_mock.return_value = {"time": initial_time, "level": initial_level}
 
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, False, nmspc)
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), False, nmspc)
     cm_obj.data_dict = json_load_mock.return_value  # Initialize data_dict
 
     # Freeze the time before adding the time_elapsed delta
@@ -146,21 +167,18 @@ def test_decay_prev_level(files_mocked_with_initial_values, initial_level, initi
     (200, 720000, 0.0),  # Adding caffeine a very long time ago (practically decayed to 0)
     (sys.maxsize, 360, sys.maxsize / 2),  # Adding a very large amount of caffeine
 ])
-def test_decay_before_add(files_mocked, mg_add, min_ago, net_ch):
+def test_add_due_items_decays_dose(files_mocked, mg_add, min_ago, net_ch):
     nmspc = Namespace(mg=mg_add, mins=min_ago, bev='coffee')
     open_mock, json_load_mock, json_dump_mock = files_mocked
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, False, nmspc)
-    cm_obj.current_time = datetime.now()
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), False, nmspc)
+    cm_obj.current_time = datetime.now().replace(microsecond=0)
     cm_obj.data_dict = {'level': 0.0, 'time': cm_obj.current_time.strftime('%Y-%m-%d %H:%M:%S')}
 
-    # Set up self.current_item with required members
-    cm_obj.current_item = {
-        'level': mg_add,
-        'when_to_process': cm_obj.current_time - timedelta(minutes=min_ago)
-    }
+    # A single dose, due min_ago minutes ago
+    when = to_epoch(cm_obj.current_time - timedelta(minutes=min_ago))
 
     # Call the method
-    cm_obj.decay_before_add()
+    cm_obj.add_due_items(DoseBatch.from_doses([Dose(when, when, mg_add)]))
 
     # Assert the expected behavior
     minutes_elapsed = min_ago
@@ -168,38 +186,46 @@ def test_decay_before_add(files_mocked, mg_add, min_ago, net_ch):
     assert cm_obj.mg_net_change == round(expected_amount_left, 1)
 
 
-@pytest.mark.parametrize("mg, mins, expected_future_list_length", [
-    (100, 180, 4),    # Normal case
-    (0, 0, 4),        # Edge case: 0 mg and 0 mins
-    (200, 0, 4),      # Edge case: mins_ago is 0
-    (100, -30, 4),    # Edge case: negative mins_ago
+@pytest.mark.parametrize("bev, mg, mins, expected_levels, expected_offsets", [
+    ('coffee', 100, 180, [25.0] * 4, [45, 30, 15, 0]),     # Normal case
+    ('coffee', 0, 0, [], []),                              # Edge case: 0 mg schedules nothing
+    ('coffee', 100, -30, [25.0] * 4, [45, 30, 15, 0]),     # Edge case: negative mins_ago
+    ('soda', 200, 0, [20.0, 50.0, 130.0], [40, 20, 0]),    # Normal case
+    ('soda', 300, 30, [30.0, 75.0, 195.0], [40, 20, 0]),   # Edge case: mins_ago is 30
+    ('chocolate', 100, 0, [25.0] * 4, [90, 60, 30, 0]),
 ])
-def test_add_coffee(mocker, files_mocked, mg, mins, expected_future_list_length):
+def test_add_beverage(files_mocked, bev, mg, mins, expected_levels, expected_offsets):
     open_mock, json_load_mock, json_dump_mock = files_mocked
-    nmspc = Namespace(mg=mg, mins=mins, bev='coffee')
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, True, nmspc)
-    cm_obj.current_time = datetime.now()
+    nmspc = Namespace(mg=mg, mins=mins, bev=bev)
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), True, nmspc)
+    cm_obj.current_time = datetime(2023, 6, 8, 12, 0)
 
-    cm_obj.add_coffee()
+    cm_obj.add_beverage()
 
-    assert len(cm_obj.future_list) == expected_future_list_length
+    entered = to_epoch(cm_obj.current_time) - mins * 60
+    doses = list(reversed(cm_obj.future_list))
+    assert [dose.level for dose in doses] == pytest.approx(expected_levels)
+    assert [(dose.when - entered) // 60 for dose in doses] == expected_offsets
+    assert {dose.entered for dose in doses} == ({entered} if doses else set())
 
 
-@pytest.mark.parametrize("mg, mins, expected_future_list_length", [
-    (200, 0, 3),      # Normal case
-    (0, 0, 3),        # Edge case: 0 mg and 0 mins
-    (300, 30, 3),     # Edge case: mins_ago is 30
-    (100, -20, 3),    # Edge case: negative mins_ago
-])
-def test_add_soda(mocker, files_mocked, mg, mins, expected_future_list_length):
+def test_add_beverage_merges_with_pending(files_mocked):
     open_mock, json_load_mock, json_dump_mock = files_mocked
-    nmspc = Namespace(mg=mg, mins=mins, bev='soda')
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, True, nmspc)
-    cm_obj.current_time = datetime.now()
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), True,
+                             Namespace(mg=100, mins=0, bev='soda'))
+    cm_obj.current_time = datetime(2023, 6, 8, 12, 0)
+    cm_obj.future_list = make_queue([{'when_to_process': datetime(2023, 6, 8, 12, 10),
+                                      'time_entered': datetime(2023, 6, 8, 11, 55), 'level': 25.0}])
+    cm_obj.add_beverage()
+    assert [dose.level for dose in cm_obj.future_list] == [65.0, 25.0, 25.0, 10.0]
 
-    cm_obj.add_soda()
 
-    assert len(cm_obj.future_list) == expected_future_list_length
+def test_add_beverage_unknown(files_mocked):
+    open_mock, json_load_mock, json_dump_mock = files_mocked
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), True,
+                             Namespace(mg=100, mins=0, bev='whiskey'))
+    with pytest.raises(KeyError):
+        cm_obj.add_beverage()
 
 
 @pytest.mark.parametrize("initial_level, mg, mins, expected_level", [
@@ -212,7 +238,7 @@ def test_add_soda(mocker, files_mocked, mg, mins, expected_future_list_length):
 def test_add_caffeine(files_mocked, initial_level, mg, mins, bev, expected_level):
     open_mock, json_load_mock, json_dump_mock = files_mocked
     nmspc = Namespace(mg=mg, mins=mins, bev=bev)
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, True, nmspc)
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), True, nmspc)
 
     # Set the initial level and time dynamically based on the test parameters
     cm_obj.data_dict = {"time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'), "level": initial_level}
@@ -226,7 +252,7 @@ def test_add_caffeine(files_mocked, initial_level, mg, mins, bev, expected_level
 def test_update_time(files_mocked):
     nmspc = Namespace(mg=20, mins=20, bev='coffee')
     open_mock, json_load_mock, json_dump_mock = files_mocked
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, True, nmspc)
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), True, nmspc)
     cm_obj.read_file()  # loads cm.data_dict from file
     cm_obj.data_dict['time'] = (datetime.now() - timedelta(days=10)).strftime('%Y-%m-%d %H:%M:%S')
     freezer = freeze_time('2020-05-01 11:00:00')
@@ -239,18 +265,20 @@ def test_update_time(files_mocked):
 def test_str(files_mocked):
     open_mock, json_load_mock, json_dump_mock = files_mocked
     nmspc = Namespace(mg=50, mins=50, bev='soda')
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, False, nmspc)
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), False, nmspc)
     cm_obj.data_dict['level'] = 48.0
     cm_obj.data_dict['time'] = datetime(2020, 4, 1, 12, 51).strftime('%Y-%m-%d %H:%M:%S')
     assert str(cm_obj) == 'Caffeine level is 48.0 mg at time 2020-04-01 12:51:00'
 
 
-def test_read_log(files_mocked):
+def test_read_log(mocker, tmp_path):
     nmspc = Namespace(mg=100, mins=0, bev='soda')
-    open_mock, json_load_mock, json_dump_mock = files_mocked
-    # open_mock below must be called; cm_obj.read_log iterates over list
-    cm_obj = CaffeineMonitor(open_mock(), json_load_mock, json_load_mock, True, nmspc)
-    cm_obj.read_log()
+    json_load_mock = mocker.MagicMock()
+    log_path = tmp_path / 'caff.log'
+    log_path.write_text('Start of log file\n')
+    with open(log_path, 'r+') as logfile:
+        cm_obj = CaffeineMonitor(JsonStorage(logfile, json_load_mock, json_load_mock), True, nmspc)
+        cm_obj.read_log()
     assert cm_obj.log_contents[0] == 'Start of log file'
     assert cm_obj.log_contents[1] != cm_obj.log_contents[0]
     assert cm_obj.log_contents[2] == 1
@@ -315,18 +343,18 @@ def test_read_log(files_mocked):
 def test_read_future_file(files_mocked, future_data, expected_future_list):
     open_mock, json_load_mock, json_dump_mock = files_mocked
 
-    # Configure the mock file to return the future data when json.load() is called
-    json_load_mock.side_effect = [future_data]
+    # The future file holds the future data
+    future_file = io.StringIO(json.dumps(future_data, indent=4))
 
     # Create an instance of CaffeineMonitor with the mocked files
     nmspc = Namespace(mg=100, mins=180, bev='coffee')
-    cm_obj = CaffeineMonitor(open_mock, json_load_mock, json_load_mock, True, nmspc)
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, future_file), True, nmspc)
 
     # Call the read_future_file() method
     cm_obj.read_future_file()
 
     # Assert that the future_list attribute is set correctly
-    assert cm_obj.future_list == expected_future_list
+    assert [to_item(dose) for dose in reversed(cm_obj.future_list)] == expected_future_list
 
 
 def create_namespace(mg, mins, bev):
@@ -339,7 +367,7 @@ def create_namespace(mg, mins, bev):
         # Test case 1: Item is in the past and should be processed, updating the level
         (50.0, 60, 100.0 + (50.0 * (0.5 ** (60/360))), []),
 
-        # Test case 2: Item is in the future and should be added to new_future_list
+        # Test case 2: Item is in the future and should be added to future_list
         (25.0, -30, 100.0, [
             {
                 "mins": 30,
@@ -351,19 +379,17 @@ def create_namespace(mg, mins, bev):
         (100.0, 0, 200.0, []),
     ],
 )
-def test_process_item_common_cases(files_mocked, mg_net_change, mins_ago, expected_level, expected_new_future_list, current_time_str):
+def test_process_future_list_common_cases(files_mocked, mg_net_change, mins_ago, expected_level, expected_new_future_list, current_time_str):
     nmspc = Namespace(mg=mg_net_change, mins=mins_ago, bev='coffee')
-    cm_obj = CaffeineMonitor(*files_mocked, True, nmspc)
-    cm_obj.mg_net_change = mg_net_change
-    cm_obj.mins_ago = mins_ago
-    cm_obj.new_future_list = []
+    cm_obj = CaffeineMonitor(JsonStorage(*files_mocked), True, nmspc)
+    cm_obj.current_time = datetime.strptime(current_time_str, '%Y-%m-%d %H:%M:%S')
     cm_obj.data_dict = {'level': 100.0, 'time': current_time_str}
-    cm_obj.current_item = {
-        "level": cm_obj.mg_net_change,
-        "when_to_process": datetime.strptime(current_time_str, '%Y-%m-%d %H:%M:%S') - timedelta(minutes=cm_obj.mins_ago),
-        "time_entered": datetime.strptime(current_time_str, '%Y-%m-%d %H:%M:%S'),
-    }
-    cm_obj.process_item(cm_obj.mg_net_change)
+    cm_obj.future_list = make_queue([{
+        "level": mg_net_change,
+        "when_to_process": cm_obj.current_time - timedelta(minutes=mins_ago),
+        "time_entered": cm_obj.current_time,
+    }])
+    cm_obj.process_future_list()
     assert cm_obj.data_dict["level"] == pytest.approx(expected_level, rel=1e-3)
 
     # Convert datetime objects to string for comparison
@@ -373,7 +399,7 @@ def test_process_item_common_cases(files_mocked, mg_net_change, mins_ago, expect
             "time_entered": item["time_entered"].strftime('%Y-%m-%d %H:%M:%S'),
             "level": item["level"]
         }
-        for item in cm_obj.new_future_list
+        for item in map(to_item, cm_obj.future_list)
     ]
     expected_new_future_list = [
         {
@@ -395,7 +421,7 @@ def test_process_item_common_cases(files_mocked, mg_net_change, mins_ago, expect
         # Test case 2: Item with 1 day (1440 minutes) ago should affect the level minimally due to decay
         (75.0, 1440, 100.0 + (75.0 * (0.5 ** (1440/360))), []),
 
-        # Test case 3: Item with 1 day (-1440 minutes) in the future should be added to new_future_list
+        # Test case 3: Item with 1 day (-1440 minutes) in the future should be added to future_list
         (50.0, -1440, 100.0, [
             {
                 "mins": 1440,
@@ -404,19 +430,17 @@ def test_process_item_common_cases(files_mocked, mg_net_change, mins_ago, expect
         ]),
     ],
 )
-def test_process_item_edge_cases(files_mocked, mg_net_change, mins_ago, expected_level, expected_new_future_list, current_time_str):
+def test_process_future_list_edge_cases(files_mocked, mg_net_change, mins_ago, expected_level, expected_new_future_list, current_time_str):
     nmspc = Namespace(mg=mg_net_change, mins=mins_ago, bev='coffee')
-    cm_obj = CaffeineMonitor(*files_mocked, True, nmspc)
-    cm_obj.mg_net_change = mg_net_change
-    cm_obj.mins_ago = mins_ago
-    cm_obj.new_future_list = []
+    cm_obj = CaffeineMonitor(JsonStorage(*files_mocked), True, nmspc)
+    cm_obj.current_time = datetime.strptime(current_time_str, '%Y-%m-%d %H:%M:%S')
     cm_obj.data_dict = {'level': 100.0, 'time': current_time_str}
-    cm_obj.current_item = {
-        "level": cm_obj.mg_net_change,
-        "when_to_process": datetime.strptime(current_time_str, '%Y-%m-%d %H:%M:%S') - timedelta(minutes=cm_obj.mins_ago),
-        "time_entered": datetime.strptime(current_time_str, '%Y-%m-%d %H:%M:%S'),
-    }
-    cm_obj.process_item(cm_obj.mg_net_change)
+    cm_obj.future_list = make_queue([{
+        "level": mg_net_change,
+        "when_to_process": cm_obj.current_time - timedelta(minutes=mins_ago),
+        "time_entered": cm_obj.current_time,
+    }])
+    cm_obj.process_future_list()
     assert cm_obj.data_dict["level"] == pytest.approx(expected_level, rel=1e-3)
 
     # Convert datetime objects to string for comparison
@@ -426,7 +450,7 @@ def test_process_item_edge_cases(files_mocked, mg_net_change, mins_ago, expected
             "time_entered": item["time_entered"].strftime('%Y-%m-%d %H:%M:%S'),
             "level": item["level"]
         }
-        for item in cm_obj.new_future_list
+        for item in map(to_item, cm_obj.future_list)
     ]
     expected_new_future_list = [
         {
@@ -449,29 +473,238 @@ def test_process_item_edge_cases(files_mocked, mg_net_change, mins_ago, expected
 
     # Edge case: empty future list
     ([], []),
+
 ])
-def test_process_future_list(mocker, files_mocked, future_list, expected_new_future_list):
+def test_process_future_list(files_mocked, future_list, expected_new_future_list):
     # Arrange
     nmspc = Namespace(mg=0, mins=0, bev='coffee')
-    cm_obj = CaffeineMonitor(*files_mocked, True, nmspc)
-    cm_obj.future_list = future_list
-    cm_obj.new_future_list = []
-    cm_obj.curr_time = datetime(2023, 6, 8, 9, 0)  # Set current_time one hour later than time_entered
+    cm_obj = CaffeineMonitor(JsonStorage(*files_mocked), True, nmspc)
+    cm_obj.future_list = make_queue(future_list)
+    cm_obj.current_time = datetime(2023, 6, 8, 9, 0)  # Set current_time one hour later than time_entered
+    cm_obj.data_dict = {'level': 0.0, 'time': '2023-06-08 09:00:00'}
+    expected_level = sum(round(item['level'] * 0.5 ** (120 / 360), 1) for item in future_list
+                         if item['when_to_process'] <= cm_obj.current_time)
 
-    # Store the initial length of future_list
-    initial_future_list_length = len(future_list)
+    # Act
+    cm_obj.process_future_list()
 
-    # Mock the process_item() method with a side effect
-    def process_item_side_effect(mg_to_add_local):
-        if cm_obj.when_to_process > cm_obj.curr_time:
-            new_item = {"when_to_process": cm_obj.when_to_process, "time_entered": cm_obj.time_entered, "level": mg_to_add_local}
-            cm_obj.new_future_list.append(new_item)
+    # Assert
+    assert [to_item(dose) for dose in cm_obj.future_list] == expected_new_future_list
+    assert cm_obj.data_dict['level'] == pytest.approx(expected_level)
 
-    mock_process_item = mocker.patch.object(cm_obj, 'process_item', side_effect=process_item_side_effect)
 
-    # Act
+def test_process_future_list_matches_item_by_item(files_mocked, caplog):
+    """
+    Check the batch decay path gives the same levels and log lines
+    as processing items one at a time, as the former process_item() did
+    """
+    current_time = datetime(2023, 6, 8, 9, 0, 0)
+    future_list = [
+        {"when_to_process": current_time - timedelta(minutes=mins, seconds=secs),
+         "time_entered": current_time - timedelta(minutes=mins + 45),
+         "level": level}
+        for mins, secs, level in [(0, 0, 33.333), (15, 7, 25.0), (30, 0, 25.0), (-15, 0, 25.0),
+                                  (361, 59, 65.0), (720000, 0, 10.0), (1, 1, 12.35), (0, 0, 0.0)]
+    ]
+    caplog.set_level('INFO')
+
+    # Reference: the former item-by-item loop, decaying each past item
+    # with pow() and putting each future one back
+    ref_obj = CaffeineMonitor(JsonStorage(*files_mocked), True, Namespace(mg=0, mins=0, bev='coffee'))
+    ref_obj.current_time = current_time
+    ref_obj.data_dict = {'level': 10.0, 'time': '2023-06-08 09:00:00'}
+    ref_pending = []
+    for item in sorted(future_list, key=lambda x: x['when_to_process']):
+        if not item['level']:
+            continue
+        if item['when_to_process'] > current_time:
+            ref_pending.append(item)
+            continue
+        minutes = (current_time - item['when_to_process']).total_seconds() / 60
+        ref_obj.when_to_process = item['when_to_process']
+        ref_obj.mg_net_change = (item['level'] if minutes == 0
+                                 else round(item['level'] * pow(0.5, minutes / ref_obj.half_life), 1))
+        ref_obj.add_caffeine(item['level'])
+    ref_messages = [record.getMessage() for record in caplog.records]
+    caplog.clear()
+
+    cm_obj = CaffeineMonitor(JsonStorage(*files_mocked), True, Namespace(mg=0, mins=0, bev='coffee'))
+    cm_obj.current_time = current_time
+    cm_obj.data_dict = {'level': 10.0, 'time': '2023-06-08 09:00:00'}
+    cm_obj.future_list = make_queue(future_list)
     cm_obj.process_future_list()
 
-    # Assert
-    assert cm_obj.new_future_list == expected_new_future_list
-    assert mock_process_item.call_count == initial_future_list_length
+    assert [record.getMessage() for record in caplog.records] == ref_messages
+    assert cm_obj.data_dict['level'] == ref_obj.data_dict['level']
+    assert [to_item(dose) for dose in cm_obj.future_list] == ref_pending
+
+
+def test_write_future_file(files_mocked):
+    """
+    Check write_future_file() writes pending items latest first
+    and drops items with no caffeine left to add
+    """
+    open_mock, json_load_mock, json_dump_mock = files_mocked
+    cm_obj = CaffeineMonitor(JsonStorage(open_mock, json_load_mock, json_load_mock), True, Namespace(mg=0, mins=0, bev='coffee'))
+    cm_obj.future_list = make_queue([
+        {"when_to_process": datetime(2023, 6, 8, 10, 0), "time_entered": datetime(2023, 6, 8, 9, 0), "level": 25.0},
+        {"when_to_process": datetime(2023, 6, 8, 12, 0), "time_entered": datetime(2023, 6, 8, 9, 0), "level": 0.0},
+        {"when_to_process": datetime(2023, 6, 8, 11, 0), "time_entered": datetime(2023, 6, 8, 9, 0), "level": 10.0},
+    ])
+
+    cm_obj.write_future_file()
+
+    json_dump_mock.assert_called_once_with([
+        {"when_to_process": "2023-06-08 11:00:00", "time_entered": "2023-06-08 09:00:00", "level": 10.0},
+        {"when_to_process": "2023-06-08 10:00:00", "time_entered": "2023-06-08 09:00:00", "level": 25.0},
+    ], cm_obj.storage.iofile_future, indent=4)
+
+
+def make_future_file(whens):
+    """A future file in the format write_future_file() produces, latest first"""
+    return io.StringIO(json.dumps([
+        {"when_to_process": when, "time_entered": "2023-06-08 08:00:00", "level": 10.0}
+        for when in whens
+    ], indent=4))
+
+
+PENDING_WHENS = ["2023-06-08 12:00:00", "2023-06-08 11:00:00", "2023-06-08 10:00:01"]
+DUE_WHENS = ["2023-06-08 10:00:00", "2023-06-08 09:00:00"]
+
+
+def test_read_future_file_decodes_only_due_entries(mocker):
+    future_file = make_future_file(PENDING_WHENS + DUE_WHENS)
+    cm_obj = CaffeineMonitor(JsonStorage(mocker.MagicMock(), mocker.MagicMock(), future_file), False,
+                             Namespace(mg=0, mins=0, bev='coffee'))
+    cm_obj.current_time = datetime(2023, 6, 8, 10, 0)
+
+    cm_obj.read_future_file()
+
+    assert [dose.when for dose in cm_obj.future_list] == [to_epoch(datetime(2023, 6, 8, 9)),
+                                                          to_epoch(datetime(2023, 6, 8, 10))]
+    assert cm_obj.storage.pending_on_disk is not None
+
+    cm_obj.storage.load_pending(cm_obj.future_list)
+    assert len(cm_obj.future_list) == 5
+    assert cm_obj.storage.pending_on_disk is None
+
+
+def test_write_future_file_passes_pending_entries_through(mocker):
+    many_pending_whens = [(datetime(2023, 6, 9, 10) - timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S')
+                          for i in range(1000)]
+    future_file = make_future_file(many_pending_whens + DUE_WHENS)
+    cm_obj = CaffeineMonitor(JsonStorage(mocker.MagicMock(), mocker.MagicMock(), future_file), False,
+                             Namespace(mg=0, mins=0, bev='coffee'))
+    cm_obj.current_time = datetime(2023, 6, 8, 10, 0)
+    cm_obj.data_dict = {'level': 0.0, 'time': '2023-06-08 10:00:00'}
+    decode_spy = mocker.spy(json.JSONDecoder, 'raw_decode')
+
+    cm_obj.read_future_file()
+    cm_obj.add_beverage()  # 0 mg
+    cm_obj.process_future_list()
+    cm_obj.write_future_file()
+
+    assert future_file.getvalue() == make_future_file(many_pending_whens).getvalue()
+    assert decode_spy.call_count < 50  # the binary search and the due entries only
+
+
+def test_write_future_file_merges_added_doses_with_pending_entries(mocker):
+    future_file = make_future_file(PENDING_WHENS + DUE_WHENS)
+    cm_obj = CaffeineMonitor(JsonStorage(mocker.MagicMock(), mocker.MagicMock(), future_file), False,
+                             Namespace(mg=100, mins=0, bev='coffee'))
+    cm_obj.current_time = datetime(2023, 6, 8, 10, 0)
+    cm_obj.data_dict = {'level': 0.0, 'time': '2023-06-08 10:00:00'}
+
+    cm_obj.read_future_file()
+    cm_obj.add_beverage()
+    cm_obj.process_future_list()
+    cm_obj.write_future_file()
+
+    written = [item['when_to_process'] for item in json.loads(future_file.getvalue())]
+    assert written == ["2023-06-08 12:00:00", "2023-06-08 11:00:00", "2023-06-08 10:45:00",
+                       "2023-06-08 10:30:00", "2023-06-08 10:15:00", "2023-06-08 10:00:01"]
+
+
+def level_at_storage():
+    state = {'time': '2023-06-08 09:00:00', 'level': 80.0}
+    start = to_epoch(datetime(2023, 6, 8, 9, 0))
+    doses = DoseBatch.from_doses(Dose(start + 60 * mins, start, 25.0) for mins in (45, 30, 15, 0))
+    return MemoryStorage(state, doses)
+
+
+@pytest.mark.parametrize("when", ['2023-06-08 09:00:00', '2023-06-08 09:20:00', '2023-06-08 09:45:00',
+                                  '2023-06-08 15:07:13', '2023-06-10 09:00:00'])
+def test_level_at_matches_run(when):
+    storage = level_at_storage()
+    with freeze_time('2023-06-08 09:00:00'):
+        level = CaffeineMonitor(storage, False, Namespace(mg=0, mins=0, bev='coffee')).level_at(
+            datetime.strptime(when, '%Y-%m-%d %H:%M:%S'))
+    assert not storage.dirty
+
+    with freeze_time(when):
+        cm_obj = CaffeineMonitor(storage, False, Namespace(mg=0, mins=0, bev='coffee'))
+        cm_obj.run()
+    assert level == pytest.approx(cm_obj.data_dict['level'], abs=1e-9)
+
+
+def test_level_at_rejects_time_before_stored():
+    cm_obj = CaffeineMonitor(level_at_storage(), False, Namespace(mg=0, mins=0, bev='coffee'))
+    with pytest.raises(ValueError):
+        cm_obj.level_at(datetime(2023, 6, 8, 8, 59))
+
+
+def test_level_at_first_run():
+    storage = MemoryStorage(None, DoseBatch.from_doses([Dose(to_epoch(datetime(2023, 6, 8, 9, 0)), 0, 50.0)]))
+    cm_obj = CaffeineMonitor(storage, True, Namespace(mg=0, mins=0, bev='coffee'))
+    assert cm_obj.level_at(datetime(2023, 6, 8, 15, 0)) == 25.0
+
+
+def test_level_curve_matches_level_at():
+    cm_obj = CaffeineMonitor(level_at_storage(), False, Namespace(mg=0, mins=0, bev='coffee'))
+    times, levels = cm_obj.level_curve(datetime(2023, 6, 8, 9, 0), datetime(2023, 6, 9, 9, 0))
+    assert len(times) == len(levels) == 1441
+    for i in (0, 14, 15, 16, 44, 45, 600, 1440):
+        assert levels[i] == pytest.approx(cm_obj.level_at(from_epoch(times[i])), abs=1e-9)
+
+
+def test_continuous_absorption(mocker):
+    mocker.patch.dict(CaffeineMonitor.beverages, {'tea': BatemanProfile(20)})
+    storage = MemoryStorage()
+    with freeze_time('2023-06-08 09:00:00'):
+        CaffeineMonitor(storage, True, Namespace(mg=100, mins=10, bev='tea')).run()
+    assert len(storage.queue) == 0
+    assert storage.state['level'] == pytest.approx(bateman(100.0, 20, 360, 10)[0])
+
+    projected = CaffeineMonitor(storage, False, Namespace(mg=0, mins=0, bev='coffee')).level_at(
+        datetime(2023, 6, 8, 10, 0))
+    times, curve = CaffeineMonitor(storage, False, Namespace(mg=0, mins=0, bev='coffee')).level_curve(
+        datetime(2023, 6, 8, 9, 0), datetime(2023, 6, 8, 10, 0))
+    with freeze_time('2023-06-08 10:00:00'):
+        cm_obj = CaffeineMonitor(storage, False, Namespace(mg=0, mins=0, bev='coffee'))
+        cm_obj.run()
+    assert cm_obj.data_dict['level'] == pytest.approx(bateman(100.0, 20, 360, 70)[0])
+    assert projected == pytest.approx(cm_obj.data_dict['level'])
+    assert curve[-1] == pytest.approx(projected)
+
+
+def test_continuous_absorption_in_advance(mocker):
+    mocker.patch.dict(CaffeineMonitor.beverages, {'tea': BatemanProfile(20)})
+    cm_obj = CaffeineMonitor(MemoryStorage(), True, Namespace(mg=100, mins=-10, bev='tea'))
+    with pytest.raises(ValueError):
+        cm_obj.run()
+
+
+@pytest.mark.parametrize("now, mg, expected_dirty", [
+    ('2023-06-08 09:10:00', 0, False),  # a pure query, with nothing due
+    ('2023-06-08 09:10:00', 30, True),  # an addition
+    ('2023-06-08 09:20:00', 0, True),  # a dose falls due
+])
+def test_run_writes_only_changes(now, mg, expected_dirty):
+    start = to_epoch(datetime(2023, 6, 8, 9, 0))
+    storage = MemoryStorage({'time': '2023-06-08 09:00:00', 'level': 80.0},
+                            DoseBatch.from_doses(Dose(start + 60 * mins, start, 25.0) for mins in (45, 30, 15)))
+    with freeze_time(now):
+        cm_obj = CaffeineMonitor(storage, False, Namespace(mg=mg, mins=0, bev='coffee'))
+        cm_obj.run()
+    assert storage.dirty == expected_dirty
+    assert (storage.state['time'] == now) == expected_dirty
@@ -0,0 +1,72 @@
+# file: pytesting/unit/test_codec.py
+
+import io
+import json
+
+import pytest
+
+from src import codec as codec_module
+from src.codec import CODECS, STDLIB_CODEC, available, get_codec
+from src.timestamps import format_epoch, parse_epoch
+
+START = parse_epoch('2023-06-08 09:00:00')
+ENTRIES = [{"when_to_process": format_epoch(START + 900 * i), "time_entered": format_epoch(START), "level": i / 3}
+           for i in reversed(range(5))]
+
+
+@pytest.fixture(params=available())
+def codec(request):
+    return get_codec(request.param)
+
+
+def test_available():
+    assert available()[-1] == 'json'
+    assert set(available()) <= set(CODECS)
+
+
+@pytest.mark.parametrize("layout", [{}, {'indent': 4}, {'separators': (',', ':')}])
+def test_round_trip(codec, layout):
+    outfile = io.StringIO()
+    codec.dump(ENTRIES, outfile, **layout)
+    assert json.loads(outfile.getvalue()) == ENTRIES
+    assert codec.load(io.StringIO(outfile.getvalue())) == ENTRIES
+    assert ('\n' in outfile.getvalue()) == ('indent' in layout)
+
+
+@pytest.mark.parametrize("as_bytes", [False, True])
+def test_decode_doses(codec, as_bytes):
+    text = json.dumps(ENTRIES)
+    doses = codec.decode_doses(text.encode() if as_bytes else text)
+    expected = STDLIB_CODEC.decode_doses(text)
+    assert list(doses.when) == list(expected.when) == [START + 900 * i for i in reversed(range(5))]
+    assert list(doses.entered) == [START] * 5
+    assert list(doses.level) == [entry['level'] for entry in ENTRIES]
+
+
+@pytest.mark.parametrize("text", ['[{"when_to_process": "2023-06-08 09:00:00", ', '[{"level": 1.0}]', '[1]'])
+def test_decode_doses_invalid(codec, text):
+    with pytest.raises(json.JSONDecodeError):
+        codec.decode_doses(text)
+
+
+def test_load_invalid(codec):
+    with pytest.raises(json.JSONDecodeError):
+        codec.load(io.StringIO('{"time": "2023-06-08 09:00:00", "le'))
+
+
+def test_get_codec(mocker):
+    assert get_codec().name == available()[0]
+    assert get_codec('json').name == 'json'
+    with pytest.raises(ValueError):
+        get_codec('pickle')
+    mocker.patch.object(codec_module.OrjsonCodec, 'module', 'no_such_module')
+    mocker.patch.dict('sys.modules', {'orjson': None})  # import orjson raises ImportError
+    assert 'orjson' not in available()
+    with pytest.raises(ValueError):
+        get_codec('orjson')
+
+
+def test_get_codec_auto_falls_back(mocker):
+    """auto takes the stdlib codec when no fast library imports, even one that is found"""
+    mocker.patch.dict('sys.modules', {'msgspec': None, 'orjson': None, 'ujson': None})
+    assert get_codec('auto').name == 'json'
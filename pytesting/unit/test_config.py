@@ -0,0 +1,91 @@
+# file: pytesting/unit/test_config.py
+
+import os
+
+import pytest
+
+from src import config as config_module
+from src.config import CACHE_SUFFIX, CONFIG_PATH, PROJECT_ROOT, EnvironmentConfig, load_config, read_config_file
+
+INI = '''[prod]
+json_file = src/caffeine_production.json
+json_file_future = src/caffeine_production_future.json
+log_file = src/caffeine_production.log
+
+[half_lives]
+default = 300
+'''
+
+
+@pytest.fixture
+def ini(tmp_path):
+    ini_file = tmp_path / 'caffeine.ini'
+    ini_file.write_text(INI)
+    return str(ini_file)
+
+
+def test_load_config_matches_parser():
+    parser = read_config_file(CONFIG_PATH)
+    assert load_config() == {name: dict(parser[name]) for name in parser.sections()}
+
+
+def test_load_config_cached(ini, mocker):
+    expected = {'prod': {'json_file': 'src/caffeine_production.json',
+                         'json_file_future': 'src/caffeine_production_future.json',
+                         'log_file': 'src/caffeine_production.log'},
+                'half_lives': {'default': '300'}}
+    assert load_config(ini) == expected
+    assert os.path.isfile(ini + CACHE_SUFFIX)
+
+    parse = mocker.spy(config_module, 'read_config_file')
+    assert load_config(ini) == expected
+    parse.assert_not_called()
+
+    with open(ini, 'a') as outfile:  # a changed ini is parsed again
+        outfile.write('alice = 200\n')
+    assert load_config(ini)['half_lives'] == {'default': '300', 'alice': '200'}
+    parse.assert_called_once_with(ini)
+
+
+def test_load_config_damaged_cache(ini):
+    with open(ini + CACHE_SUFFIX, 'wb') as outfile:
+        outfile.write(b'\x00garbage')
+    assert load_config(ini)['half_lives'] == {'default': '300'}
+    assert load_config(ini + '.missing') == {}
+
+
+def test_load_config_from_any_directory(tmp_path, monkeypatch):
+    expected = load_config()
+    monkeypatch.chdir(tmp_path)
+    assert load_config() == expected
+    assert EnvironmentConfig(expected['prod']).json_file() == os.path.join(
+        PROJECT_ROOT, expected['prod']['json_file'])
+
+
+def test_environment_config():
+    env_config = EnvironmentConfig({'json_file': 'devel/caff.json', 'json_file_future': '/tmp/caff_future.json',
+                                    'log_file': 'devel/caff.log', 'storage': 'journal'})
+    assert env_config.storage == 'journal'
+    assert env_config.json_file() == os.path.join(PROJECT_ROOT, 'devel/caff.json')
+    assert env_config.json_file_future('alice') == '/tmp/caff_future_alice.json'
+    assert env_config.log_file('alice') == os.path.join(PROJECT_ROOT, 'devel/caff_alice.log')
+    assert env_config.lock_file('alice') == os.path.join(PROJECT_ROOT, 'devel/caff_alice.lock')
+    assert env_config.socket_file() == os.path.join(PROJECT_ROOT, 'devel/caff.sock')
+    assert EnvironmentConfig({}).storage == 'json'
+    assert EnvironmentConfig({}).json_codec == 'json'
+    assert EnvironmentConfig({'json_codec': 'auto'}).json_codec == 'auto'
+    with pytest.raises(KeyError):
+        env_config.db_file()
+    with pytest.raises(ValueError):
+        env_config.json_file('no/such')
+
+
+@pytest.mark.parametrize("section, expected", [({}, False), ({'json_compact': 'yes'}, True),
+                                               ({'json_compact': 'Off'}, False), ({'json_compact': '1'}, True)])
+def test_environment_config_json_compact(section, expected):
+    assert EnvironmentConfig(section).json_compact is expected
+
+
+def test_environment_config_json_compact_invalid():
+    with pytest.raises(ValueError):
+        EnvironmentConfig({'json_compact': 'sometimes'}).json_compact
@@ -0,0 +1,261 @@
+# file: pytesting/unit/test_daemon.py
+
+from argparse import Namespace
+from datetime import datetime
+import json
+import logging
+import sqlite3
+import threading
+
+from freezegun import freeze_time
+import pytest
+
+from src.caffeine_monitor import forward_to_daemon
+from src.client import parse_request, request
+from src.daemon import MonitorServer, ResidentMonitor
+from src.profiles import ProfileEngine
+from src.storage import JournalStorage, JsonStorage, SqliteStorage
+from src.timestamps import to_epoch
+
+START = datetime(2023, 6, 8, 9, 0, 0)
+
+
+@pytest.fixture
+def sqlite_backend():
+    connection = sqlite3.connect(':memory:', check_same_thread=False)  # as the daemon connects
+    yield SqliteStorage(connection)
+    connection.close()
+
+
+@pytest.fixture
+def json_backend(tmp_path):
+    (tmp_path / 'caff.log').write_text('Start of log file\nINFO: one\nINFO: two\n')
+    (tmp_path / 'caff.json').write_text('{}')
+    (tmp_path / 'caff_future.json').write_text('[]')
+    with open(tmp_path / 'caff.log', 'r+') as logfile, open(tmp_path / 'caff.json', 'r+') as iofile, \
+            open(tmp_path / 'caff_future.json', 'r+') as iofile_future:
+        yield JsonStorage(logfile, iofile, iofile_future)
+
+
+def reload_level(backend_type, *args):
+    """:return: the level and pending doses a fresh backend reads back"""
+    backend = backend_type(*args)
+    state = backend.read_state()
+    queue = backend.read_future(to_epoch(START))
+    backend.load_pending(queue)
+    return state['level'], [dose.level for dose in reversed(queue)]
+
+
+def test_resident_level_query_does_not_write(sqlite_backend, mocker):
+    with freeze_time(START):
+        resident = ResidentMonitor(sqlite_backend)
+        write_state = mocker.spy(sqlite_backend, 'write_state')
+        assert resident.run().data_dict['level'] == 0.0
+    write_state.assert_not_called()
+
+
+def test_resident_add_writes_through(sqlite_backend):
+    with freeze_time(START):
+        resident = ResidentMonitor(sqlite_backend)
+        assert resident.run(100).data_dict['level'] == 25.0
+    assert reload_level(SqliteStorage, sqlite_backend.connection) == (25.0, [25.0] * 3)
+
+    with freeze_time('2023-06-08 09:20:00'):
+        level = resident.run().data_dict['level']  # drains the 09:15 dose
+    assert reload_level(SqliteStorage, sqlite_backend.connection) == (level, [25.0] * 2)
+
+
+def test_resident_level_at(sqlite_backend, mocker):
+    with freeze_time(START):
+        resident = ResidentMonitor(sqlite_backend)
+        resident.run(100)
+    write_state = mocker.spy(sqlite_backend, 'write_state')
+    assert resident.level_at(datetime(2023, 6, 8, 15, 0)) == pytest.approx(sum(25.0 * 0.5 ** (mins / 360) for mins in (360, 345, 330, 315)), abs=0.2)
+    write_state.assert_not_called()
+
+
+def test_resident_rolls_back_failed_save(sqlite_backend, mocker):
+    with freeze_time(START):
+        resident = ResidentMonitor(sqlite_backend)
+        resident.run(100)
+        mocker.patch.object(sqlite_backend, 'write_state', side_effect=OSError('disk full'))
+        with pytest.raises(OSError):
+            resident.run(40, bev='soda')
+        assert resident.run().data_dict['level'] == 25.0
+        assert len(resident.memory.queue) == 3
+
+
+def test_resident_json_backend(json_backend, tmp_path):
+    with freeze_time(START):
+        resident = ResidentMonitor(json_backend)
+        resident.run(100, bev='soda')
+        resident.run(100)
+    entries = json.loads((tmp_path / 'caff_future.json').read_text())
+    assert sorted(entry['level'] for entry in entries) == [10.0, 25.0, 25.0, 25.0, 25.0]
+    assert json.loads((tmp_path / 'caff.json').read_text())['level'] == 90.0
+    assert resident.history(2) == ['INFO: one', 'INFO: two']
+
+
+def test_resident_journal_backend(tmp_path):
+    path = tmp_path / 'caff.journal'
+    path.write_bytes(b'')
+    with open(path, 'r+b') as journal, freeze_time(START):
+        resident = ResidentMonitor(JournalStorage(None, journal))
+        resident.run(100)
+        resident.run(40, bev='soda')
+    with open(path, 'r+b') as journal:
+        level, pending = reload_level(JournalStorage, None, journal)
+    assert (level, sorted(pending)) == (51.0, [4.0, 10.0, 25.0, 25.0, 25.0])
+
+
+@pytest.fixture
+def server(tmp_path, sqlite_backend):
+    socket_file = str(tmp_path / 'caff.sock')
+    with freeze_time(START, tick=True):
+        server = MonitorServer(socket_file, ResidentMonitor(sqlite_backend))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socket_file
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_server_requests(server):
+    assert request(server, {'op': 'level'})['ok']
+    reply = request(server, {'op': 'add', 'mg': 100, 'mins': 0, 'bev': 'coffee'})
+    assert reply['ok'] and reply['level'] >= 24.9
+    assert reply['message'].startswith('Caffeine level is ')
+    assert request(server, {'op': 'history', 'lines': 5}) == {'ok': True, 'lines': []}
+
+
+def test_server_level_at(server):
+    request(server, {'op': 'add', 'mg': 100, 'mins': 0, 'bev': 'coffee'})
+    reply = request(server, {'op': 'level_at', 'time': '2099-01-01 00:00:00'})
+    assert reply['ok'] and reply['time'] == '2099-01-01 00:00:00' and reply['level'] < 0.1
+    assert 'ValueError' in request(server, {'op': 'level_at', 'time': '2000-01-01 00:00:00'})['error']
+
+
+@pytest.mark.parametrize("payload, error", [
+    ({'op': 'nap'}, 'Unknown op'),
+    ({'op': 'add'}, 'KeyError'),
+    ({'op': 'add', 'mg': 'lots'}, 'ValueError'),
+    ({'op': 'add', 'mg': 10, 'bev': 'whiskey'}, 'Unknown beverage'),
+    ({}, 'KeyError'),
+    ({'op': 'level_at', 'time': 'tomorrow'}, 'ValueError'),
+    ({'op': 'add', 'mg': 10, 'mins': 1000000000000}, 'mins must be between'),
+    ({'op': 'add', 'mg': 1e400}, 'OverflowError'),  # json reads 1e400 as inf
+    ({'op': 'level', 'profile': '../bob'}, 'Invalid profile name'),
+    ({'op': 'level', 'profile': 7}, 'Invalid profile name'),
+    ({'op': 'level', 'profile': 'bob'}, 'serves profile default only'),
+])
+def test_server_rejects_bad_requests(server, payload, error):
+    reply = request(server, payload)
+    assert not reply['ok'] and error in reply['error']
+
+
+def test_server_profile_name_ignores_case(server):
+    assert request(server, {'op': 'level', 'profile': 'Default'})['ok']
+
+
+def run_args(socket_file, mg=0, **options):
+    """:return: the arguments of a CLI run"""
+    args = Namespace(mg=mg, mins=0, bev='coffee', profile='default', socket_file=socket_file,
+                     daemon=False, service=False, recompute=False, import_file=None)
+    vars(args).update(options)
+    return args
+
+
+def test_forward_to_daemon(server, capsys):
+    with pytest.raises(SystemExit) as exited:
+        forward_to_daemon(run_args(server, 100))
+    assert exited.value.code == 0
+    assert capsys.readouterr().out.startswith('Caffeine level is 2')
+
+    with pytest.raises(SystemExit) as exited:
+        forward_to_daemon(run_args(server, 100, bev='whiskey'))
+    assert exited.value.code == 1
+    assert 'Unknown beverage' in capsys.readouterr().out
+
+    with pytest.raises(SystemExit) as exited:
+        forward_to_daemon(run_args(server, recompute=True))
+    assert exited.value.code == 1
+    assert capsys.readouterr().out == f'A caffeine monitor daemon is serving on {server}; stop it first\n'
+
+
+def test_forward_to_daemon_without_one(tmp_path):
+    (tmp_path / 'caff.sock').write_text('')  # stale
+    for socket_file in (tmp_path / 'caff.sock', tmp_path / 'none.sock'):
+        assert forward_to_daemon(run_args(str(socket_file), 100)) is None
+        assert forward_to_daemon(run_args(str(socket_file), daemon=True)) is None
+
+
+def test_server_names_the_default_profile(server):
+    assert request(server, {'op': 'add', 'mg': 100, 'profile': 'default'})['level'] >= 24.9
+    assert request(server, {'op': 'level'})['level'] >= 24.9
+
+
+def test_server_hosts_profile_engine(tmp_path):
+    connection = sqlite3.connect(':memory:', check_same_thread=False)
+    engine = ProfileEngine(connection, {'bob': 180.0})
+    engine.load()
+    handler = engine.log_handler()
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().setLevel(logging.INFO)
+    socket_file = str(tmp_path / 'caff.sock')
+    try:
+        with freeze_time(START), MonitorServer(socket_file, engine) as server:
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                alice = request(socket_file, {'op': 'add', 'mg': 100, 'bev': 'soda', 'profile': 'alice'})
+                bob = request(socket_file, {'op': 'add', 'mg': 40, 'profile': 'bob'})
+                default = request(socket_file, {'op': 'level'})
+                bob_later = request(socket_file, {'op': 'level_at', 'time': '2023-06-08 12:00:00', 'profile': 'bob'})
+                history = request(socket_file, {'op': 'history', 'profile': 'bob'})
+            finally:
+                server.shutdown()
+                thread.join()
+    finally:
+        logging.getLogger().removeHandler(handler)
+        logging.getLogger().setLevel(logging.WARNING)
+
+    assert (alice['level'], bob['level'], default['level']) == (65.0, 10.0, 0.0)
+    assert bob_later['level'] == pytest.approx(sum(10.0 * 0.5 ** (mins / 180) for mins in (180, 165, 150, 135)),
+                                               abs=0.2)
+    assert [line.split(':')[0] for line in history['lines']] == ['INFO']
+    reloaded = ProfileEngine(connection)
+    reloaded.load()
+    assert sorted(reloaded.profiles) == ['alice', 'bob']
+    assert reloaded.profiles['alice'].state['level'] == 65.0
+    connection.close()
+
+
+def test_server_replaces_stale_socket(tmp_path, sqlite_backend):
+    socket_file = tmp_path / 'caff.sock'
+    socket_file.write_text('')
+    with MonitorServer(str(socket_file), ResidentMonitor(sqlite_backend)):
+        assert socket_file.is_socket()
+    assert not socket_file.exists()
+
+
+@pytest.mark.parametrize("argv, expected", [
+    (['level'], (None, {'op': 'level'})),
+    (['-s', '/tmp/x.sock', 'level'], ('/tmp/x.sock', {'op': 'level'})),
+    (['add', '100'], (None, {'op': 'add', 'mg': 100, 'mins': 0, 'bev': 'coffee'})),
+    (['add', '100', '30', '-b', 'soda'], (None, {'op': 'add', 'mg': 100, 'mins': 30, 'bev': 'soda'})),
+    (['history'], (None, {'op': 'history'})),
+    (['history', '20'], (None, {'op': 'history', 'lines': 20})),
+    (['at', '2023-06-08 18:00:00'], (None, {'op': 'level_at', 'time': '2023-06-08 18:00:00'})),
+    (['-p', 'alice', 'level'], (None, {'op': 'level', 'profile': 'alice'})),
+    (['add', '100', '--profile', 'bob', '-b', 'soda'],
+     (None, {'op': 'add', 'mg': 100, 'mins': 0, 'bev': 'soda', 'profile': 'bob'})),
+])
+def test_parse_request(argv, expected):
+    assert parse_request(argv) == expected
+
+
+@pytest.mark.parametrize("argv", [['level', '3'], ['add'], ['add', 'x'], ['sleep'], ['add', '1', '2', '3']])
+def test_parse_request_invalid(argv):
+    with pytest.raises(ValueError):
+        parse_request(argv)
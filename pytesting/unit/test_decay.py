@@ -0,0 +1,104 @@
+# file: pytesting/unit/test_decay.py
+
+from array import array
+
+import pytest
+
+import src.decay
+from src.decay import (TABLE_SECONDS, decay_factors_seconds, decayed_amounts, elapsed_minutes, level_curve,
+                       projected_level)
+from src.doses import Dose, DoseBatch
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def engine(request, mocker):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        mocker.patch.object(src.decay, 'np', None)
+    return request.param
+
+
+def test_elapsed_minutes(engine):
+    now = 1686214800  # 2023-06-08 09:00:00
+    when = array('q', [now, now - 903, now + 1200, now - 31536059])
+    assert list(elapsed_minutes(now, when)) == [0.0, 903 / 60, -20.0, 31536059 / 60]
+
+
+@pytest.mark.parametrize("level, mins", [
+    (200.0, 360.0),
+    (100.0, 180.0),
+    (25.0, 15.05),
+    (200.0, -60.0),
+    (200.0, 720000.0),
+    (33.333, 0.0),  # no elapsed time: returned unrounded
+])
+def test_decayed_amounts_matches_pow(engine, level, mins):
+    expected = level if mins == 0 else round(level * pow(0.5, mins / 360), 1)
+    assert decayed_amounts(array('d', [level]), array('d', [mins]), 360) == [expected]
+
+
+def test_decayed_amounts_batch(engine):
+    levels = array('d', [50.0, 25.0, 12.5, 65.0])
+    minutes = array('d', [0.0, 15.0, 30.0, 45.5])
+    expected = [50.0] + [round(lvl * pow(0.5, m / 360), 1) for lvl, m in zip(levels[1:], minutes[1:])]
+    assert decayed_amounts(levels, minutes, 360) == expected
+
+
+def test_decayed_amounts_empty(engine):
+    assert decayed_amounts(array('d'), array('d'), 360) == []
+
+
+def test_projected_level(engine):
+    since = 1686214800  # 2023-06-08 09:00:00
+    doses = DoseBatch.from_doses(Dose(since + 60 * mins, since, 20.0) for mins in (720, 360, 0))
+    assert projected_level(40.0, since, doses, since, 360) == 60.0
+    assert projected_level(40.0, since, doses, since + 21600, 360) == 20.0 + 10.0 + 20.0
+    assert projected_level(40.0, since, DoseBatch(), since + 43200, 360) == 10.0
+    with pytest.raises(ValueError):
+        projected_level(40.0, since, doses, since - 1, 360)
+
+
+def test_level_curve_matches_projected_level(engine):
+    since = 1686214800
+    doses = DoseBatch.from_doses(Dose(since + 60 * mins, since, 12.3) for mins in (901, 45, 30, 15, 0, -20))
+    times = range(since, since + 86400, 60)
+    curve = level_curve(80.0, since, doses, times, 360)
+    assert len(curve) == len(times)
+    expected = [projected_level(80.0, since, doses, t, 360) for t in times]
+    assert list(curve) == pytest.approx(expected, abs=1e-9)
+
+
+def test_level_curve_in_chunks(engine, monkeypatch):
+    since = 1686214800
+    doses = DoseBatch.from_doses(Dose(since + 60 * mins, since, 12.3) for mins in (901, 45, 30, 15, 0, -20))
+    times = range(since, since + 7200, 60)
+    whole = list(level_curve(80.0, since, doses, times, 360))
+    monkeypatch.setattr(src.decay, 'CURVE_CELLS', 7)  # one sample a chunk
+    assert list(level_curve(80.0, since, doses, times, 360)) == whole
+
+
+def test_level_curve_rounds_as_projected_level(engine):
+    """0.7 mg halved is 0.35 as a float, just below the tie, which np.round() would round up"""
+    since = 1686214800
+    doses = DoseBatch.from_doses([Dose(since, since, 0.7)])
+    times = [since + 21600]
+    assert list(level_curve(0.0, since, doses, times, 360)) == [projected_level(0.0, since, doses, times[0], 360)]
+    assert projected_level(0.0, since, doses, times[0], 360) == 0.3
+
+
+def test_level_curve_edge_cases(engine):
+    since = 1686214800
+    assert len(level_curve(80.0, since, DoseBatch(), range(0), 360)) == 0
+    assert list(level_curve(80.0, since, DoseBatch(), [since, since + 21600], 360)) == [80.0, 40.0]
+    with pytest.raises(ValueError):
+        level_curve(80.0, since, DoseBatch(), [since - 60, since], 360)
+
+
+def test_decay_factors_seconds_match_power():
+    np = pytest.importorskip('numpy')
+    seconds = np.array([0, 1, 59, 903, 21600, TABLE_SECONDS - 1, TABLE_SECONDS, 31536059, -60], dtype=np.int64)
+    expected = np.power(0.5, seconds / 60 / 360)
+    assert decay_factors_seconds(seconds, 360).tolist() == expected.tolist()
+    assert decay_factors_seconds(seconds[:5], 360).tolist() == expected[:5].tolist()
+    assert decay_factors_seconds(seconds[:5], 300).tolist() == np.power(0.5, seconds[:5] / 60 / 300).tolist()
@@ -0,0 +1,36 @@
+# file: pytesting/unit/test_doses.py
+
+from array import array
+
+from src.doses import Dose, DoseBatch
+
+
+def test_dose_has_no_instance_dict():
+    dose = Dose(1686214800, 1686211200, 25.0)
+    assert not hasattr(dose, '__dict__')
+    assert dose == Dose(1686214800, 1686211200, 25.0)
+    assert dose != Dose(1686214800, 1686211200, 12.5)
+
+
+def test_batch_columns():
+    batch = DoseBatch.from_doses([Dose(30, 10, 1.5), Dose(20, 10, 2.5)])
+    assert batch.when == array('q', [30, 20])
+    assert batch.entered == array('q', [10, 10])
+    assert batch.level == array('d', [1.5, 2.5])
+    assert len(batch) == 2
+    assert batch[1] == Dose(20, 10, 2.5)
+    assert list(batch) == [Dose(30, 10, 1.5), Dose(20, 10, 2.5)]
+
+
+def test_batch_insert_slice_delete_reverse():
+    batch = DoseBatch.from_doses([Dose(30, 10, 1.5), Dose(10, 10, 3.5)])
+    batch.insert(1, Dose(20, 10, 2.5))
+    assert [dose.when for dose in batch] == [30, 20, 10]
+
+    tail = batch[1:]
+    assert isinstance(tail, DoseBatch)
+    tail.reverse()
+    assert list(tail) == [Dose(10, 10, 3.5), Dose(20, 10, 2.5)]
+
+    del batch[1:]
+    assert list(batch) == [Dose(30, 10, 1.5)]
@@ -0,0 +1,55 @@
+# file: pytesting/unit/test_future_map.py
+
+import json
+
+import pytest
+
+from src import future_map, future_stream
+from pytesting.future_files import START, future_text
+
+
+@pytest.fixture
+def future_file(tmp_path):
+    def make(text):
+        path = tmp_path / 'future.json'
+        path.write_text(text)
+        return open(path, 'r+')
+    return make
+
+
+def test_map_file_declines_empty_and_in_memory_files(future_file, mocker):
+    with future_file('') as infile:
+        assert future_map.map_file(infile) is None
+    assert future_map.map_file(mocker.MagicMock()) is None
+
+
+@pytest.mark.parametrize("text", ['[]', '  [\n]\n', '[{"a": 1}]', future_text(3)])
+def test_array_bounds_matches_stream(future_file, text):
+    with future_file(text) as infile, future_map.map_file(infile) as buf:
+        assert future_map.array_bounds(buf) == future_stream.array_bounds(infile)
+
+
+@pytest.mark.parametrize("text", ['{}', '[{"a": 1}', 'null', '   '])
+def test_array_bounds_rejects_non_arrays(future_file, text):
+    with future_file(text) as infile, future_map.map_file(infile) as buf:
+        with pytest.raises(json.JSONDecodeError):
+            future_map.array_bounds(buf)
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 10, 257])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_matches_stream(future_file, n, indent):
+    with future_file(future_text(n, indent)) as infile, future_map.map_file(infile) as buf:
+        first, end = future_map.array_bounds(buf)
+        for due in range(-1, n + 1):
+            now = START + 900 * due
+            start = future_map.find_first_due(buf, now, first, end)
+            assert start == future_stream.find_first_due(infile, now, first, end)
+            start = end if start is None else start
+            assert future_map.read_doses(buf, start, end) == future_stream.read_doses(infile, start, end)
+            assert future_map.read_doses(buf, first, start) == future_stream.read_doses(infile, first, start)
+            assert (future_map.last_entry_end(buf, first, start)
+                    == future_stream.last_entry_end(infile, first, start))
+            next_pending = START + 900 * (due + 1) if 0 <= due + 1 < n else None
+            assert future_map.last_when(buf, first, start) == next_pending
+            assert future_stream.last_when(infile, first, start) == next_pending
@@ -0,0 +1,105 @@
+# file: pytesting/unit/test_future_queue.py
+
+from array import array
+
+import pytest
+
+from src.doses import Dose, DoseBatch
+from src.future_queue import FutureQueue, first_at_or_before
+
+HOUR = 3600
+
+
+def make_batch(hours, level=25.0):
+    return DoseBatch.from_doses(Dose(hour * HOUR, 8 * HOUR, level) for hour in hours)
+
+
+@pytest.mark.parametrize("hours", [
+    [9, 10, 11],  # ascending
+    [11, 10, 9],  # descending, as written to file
+    [10, 11, 9],  # unsorted
+])
+def test_queue_orders_doses(hours):
+    queue = FutureQueue(make_batch(hours))
+    assert [dose.when // HOUR for dose in queue] == [9, 10, 11]
+    assert [dose.when // HOUR for dose in reversed(queue)] == [11, 10, 9]
+    assert len(queue) == 3
+
+
+def test_sorted_batch_is_used_as_is():
+    batch = make_batch([11, 10, 10, 9])
+    assert FutureQueue(batch).doses is batch
+
+
+def test_pop_due_drains_only_due_doses():
+    queue = FutureQueue(make_batch([11, 9, 10, 12]))
+    due = queue.pop_due(10 * HOUR)
+    assert isinstance(due, DoseBatch)
+    assert [dose.when // HOUR for dose in due] == [9, 10]  # boundary dose is due
+    assert [dose.when // HOUR for dose in queue] == [11, 12]
+    assert len(queue.pop_due(11 * HOUR - 1)) == 0
+    assert len(queue) == 2
+
+
+def test_pop_due_empty_queue():
+    assert len(FutureQueue().pop_due(10 * HOUR)) == 0
+
+
+def test_push_keeps_order():
+    queue = FutureQueue(make_batch([9, 12]))
+    for when in [10 * HOUR + 1800, 8 * HOUR, 13 * HOUR, 12 * HOUR]:
+        queue.push(Dose(when, 8 * HOUR, 12.5))
+    whens = [dose.when for dose in queue]
+    assert whens == sorted(whens)
+    assert len(queue) == 6
+
+
+def test_push_ties_pop_in_insertion_order():
+    first = Dose(10 * HOUR, 8 * HOUR, 1.0)
+    second = Dose(10 * HOUR, 8 * HOUR, 2.0)
+    queue = FutureQueue()
+    queue.push(first)
+    queue.push(second)
+    assert list(queue.pop_due(10 * HOUR)) == [first, second]
+
+
+@pytest.mark.parametrize("hours", [
+    [13, 10, 7],  # latest first
+    [7, 13, 10],  # unsorted
+    [14, 15],  # all after the queued doses
+    [],
+])
+def test_merge_keeps_order(hours):
+    queue = FutureQueue(make_batch([12, 11, 9, 8]))
+    queue.merge(make_batch(hours))
+    assert [dose.when // HOUR for dose in queue] == sorted([12, 11, 9, 8] + hours)
+
+
+def test_merge_ties_pop_like_push():
+    queue = FutureQueue(make_batch([10], 1.0))
+    queue.merge(make_batch([10], 2.0))
+    assert [dose.level for dose in queue.pop_due(10 * HOUR)] == [1.0, 2.0]
+
+
+def test_merge_sorts_only_the_new_doses(mocker):
+    queue = FutureQueue(make_batch([12, 11, 9, 8]))
+    sort = mocker.patch('src.future_queue.sort_latest_first', side_effect=lambda batch: batch)
+    batch = make_batch([10])
+    queue.merge(batch)
+    sort.assert_called_once_with(batch)
+    assert [dose.when // HOUR for dose in queue] == [8, 9, 10, 11, 12]
+
+
+def test_merge_into_empty_queue_copies():
+    batch = make_batch([10, 9])
+    queue = FutureQueue()
+    queue.merge(batch)
+    queue.pop_due(10 * HOUR)
+    assert len(batch) == 2
+
+
+@pytest.mark.parametrize("t, expected", [
+    (12, 0), (11, 0), (10, 1), (9, 3), (8, 3), (7, 4),
+])
+def test_first_at_or_before(t, expected):
+    assert first_at_or_before(array('q', [11, 10, 10, 8]), t) == expected
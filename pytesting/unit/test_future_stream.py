@@ -0,0 +1,88 @@
+# file: pytesting/unit/test_future_stream.py
+
+import io
+import json
+
+import pytest
+
+import src.future_stream
+from src.future_stream import (array_bounds, find_first_due, iter_entries, read_doses,
+                               last_entry_end, close_array_at)
+from src.timestamps import parse_epoch
+
+from pytesting.future_files import START, future_text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('[]', (1, 1)),
+    ('  [\n]\n', (3, 4)),
+    ('[{"a": 1}]', (1, 9)),
+])
+def test_array_bounds(text, expected):
+    assert array_bounds(io.StringIO(text)) == expected
+
+
+@pytest.mark.parametrize("text", ['', '{}', '[{"a": 1}', 'null'])
+def test_array_bounds_rejects_non_arrays(text):
+    with pytest.raises(json.JSONDecodeError):
+        array_bounds(io.StringIO(text))
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 10, 257])
+@pytest.mark.parametrize("indent", [4, None])
+def test_find_first_due_matches_linear_scan(n, indent):
+    text = future_text(n, indent)
+    infile = io.StringIO(text)
+    first, end = array_bounds(infile)
+    entries = list(iter_entries(infile, first, end))
+    for steps in range(-1, n + 1):
+        now = START + 900 * steps
+        expected = next((start for entry, start, __ in entries
+                         if parse_epoch(entry['when_to_process']) <= now), None)
+        assert find_first_due(infile, now, first, end) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 1 << 16])
+def test_iter_entries_decodes_every_entry(mocker, chunk_size):
+    mocker.patch.object(src.future_stream, 'CHUNK_SIZE', chunk_size)
+    text = future_text(50)
+    infile = io.StringIO(text)
+    first, end = array_bounds(infile)
+    decoded = [entry for entry, __, __ in iter_entries(infile, first, end)]
+    assert decoded == json.loads(text)
+
+
+def test_iter_entries_offsets():
+    text = future_text(3)
+    infile = io.StringIO(text)
+    for entry, start, stop in iter_entries(infile, *array_bounds(infile)):
+        assert json.loads(text[start:stop]) == entry
+
+
+@pytest.mark.parametrize("text", ['[{"a": 1}, 5]', '[{"a": 1} {"a": ]', '[{"a": 1}, {"a": ]'])
+def test_iter_entries_rejects_malformed_input(text):
+    infile = io.StringIO(text)
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_entries(infile, *array_bounds(infile)))
+
+
+def test_read_doses():
+    infile = io.StringIO(future_text(3))
+    doses = read_doses(infile, *array_bounds(infile))
+    assert list(doses.when) == [START + 1800, START + 900, START]
+    assert list(doses.entered) == [START] * 3
+    assert list(doses.level) == [2.0, 1.0, 0.0]
+
+
+def test_close_array_at_keeps_earlier_entries():
+    text = future_text(5)
+    infile = io.StringIO(text)
+    first, end = array_bounds(infile)
+    due_start = find_first_due(infile, START + 1800, first, end)
+    close_array_at(infile, last_entry_end(infile, first, due_start))
+    assert infile.getvalue() == json.dumps(json.loads(text)[:2], indent=4)
+
+
+def test_last_entry_end_without_entries():
+    infile = io.StringIO('[\n    \n]')
+    assert last_entry_end(infile, 1, 7) is None
@@ -0,0 +1,100 @@
+# file: pytesting/unit/test_history.py
+
+from argparse import Namespace
+from datetime import datetime, timedelta
+import logging
+import sqlite3
+
+from freezegun import freeze_time
+import pytest
+
+from src.absorption import BatemanProfile
+from src.caffeine_monitor import CaffeineMonitor
+from src.history import history_level, read_doses, read_drinks, recompute
+from src.kinetics import bateman
+from src.storage import SqliteStorage
+from src.timestamps import parse_epoch, to_epoch
+
+START = datetime(2023, 6, 8, 9, 0, 0)
+LINES = [
+    'Start of log file',
+    'INFO: 25.0 mg added (25.0 mg, decayed 0.0 mins): level is 25.0 at 2023-06-08 09:00:00',
+    'DEBUG: level is 24.1 at 2023-06-08 09:20:00',
+    'INFO: 24.4 mg added (25.0 mg, decayed 12.5 mins): level is 48.5 at 2023-06-08 09:20:00',
+    'INFO: -10.0 mg added (-10.0 mg, decayed 0.0 mins): level is 38.0 at 2023-06-08 09:30:00',
+    'INFO: 80.0 mg of tea absorbing (half-life 20 mins, 23.2 mg absorbed over 10 mins): level is 61.1 at '
+    '2023-06-08 09:40:00',
+]
+
+
+def test_read_doses():
+    starts, amounts = read_doses('\n'.join(LINES))
+    assert list(starts) == [parse_epoch('2023-06-08 09:00:00'), parse_epoch('2023-06-08 09:07:30'),
+                            parse_epoch('2023-06-08 09:30:00')]
+    assert list(amounts) == [25.0, 25.0, -10.0]
+    assert read_drinks('\n'.join(LINES)) == [(parse_epoch('2023-06-08 09:30:00'), 80.0, 20.0)]
+
+
+@pytest.mark.parametrize("half_life", [360, 240])
+def test_history_level(half_life):
+    now = parse_epoch('2023-06-08 12:00:00')
+    expected = (25.0 * 0.5 ** (180 / half_life) + 25.0 * 0.5 ** (172.5 / half_life) - 10.0 * 0.5 ** (150 / half_life)
+                + bateman(80.0, 20.0, half_life, 150)[0])
+    assert history_level(LINES, now, half_life) == pytest.approx(expected)
+
+
+def test_history_level_matches_runs(caplog, mocker):
+    mocker.patch.dict(CaffeineMonitor.beverages, {'tea': BatemanProfile(20)})
+    caplog.set_level(logging.INFO)
+    storage = SqliteStorage(sqlite3.connect(':memory:'))
+    drinks = [(100, 0, 'coffee'), (0, 0, 'coffee'), (150, 30, 'soda'), (60, 5, 'tea'), (0, 0, 'coffee'),
+              (100, 0, 'chocolate'), (0, 0, 'coffee')]
+    for i, (mg, mins, bev) in enumerate(drinks):
+        with freeze_time(START + timedelta(minutes=47 * i)):
+            monitor = CaffeineMonitor(storage, i == 0, Namespace(mg=mg, mins=mins, bev=bev))
+            monitor.run()
+    lines = [record.getMessage() for record in caplog.records]
+    level = history_level([f'INFO: {line}' for line in lines], to_epoch(monitor.current_time), 360)
+    assert level == pytest.approx(monitor.data_dict['level'], abs=0.5)
+
+
+def test_recompute(caplog):
+    connection = sqlite3.connect(':memory:')
+    storage = SqliteStorage(connection)
+    logging.getLogger().addHandler(handler := storage.log_handler())
+    caplog.set_level(logging.INFO)
+    try:
+        with freeze_time(START):
+            assert recompute(storage, 240) is None
+            CaffeineMonitor(storage, True, Namespace(mg=100, mins=0, bev='coffee')).run()
+        with freeze_time(START + timedelta(hours=2)):
+            level_360 = CaffeineMonitor(SqliteStorage(connection), False, Namespace(mg=0, mins=0, bev='coffee'))
+            level_360.run()
+            old, new = recompute(SqliteStorage(connection), 240)
+    finally:
+        logging.getLogger().removeHandler(handler)
+    assert old == level_360.data_dict['level']
+    expected = sum(25.0 * 0.5 ** (mins / 240) for mins in (120, 105, 90, 75))
+    assert new == pytest.approx(expected, abs=0.2)
+    assert SqliteStorage(connection).read_state()['level'] == new
+
+
+def test_recompute_with_drink_absorbing(caplog, mocker):
+    mocker.patch.dict(CaffeineMonitor.beverages, {'tea': BatemanProfile(60)})
+    connection = sqlite3.connect(':memory:')
+    storage = SqliteStorage(connection)
+    logging.getLogger().addHandler(handler := storage.log_handler())
+    caplog.set_level(logging.INFO)
+    try:
+        with freeze_time(START):
+            CaffeineMonitor(storage, True, Namespace(mg=200, mins=0, bev='tea')).run()
+        with freeze_time(START + timedelta(hours=2)):
+            old, new = recompute(SqliteStorage(connection), 360)
+    finally:
+        logging.getLogger().removeHandler(handler)
+
+    expected = bateman(200.0, 60, 360, 120)[0]
+    assert old == pytest.approx(expected) and new == pytest.approx(expected)
+    assert SqliteStorage(connection).read_state()['absorbing'] == {'3600': pytest.approx(50.0)}
+    later = CaffeineMonitor(SqliteStorage(connection), False, Namespace(mg=0, mins=0, bev='coffee'))
+    assert later.level_at(START + timedelta(hours=4)) == pytest.approx(bateman(200.0, 60, 360, 240)[0])
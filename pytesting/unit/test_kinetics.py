@@ -0,0 +1,68 @@
+# file: pytesting/unit/test_kinetics.py
+
+import math
+
+import pytest
+
+from src.kinetics import ABSORBING, add_drink, advance, bateman, projected_blood, rate
+
+
+def euler(gut, absorption_half_life, half_life, minutes, steps=200_000):
+    """Integrate the two compartments numerically"""
+    ka, ke = rate(absorption_half_life), rate(half_life)
+    dt = minutes / steps
+    blood = 0.0
+    for __ in range(steps):
+        blood += (ka * gut - ke * blood) * dt
+        gut -= ka * gut * dt
+    return blood, gut
+
+
+@pytest.mark.parametrize("absorption_half_life, minutes", [(20, 30), (20, 600), (360, 120), (360.0001, 90)])
+def test_bateman_matches_integration(absorption_half_life, minutes):
+    assert bateman(100.0, absorption_half_life, 360, minutes) == pytest.approx(
+        euler(100.0, absorption_half_life, 360, minutes), rel=1e-3, abs=1e-3)
+
+
+def test_bateman_at_zero():
+    assert bateman(100.0, 20, 360, 0) == (0.0, 100.0)
+
+
+def test_advance_in_steps_matches_one_step():
+    def run(state, minutes):
+        state['level'] *= 0.5 ** (minutes / 360)
+        advance(state, minutes, 360)
+
+    one, steps = {'level': 10.0, ABSORBING: {'1200': 80.0}}, {'level': 10.0, ABSORBING: {'1200': 80.0}}
+    run(one, 90)
+    for __ in range(3):
+        run(steps, 30)
+    assert steps['level'] == pytest.approx(one['level'])
+    assert steps[ABSORBING]['1200'] == pytest.approx(one[ABSORBING]['1200'])
+
+
+def test_advance_empties_the_gut():
+    state = {'level': 0.0, ABSORBING: {'1200': 80.0, '600': 80.0}}
+    stored = state[ABSORBING]
+    advance(state, 130, 360)
+    assert list(state[ABSORBING]) == ['1200']
+    assert stored == {'1200': 80.0, '600': 80.0}  # not changed in place
+    advance(state, 600, 360)
+    assert ABSORBING not in state
+    assert state['level'] > 0
+
+
+def test_add_drink():
+    state = {'level': 5.0}
+    assert add_drink(state, 100, 20, 360, 0) == 0.0
+    assert add_drink(state, 100, 20, 360, 20) == pytest.approx(bateman(100.0, 20, 360, 20)[0])
+    assert state[ABSORBING] == {'1200': pytest.approx(150.0)}
+    with pytest.raises(ValueError):
+        add_drink(state, 100, 20, 360, -5)
+
+
+def test_projected_blood():
+    gut = {'1200': 80.0}
+    assert projected_blood(None, 360, 30) == 0
+    assert projected_blood(gut, 360, 30) == bateman(80.0, 20, 360, 30)[0]
+    assert math.isclose(projected_blood(gut, 360, 0), 0.0)
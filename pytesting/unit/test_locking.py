@@ -0,0 +1,37 @@
+# file: pytesting/unit/test_locking.py
+
+import pytest
+
+from src.locking import LockTimeout, exclusive_lock, shared_lock
+
+
+def test_lock_excludes_a_second_holder(tmp_path):
+    lock_file = tmp_path / 'caff.lock'
+    with exclusive_lock(lock_file):
+        with pytest.raises(LockTimeout):
+            with exclusive_lock(lock_file, timeout=0.1):
+                pass
+    with exclusive_lock(lock_file, timeout=0.1):  # released on exit
+        pass
+
+
+def test_lock_released_on_error(tmp_path):
+    lock_file = tmp_path / 'caff.lock'
+    with pytest.raises(RuntimeError):
+        with exclusive_lock(lock_file):
+            raise RuntimeError
+    with exclusive_lock(lock_file, timeout=0.1):
+        pass
+
+
+def test_shared_lock(tmp_path):
+    lock_file = tmp_path / 'caff.lock'
+    with shared_lock(lock_file):
+        with shared_lock(lock_file, timeout=0):  # readers share it
+            with pytest.raises(LockTimeout):
+                with exclusive_lock(lock_file, timeout=0.1):
+                    pass
+    with exclusive_lock(lock_file):
+        with pytest.raises(LockTimeout):
+            with shared_lock(lock_file, timeout=0):
+                pass
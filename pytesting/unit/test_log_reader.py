@@ -0,0 +1,113 @@
+# file: pytesting/unit/test_log_reader.py
+
+import pytest
+
+from src.log_reader import (read_log_summary, index_filename, read_index,
+                            discard_index, read_log_tail, BLOCK_SIZE)
+
+
+def scan_log(path):
+    """Reference implementation: the full scan read_log() used to do"""
+    first_line = ''
+    last_line = ''
+    num_lines = 0
+    with open(path) as infile:
+        for log_line in infile:
+            num_lines += 1
+            if not first_line:
+                first_line = log_line.strip()
+            last_line = log_line.strip()
+    if num_lines < 2:
+        last_line = ''
+    return first_line, last_line, num_lines
+
+
+@pytest.mark.parametrize("contents", [
+    '',
+    'Start of log file\n',
+    'Start of log file',
+    'Start of log file\nINFO: 25.0 mg added\n',
+    'Start of log file\nINFO: 25.0 mg added',
+    'Start of log file\nINFO: 25.0 mg added\n\n',
+    '\nStart of log file\nlast\n',
+    'Start of log file\n' + 'x' * (3 * BLOCK_SIZE) + '\n',
+    'Start of log file\n' + ('INFO: line\n' * 2000) + 'INFO: final line\n',
+])
+def test_read_log_summary_matches_full_scan(tmp_path, contents):
+    log_path = tmp_path / 'caff.log'
+    log_path.write_text(contents)
+    assert read_log_summary(str(log_path)) == scan_log(log_path)
+
+
+def test_index_updated_on_append(tmp_path):
+    log_path = tmp_path / 'caff.log'
+    log_path.write_text('Start of log file\n')
+    assert read_log_summary(str(log_path)) == ('Start of log file', '', 1)
+    assert read_index(index_filename(str(log_path)))[1:] == (18, 1)
+
+    with open(log_path, 'a') as logfile:
+        logfile.write('INFO: 50.0 mg added\nINFO: 12.5 mg added\n')
+
+    assert read_log_summary(str(log_path)) == ('Start of log file', 'INFO: 12.5 mg added', 3)
+    assert read_index(index_filename(str(log_path)))[1:] == (58, 3)
+
+
+def test_index_only_scans_appended_bytes(tmp_path, mocker):
+    log_path = tmp_path / 'caff.log'
+    log_path.write_text('Start of log file\n' + 'INFO: line\n' * 100)
+    read_log_summary(str(log_path))
+    size = log_path.stat().st_size
+
+    with open(log_path, 'a') as logfile:
+        logfile.write('INFO: new line\n')
+
+    import src.log_reader
+    spy = mocker.spy(src.log_reader, 'count_newlines')
+    assert read_log_summary(str(log_path))[2] == 102
+    spy.assert_called_once()
+    assert spy.call_args.args[1:] == (size, size + 15)
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    log_path = tmp_path / 'caff.log'
+    log_path.write_text('Start of log file\n' + 'INFO: line\n' * 10)
+    read_log_summary(str(log_path))
+
+    log_path.write_text('Start of log file\n')  # log truncated and restarted
+    assert read_log_summary(str(log_path)) == ('Start of log file', '', 1)
+
+
+def test_corrupt_index_is_ignored(tmp_path):
+    log_path = tmp_path / 'caff.log'
+    log_path.write_text('Start of log file\nINFO: line\n')
+    with open(index_filename(str(log_path)), 'w') as idx_file:
+        idx_file.write('garbage')
+    assert read_log_summary(str(log_path)) == ('Start of log file', 'INFO: line', 2)
+
+
+def test_discard_index(tmp_path):
+    log_path = tmp_path / 'caff.log'
+    log_path.write_text('Start of log file\n')
+    read_log_summary(str(log_path))
+    discard_index(str(log_path))
+    assert read_index(index_filename(str(log_path))) is None
+    discard_index(str(log_path))  # missing index is not an error
+
+
+@pytest.mark.parametrize("contents", [
+    '',
+    'one\n',
+    'one',
+    'one\ntwo\nthree\n',
+    'one\ntwo\n\n',
+    'one\n' + 'x' * (3 * BLOCK_SIZE) + '\nlast\n',
+    ''.join(f'INFO: line {i}\n' for i in range(2000)),
+])
+@pytest.mark.parametrize("n", [1, 2, 5, 3000])
+def test_read_log_tail(tmp_path, contents, n):
+    log_path = tmp_path / 'caff.log'
+    log_path.write_text(contents)
+    expected = [line.strip() for line in contents.split('\n')]
+    if contents.endswith('\n'):
+        expected.pop()
+    assert read_log_tail(str(log_path), n) == (expected[-n:] if contents else [])
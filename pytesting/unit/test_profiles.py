@@ -0,0 +1,149 @@
+# file: pytesting/unit/test_profiles.py
+
+from datetime import datetime
+import sqlite3
+
+from freezegun import freeze_time
+import pytest
+
+from src.doses import Dose
+from src.profiles import ProfileEngine
+from src.storage import SqliteStorage
+from src.timestamps import to_epoch
+
+START = datetime(2023, 6, 8, 9, 0, 0)
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(':memory:')
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def engine(connection):
+    engine = ProfileEngine(connection)
+    engine.load()
+    return engine
+
+
+def test_new_profile_starts_at_zero(engine):
+    with freeze_time(START):
+        assert engine.level('alice') == 0.0
+
+
+def test_add_and_level(engine):
+    with freeze_time(START):
+        assert engine.add('alice', 100, bev='soda') == 65.0
+        assert engine.add('bob', 100) == 25.0
+    with freeze_time('2023-06-08 10:00:00'):
+        levels = engine.levels()
+        assert engine.levels(['bob']) == {'bob': levels['bob']}
+    assert levels['alice'] == pytest.approx(65 * 0.5 ** (60 / 360) + 25 * 0.5 ** (40 / 360) + 10 * 0.5 ** (20 / 360), abs=0.2)
+    assert levels['bob'] > 80
+
+
+def test_add_many(engine):
+    with freeze_time(START):
+        result = engine.add_many([('alice', 100, 0, 'soda'), ('bob', 40, 0, 'coffee'), ('alice', 100, 60, 'soda')])
+    assert set(result) == {'alice', 'bob'}
+    assert result['bob'] == 10.0
+
+
+def test_per_profile_half_life(connection):
+    engine = ProfileEngine(connection, half_lives={'alice': 180})
+    with freeze_time(START):
+        engine.add('alice', 100, bev='soda')
+        engine.add('bob', 100, bev='soda')
+    with freeze_time('2023-06-08 15:00:00'):
+        levels = engine.levels()
+    assert levels['alice'] < levels['bob']
+    assert levels['alice'] == pytest.approx(65 * 0.25 + 25 * 0.5 ** (340 / 180) + 10 * 0.5 ** (320 / 180), abs=0.2)
+
+
+def test_level_curves(engine):
+    with freeze_time(START):
+        engine.add('alice', 100, bev='soda')
+        engine.add('bob', 100)
+    times, curves = engine.level_curves(START, datetime(2023, 6, 8, 10, 0))
+    assert len(times) == 61 and set(curves) == {'alice', 'bob'}
+    with freeze_time('2023-06-08 10:00:00'):
+        levels = engine.levels()
+    assert curves['alice'][-1] == pytest.approx(levels['alice'], abs=1e-9)
+    assert curves['bob'][-1] == pytest.approx(levels['bob'], abs=1e-9)
+
+
+def test_save_and_load(connection, engine):
+    with freeze_time(START):
+        engine.add('alice', 100)
+        engine.add('bob', 100, bev='soda')
+        engine.save()
+
+    storage = SqliteStorage(connection, 'alice')
+    assert storage.read_state() == {'time': '2023-06-08 09:00:00', 'level': 25.0}
+    queue = storage.read_future(to_epoch(START))
+    storage.load_pending(queue)
+    assert [dose.level for dose in queue] == [25.0] * 3
+
+    reloaded = ProfileEngine(connection)
+    reloaded.load()
+    assert set(reloaded.profiles) == {'alice', 'bob'}
+    assert list(reloaded.storage('bob').queue) == list(engine.storage('bob').queue)
+    with freeze_time(START):
+        assert reloaded.level('alice') == 25.0
+
+
+def test_save_and_load_gut_amounts(connection, engine):
+    state = {'time': '2023-06-08 09:00:00', 'level': 5.0, 'absorbing': {'1200': 50.0}}
+    engine.storage('alice').write_state(state)
+    engine.storage('bob').write_state({'time': '2023-06-08 09:00:00', 'level': 1.0})
+    engine.save()
+    reloaded = ProfileEngine(connection)
+    reloaded.load()
+    assert reloaded.profiles['alice'].state == state
+    assert reloaded.profiles['bob'].state == {'time': '2023-06-08 09:00:00', 'level': 1.0}
+
+
+def test_save_writes_only_changed_profiles(connection, engine):
+    with freeze_time(START):
+        engine.add('alice', 100)
+        engine.add('bob', 100)
+        engine.save()
+    connection.execute("UPDATE state SET level = 999 WHERE profile = 'bob'")
+    connection.commit()
+    with freeze_time(START):
+        engine.add('alice', 100)
+        engine.save()
+    assert connection.execute("SELECT level FROM state WHERE profile = 'bob'").fetchone() == (999,)
+
+
+def test_resident_query_does_not_add_profile(engine):
+    """Only a run adds a new profile, so a save in another thread never sees the profiles change"""
+    resident = engine.for_profile('dave')
+    with freeze_time(START):
+        assert resident.level_at(datetime(2023, 6, 8, 12, 0)) == 0.0
+        assert 'dave' not in engine.profiles
+        resident.apply(mg=100, bev='soda')
+    assert engine.profiles['dave'].state['level'] == 65.0
+
+
+def test_zero_doses_are_not_kept(engine):
+    with freeze_time(START):
+        engine.level('alice')
+        engine.level('alice')
+    assert len(engine.storage('alice').queue) == 0
+
+
+def test_load_reads_profiles_written_by_sqlite_storage(connection):
+    storage = SqliteStorage(connection, 'carol')
+    storage.read_future(to_epoch(START))
+    queue = storage.read_future(to_epoch(START))
+    queue.push(Dose(to_epoch(START) + 3600, to_epoch(START), 50.0))
+    storage.write_future(queue)
+    storage.write_state({'time': '2023-06-08 09:00:00', 'level': 10.0})
+
+    engine = ProfileEngine(connection)
+    engine.load()
+    with freeze_time('2023-06-08 10:00:00'):
+        assert engine.level('carol') == pytest.approx(10 * 0.5 ** (60 / 360) + 50.0, abs=0.1)
@@ -0,0 +1,124 @@
+# file: pytesting/unit/test_quick_level.py
+
+from argparse import Namespace
+import json
+import sqlite3
+import threading
+
+from freezegun import freeze_time
+import pytest
+
+from src.caffeine_monitor import CaffeineMonitor
+from src.daemon import MonitorServer, ResidentMonitor
+from src.locking import exclusive_lock
+from src import quick_level as quick_level_module
+from src.kinetics import projected_blood
+from src.quick_level import parse_argv, quick_level, read_level
+from src.storage import JsonStorage, SqliteStorage
+from src.timestamps import parse_datetime, parse_epoch
+
+STATE = {'time': '2023-06-08 09:00:00', 'level': 80.0, 'absorbing': {'1200': 30.0}}
+FUTURE = [  # latest first
+    {'when_to_process': '2023-06-08 10:15:00', 'time_entered': '2023-06-08 09:30:00', 'level': 25.0},
+    {'when_to_process': '2023-06-08 10:00:00', 'time_entered': '2023-06-08 09:30:00', 'level': 25.0},
+    {'when_to_process': '2023-06-08 09:45:00', 'time_entered': '2023-06-08 09:30:00', 'level': 25.0},
+    {'when_to_process': '2023-06-08 09:30:00', 'time_entered': '2023-06-08 09:30:00', 'level': 25.0},
+]
+
+
+@pytest.fixture
+def files(tmp_path):
+    json_file, future_file = tmp_path / 'caff.json', tmp_path / 'caff_future.json'
+    json_file.write_text(json.dumps(STATE))
+    future_file.write_text(json.dumps(FUTURE, indent=4))
+    return str(json_file), str(future_file)
+
+
+@pytest.fixture
+def config(tmp_path, files, mocker):
+    config = {'pytesting': {'json_file': files[0], 'json_file_future': files[1],
+                            'log_file': str(tmp_path / 'caff.log')},
+              'half_lives': {'default': '300'}}
+    mocker.patch('src.quick_level.load_config', return_value=config)
+    mocker.patch.dict('os.environ', {'CAFF_ENV': 'pytesting'})
+    return config
+
+
+@pytest.mark.parametrize("argv, expected", [
+    ([], ('prod', 'default')),
+    (['-d'], ('devel', 'default')),
+    (['--pytesting', '-p', 'alice'], ('pytesting', 'alice')),
+    (['--profile', 'bob'], ('prod', 'bob')),
+    (['-p', 'Bob'], ('prod', 'bob')),
+    (['-p', 'a/b'], None),
+    (['-p'], None),
+    (['-d', '-q'], None),
+    (['100'], None),
+    (['-h'], None),
+    (['-d', '--recompute'], None),
+])
+def test_parse_argv(argv, expected):
+    assert parse_argv(argv) == expected
+
+
+@pytest.mark.parametrize("now", ['2023-06-08 09:00:00', '2023-06-08 09:45:00', '2023-06-08 10:05:30',
+                                 '2023-06-08 16:00:00'])
+def test_read_level_matches_level_at(files, now):
+    level, __ = read_level(*files, 300, parse_epoch(now))
+    with open(files[0], 'r+') as iofile, open(files[1], 'r+') as iofile_future:
+        monitor = CaffeineMonitor(JsonStorage(None, iofile, iofile_future), False,
+                                  Namespace(mg=0, mins=0, bev='coffee', half_life=300))
+        assert level == pytest.approx(monitor.level_at(parse_datetime(now)))
+
+
+def test_quick_level(config, files):
+    with freeze_time('2023-06-08 10:05:30'):
+        expected = read_level(*files, 300, parse_epoch('2023-06-08 10:05:30'))[0]
+        assert quick_level(['-q']) == f'Caffeine level is {round(expected, 1)} mg at time 2023-06-08 10:05:30'
+    with open(files[0]) as infile:
+        assert json.load(infile) == STATE  # nothing is written
+
+
+@pytest.mark.parametrize("next_due, reads_future", [
+    ('2023-06-08 09:30:00', True),  # the 09:30:00 dose is due
+    ('2023-06-08 09:45:00', False),  # the snapshot is trusted: the future file is not opened
+    (None, False),
+])
+def test_read_level_snapshot(files, mocker, next_due, reads_future):
+    with open(files[0], 'w') as outfile:
+        json.dump(dict(STATE, next_due=next_due), outfile)
+    read_due = mocker.spy(quick_level_module, 'read_due')
+    level, __ = read_level(*files, 300, parse_epoch('2023-06-08 09:30:00'))
+    assert read_due.called == reads_future
+    stored = 80.0 * 0.5 ** (30 / 300) + projected_blood(STATE['absorbing'], 300, 30)
+    assert level == pytest.approx(stored + 25.0 if reads_future else stored)
+
+
+def test_quick_level_falls_back(config, files, tmp_path):
+    with freeze_time('2023-06-08 10:05:30'):
+        assert quick_level(['-q', '5']) is None
+        assert quick_level(['-d']) is None  # $CAFF_ENV is pytesting
+        with exclusive_lock(str(tmp_path / 'caff.lock')):
+            assert quick_level(['-q']) is None
+        assert quick_level(['-q', '-p', 'alice']) is None  # a first run for alice
+        config['pytesting']['storage'] = 'sqlite'
+        assert quick_level(['-q']) is None
+
+
+@pytest.mark.parametrize("storage", ['json', 'sqlite'])
+def test_quick_level_asks_daemon(config, tmp_path, storage):
+    config['pytesting']['storage'] = storage
+    connection = sqlite3.connect(':memory:', check_same_thread=False)
+    with freeze_time('2023-06-08 10:05:30'):
+        server = MonitorServer(str(tmp_path / 'caff.sock'), ResidentMonitor(SqliteStorage(connection)))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with exclusive_lock(str(tmp_path / 'caff.lock')):  # as the daemon holds it
+                assert quick_level(['-q']) == 'Caffeine level is 0.0 mg at time 2023-06-08 10:05:30'
+                assert quick_level(['-q', '-p', 'alice']) is None  # not the daemon's profile
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+    connection.close()
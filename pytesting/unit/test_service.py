@@ -0,0 +1,160 @@
+# file: pytesting/unit/test_service.py
+
+import asyncio
+from datetime import datetime
+import json
+import sqlite3
+
+from freezegun import freeze_time
+import pytest
+
+from src.daemon import ResidentMonitor
+from src.profiles import ProfileEngine
+from src.service import MonitorService
+from src.storage import SqliteStorage
+
+START = datetime(2023, 6, 8, 9, 0, 0)
+
+
+@pytest.fixture
+def service():
+    connection = sqlite3.connect(':memory:', check_same_thread=False)  # saved from a worker thread
+    with freeze_time(START):
+        yield MonitorService(ResidentMonitor(SqliteStorage(connection)))
+    connection.close()
+
+
+async def call(service, *requests):
+    """Send each request on its own connection, all at once"""
+    async def one(payload):
+        reader, writer = await asyncio.open_unix_connection(service.socket_file)
+        writer.write(json.dumps(payload).encode() + b'\n')
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        writer.close()
+        return reply
+    return await asyncio.gather(*(one(payload) for payload in requests))
+
+
+def run_with_server(service, tmp_path, client):
+    async def main():
+        service.socket_file = str(tmp_path / 'caff.sock')
+        started = asyncio.Event()
+        server = asyncio.create_task(service.serve(service.socket_file, started))
+        await started.wait()
+        try:
+            return await client()
+        finally:
+            server.cancel()
+            await asyncio.gather(server, return_exceptions=True)
+    return asyncio.run(main())
+
+
+def test_concurrent_adds_are_serialised_and_batched(service, tmp_path):
+    replies = run_with_server(service, tmp_path, lambda: call(
+        service, *({'op': 'add', 'mg': 40, 'bev': 'coffee'} for __ in range(50))))
+    assert all(reply['ok'] for reply in replies)
+    assert max(reply['level'] for reply in replies) == pytest.approx(50 * 10.0)
+    assert 1 <= service.num_saves < 50
+
+    storage = SqliteStorage(service.resident.backend.connection)
+    assert storage.read_state()['level'] == pytest.approx(500.0)
+
+
+def test_level_served_from_snapshot(service, tmp_path, mocker):
+    async def client():
+        await call(service, {'op': 'add', 'mg': 100, 'bev': 'soda'})
+        apply = mocker.spy(service.resident, 'apply')
+        replies = await call(service, *({'op': 'level'} for __ in range(20)))
+        return apply, replies
+
+    apply, replies = run_with_server(service, tmp_path, client)
+    apply.assert_not_called()
+    assert {reply['level'] for reply in replies} == {65.0}
+
+
+def test_stale_snapshot_goes_to_writer(service):
+    resident = service.resident
+    service.snapshots['default'] = (10.0, 0, 60, None)
+    assert service.read_snapshot(resident, datetime(1970, 1, 1, 0, 0, 30))['level'] == pytest.approx(10.0, abs=0.01)
+    assert service.read_snapshot(resident, datetime(1970, 1, 1, 0, 1, 0)) is None
+    service.snapshots['default'] = (10.0, 0, None, None)
+    reply = service.read_snapshot(resident, datetime(1970, 1, 1, 6, 0, 0))
+    assert reply['level'] == pytest.approx(5.0)
+    assert reply['message'] == 'Caffeine level is 5.0 mg at time 1970-01-01 06:00:00'
+
+
+def test_bad_requests(service, tmp_path):
+    replies = run_with_server(service, tmp_path, lambda: call(
+        service, {'op': 'add', 'mg': 'x'}, {'op': 'nap'}, {'op': 'history'}))
+    assert [reply['ok'] for reply in replies] == [False, False, True]
+
+
+def test_writer_survives_failed_requests(service, tmp_path, mocker):
+    async def client():
+        failed = await call(service, {'op': 'add', 'mg': 10, 'mins': 1000000000000}, {'op': 'add', 'mg': 1e400})
+        mocker.patch.object(service.resident, 'apply', side_effect=OverflowError('date value out of range'))
+        failed += await call(service, {'op': 'add', 'mg': 10})
+        mocker.stopall()
+        return failed, await call(service, {'op': 'add', 'mg': 100})
+
+    failed, (added,) = run_with_server(service, tmp_path, client)
+    assert not any(reply['ok'] for reply in failed) and 'OverflowError' in failed[2]['error']
+    assert added['ok'] and added['level'] == 25.0
+
+
+def test_writer_survives_failed_save(service, tmp_path, mocker):
+    async def client():
+        save = mocker.patch.object(service.resident, 'save', side_effect=OSError('disk full'))
+        failed = await call(service, {'op': 'add', 'mg': 100}, {'op': 'add', 'mg': 40})
+        save.side_effect = None
+        return failed, await call(service, {'op': 'level'}, {'op': 'add', 'mg': 40, 'bev': 'soda'})
+
+    failed, (level, added) = run_with_server(service, tmp_path, client)
+    assert not any(reply['ok'] for reply in failed) and 'disk full' in failed[0]['error']
+    assert level['level'] == 0.0  # rolled back
+    assert added['ok'] and added['level'] == 26.0
+    assert service.num_saves == 1
+
+
+def test_level_at_bypasses_writer(service, tmp_path, mocker):
+    async def client():
+        await call(service, {'op': 'add', 'mg': 100, 'bev': 'soda'})
+        apply = mocker.spy(service.resident, 'apply')
+        replies = await call(service, {'op': 'level_at', 'time': '2023-06-08 15:00:00'},
+                             {'op': 'level_at', 'time': '2023-06-08 08:00:00'})
+        return apply, replies
+
+    apply, (later, earlier) = run_with_server(service, tmp_path, client)
+    apply.assert_not_called()
+    assert later['level'] == pytest.approx(32.5 + 25.0 * 0.5 ** (340 / 360) + 10.0 * 0.5 ** (320 / 360), abs=0.2)
+    assert not earlier['ok']
+    assert service.num_saves == 1
+
+
+def test_profile_engine_service(tmp_path):
+    connection = sqlite3.connect(':memory:', check_same_thread=False)
+    engine = ProfileEngine(connection, {'bob': 180.0})
+    engine.load()
+    service = MonitorService(engine)
+
+    async def client():
+        added = await call(service, {'op': 'add', 'mg': 100, 'bev': 'soda', 'profile': 'alice'},
+                           {'op': 'add', 'mg': 100, 'bev': 'soda', 'profile': 'bob'})
+        return added, await call(service, {'op': 'level', 'profile': 'alice'}, {'op': 'level', 'profile': 'bob'},
+                                 {'op': 'level'})
+
+    with freeze_time(START):
+        added, levels = run_with_server(service, tmp_path, client)
+    with freeze_time('2023-06-08 09:10:00'):
+        later = {profile: service.read_snapshot(engine.for_profile(profile), datetime.today())['level']
+                 for profile in ('alice', 'bob')}
+
+    assert [reply['level'] for reply in added] == [65.0, 65.0]
+    assert [reply['level'] for reply in levels] == [65.0, 65.0, 0.0]
+    assert later['alice'] > later['bob']  # bob's shorter half-life
+    reloaded = ProfileEngine(connection)
+    reloaded.load()
+    assert {profile: storage.state['level'] for profile, storage in reloaded.profiles.items()} == \
+        {'alice': 65.0, 'bob': 65.0}  # a query for a new profile writes nothing
+    connection.close()
@@ -0,0 +1,502 @@
+# file: pytesting/unit/test_storage.py
+
+from contextlib import closing
+import io
+import json
+import logging
+import sqlite3
+
+import pytest
+
+from src.codec import available, get_codec
+from src.doses import Dose, DoseBatch
+from src.storage import AtomicJsonStorage, JournalStorage, JsonStorage, SqliteStorage
+from src.future_queue import FutureQueue
+from src.timestamps import format_epoch, parse_epoch
+
+NOW = parse_epoch('2023-06-08 12:00:00')
+RECORD_SIZE = JournalStorage.RECORD.size
+
+
+def run(storage, now, doses=(), level_added=0.0):
+    """Go through the calls CaffeineMonitor.main() makes on a storage backend"""
+    state = storage.read_state() or {'time': '2023-06-08 00:00:00', 'level': 0.0}
+    queue = storage.read_future(now)
+    for dose in doses:
+        queue.push(dose)
+    due = queue.pop_due(now)
+    state['level'] += sum(due.level) + level_added
+    storage.write_future(queue)
+    storage.write_state(state)
+    return due
+
+
+@pytest.fixture
+def journal():
+    return io.BytesIO()
+
+
+def test_journal_empty(journal):
+    storage = JournalStorage(None, journal)
+    assert storage.read_state() == {}
+    assert len(storage.read_future(NOW)) == 0
+
+
+def test_journal_round_trip(journal):
+    doses = [Dose(NOW - 60, NOW - 60, 10.0), Dose(NOW + 900, NOW - 60, 20.0), Dose(NOW + 1800, NOW - 60, 30.0)]
+    due = run(JournalStorage(None, journal), NOW, doses)
+    assert list(due) == doses[:1]
+
+    storage = JournalStorage(None, journal)
+    assert storage.read_state() == {'time': '2023-06-08 00:00:00', 'level': 10.0}
+    assert list(storage.read_future(NOW)) == doses[1:]
+
+    due = run(storage, NOW + 900)
+    assert list(due) == doses[1:2]
+    storage = JournalStorage(None, journal)
+    assert storage.read_state()['level'] == 30.0
+    assert list(storage.read_future(NOW + 900)) == doses[2:]
+
+
+def test_journal_appends_only_changes(journal):
+    pending = [Dose(NOW + 60 * i, NOW, 1.0) for i in range(1, 101)]
+    run(JournalStorage(None, journal), NOW, pending)
+    size = len(journal.getvalue())
+
+    run(JournalStorage(None, journal), NOW)  # nothing due, nothing added
+    assert len(journal.getvalue()) - size == 2 * RECORD_SIZE  # DRAIN + STATE
+    size = len(journal.getvalue())
+
+    run(JournalStorage(None, journal), NOW, [Dose(NOW + 30, NOW, 5.0)])
+    assert len(journal.getvalue()) - size == 3 * RECORD_SIZE  # DRAIN + PENDING + STATE
+
+
+def test_journal_skips_zero_doses(journal):
+    run(JournalStorage(None, journal), NOW, [Dose(NOW + 60, NOW, 0.0)])
+    assert len(JournalStorage(None, journal).read_future(NOW)) == 0
+
+
+def test_journal_duplicate_doses(journal):
+    dose = Dose(NOW + 60, NOW, 1.0)
+    run(JournalStorage(None, journal), NOW, [dose, dose])
+    run(JournalStorage(None, journal), NOW, [dose])
+    assert list(JournalStorage(None, journal).read_future(NOW)) == [dose] * 3
+
+
+def test_journal_compaction(journal, mocker):
+    mocker.patch.object(JournalStorage, 'COMPACT_MIN_RECORDS', 10)
+    pending = Dose(NOW + 3600, NOW, 2.0)
+    run(JournalStorage(None, journal), NOW, [pending])
+    for minute in range(1, 8):
+        run(JournalStorage(None, journal), NOW + 60 * minute, level_added=1.0)
+
+    assert len(journal.getvalue()) < 10 * RECORD_SIZE
+    storage = JournalStorage(None, journal)
+    assert storage.read_state()['level'] == 7.0
+    assert list(storage.read_future(NOW)) == [pending]
+
+
+def test_journal_drops_partial_record(journal):
+    run(JournalStorage(None, journal), NOW, [Dose(NOW + 60, NOW, 1.0)])
+    size = len(journal.getvalue())
+    journal.seek(0, io.SEEK_END)
+    journal.write(b'\x01\x02\x03')
+
+    storage = JournalStorage(None, journal)
+    assert list(storage.read_future(NOW)) == [Dose(NOW + 60, NOW, 1.0)]
+    assert len(journal.getvalue()) == size
+
+
+def test_json_storage_round_trip():
+    iofile, iofile_future = io.StringIO('{}'), io.StringIO('[]')
+    doses = [Dose(NOW - 60, NOW - 60, 10.0), Dose(NOW + 900, NOW - 60, 20.0)]
+    run(JsonStorage(None, iofile, iofile_future), NOW, doses)
+
+    iofile.seek(0)
+    storage = JsonStorage(None, iofile, iofile_future)
+    assert storage.read_state() == {'time': '2023-06-08 00:00:00', 'level': 10.0}
+    queue = storage.read_future(NOW)
+    storage.load_pending(queue)
+    assert list(queue) == doses[1:]
+
+
+def test_journal_on_disk(tmp_path):
+    """A real file goes through the mmap read path"""
+    path = tmp_path / 'caff.journal'
+    path.write_bytes(b'')
+    doses = [Dose(NOW + 900, NOW, 20.0), Dose(NOW + 1800, NOW, 30.0)]
+    with open(path, 'r+b') as journal:
+        run(JournalStorage(None, journal), NOW, doses)
+    with open(path, 'ab') as journal:
+        journal.write(b'\x00' * (RECORD_SIZE - 1))
+    with open(path, 'r+b') as journal:
+        storage = JournalStorage(None, journal)
+        assert list(storage.read_future(NOW)) == doses
+        assert storage.read_state()['level'] == 0.0
+    assert path.stat().st_size % RECORD_SIZE == 0
+
+
+def test_json_storage_on_disk(tmp_path):
+    """A real future file goes through the mmap read path"""
+    (tmp_path / 'caff.json').write_text('{}')
+    (tmp_path / 'caff_future.json').write_text('[]')
+    doses = [Dose(NOW + 60 * i, NOW, float(i)) for i in range(1, 11)]
+    for now, added in [(NOW, doses), (NOW + 300, []), (NOW + 420, [Dose(NOW + 450, NOW, 0.5)])]:
+        with open(tmp_path / 'caff.json', 'r+') as iofile, open(tmp_path / 'caff_future.json', 'r+') as iofile_future:
+            run(JsonStorage(None, iofile, iofile_future), now, added)
+
+    entries = json.loads((tmp_path / 'caff_future.json').read_text())
+    assert [entry['level'] for entry in entries] == [10.0, 9.0, 8.0, 0.5]
+    assert json.loads((tmp_path / 'caff.json').read_text())['level'] == sum(range(1, 8))
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(':memory:')
+    yield connection
+    connection.close()
+
+
+def test_sqlite_round_trip(connection):
+    doses = [Dose(NOW - 60, NOW - 60, 10.0), Dose(NOW + 900, NOW - 60, 20.0), Dose(NOW + 1800, NOW - 60, 30.0)]
+    assert SqliteStorage(connection).read_state() == {}
+    assert list(run(SqliteStorage(connection), NOW, doses)) == doses[:1]
+
+    storage = SqliteStorage(connection)
+    assert storage.read_state() == {'time': '2023-06-08 00:00:00', 'level': 10.0}
+    queue = storage.read_future(NOW)
+    assert len(queue) == 0
+    storage.load_pending(queue)
+    assert list(queue) == doses[1:]
+
+    assert list(run(SqliteStorage(connection), NOW + 900)) == doses[1:2]
+    assert list(run(SqliteStorage(connection), NOW + 900, [doses[0]])) == doses[:1]
+    queue = SqliteStorage(connection).read_future(NOW + 3600)
+    assert list(queue) == doses[2:]
+
+
+def test_sqlite_profiles_are_separate(connection):
+    run(SqliteStorage(connection, 'alice'), NOW, [Dose(NOW, NOW, 10.0), Dose(NOW + 60, NOW, 1.0)])
+    run(SqliteStorage(connection, 'bob'), NOW, [Dose(NOW, NOW, 20.0)])
+    assert SqliteStorage(connection, 'alice').read_state()['level'] == 10.0
+    assert SqliteStorage(connection, 'bob').read_state()['level'] == 20.0
+    assert len(SqliteStorage(connection, 'bob').read_future(NOW + 60)) == 0
+    assert len(SqliteStorage(connection, 'alice').read_future(NOW + 60)) == 1
+
+
+def test_sqlite_due_query_uses_index(connection):
+    SqliteStorage(connection)
+    plan = connection.execute(
+        'EXPLAIN QUERY PLAN SELECT * FROM pending WHERE profile = ? AND when_to_process <= ?',
+        ('default', NOW)).fetchall()
+    assert 'pending_due' in str(plan)
+
+
+def test_sqlite_commits_once_per_run(tmp_path):
+    path = tmp_path / 'caff.db'
+    with closing(sqlite3.connect(path)) as connection:
+        storage = SqliteStorage(connection)
+        storage.read_state()
+        queue = storage.read_future(NOW)
+        queue.push(Dose(NOW + 60, NOW, 1.0))
+        storage.write_future(queue)
+        with closing(sqlite3.connect(path)) as other:
+            assert other.execute('SELECT COUNT(*) FROM pending').fetchone() == (0,)
+        storage.write_state({'time': '2023-06-08 12:00:00', 'level': 1.0})
+        with closing(sqlite3.connect(path)) as other:
+            assert other.execute('SELECT COUNT(*) FROM pending').fetchone() == (1,)
+
+
+def test_sqlite_log(connection):
+    storage = SqliteStorage(connection, 'alice')
+    assert storage.read_log() == ('', '', 0)
+    logger = logging.getLogger('test_sqlite_log')
+    logger.setLevel(logging.INFO)
+    logger.addHandler(storage.log_handler())
+    logger.info('first')
+    assert storage.read_log() == ('INFO: first', '', 1)
+    logger.info('second')
+    logger.info('third')
+    assert storage.read_log() == ('INFO: first', 'INFO: third', 3)
+    assert SqliteStorage(connection, 'bob').read_log() == ('', '', 0)
+
+
+@pytest.fixture
+def json_files(tmp_path):
+    state, future = tmp_path / 'caff.json', tmp_path / 'caff_future.json'
+    state.write_text('{}')
+    future.write_text('[]')
+    return state, future
+
+
+def atomic_run(json_files, now, doses=()):
+    state, future = json_files
+    AtomicJsonStorage.recover(str(state), str(future))
+    with open(state, 'r+') as iofile, open(future, 'r+') as iofile_future:
+        storage = AtomicJsonStorage(None, iofile, iofile_future)
+        run(storage, now, doses)
+        storage.iofile.close()
+        storage.iofile_future.close()
+
+
+def test_atomic_json_storage(json_files):
+    state, future = json_files
+    doses = [Dose(NOW + 60 * i, NOW, float(i)) for i in range(1, 11)]
+    for now, added in [(NOW, doses), (NOW + 300, []), (NOW + 420, [Dose(NOW + 450, NOW, 0.5)])]:
+        atomic_run(json_files, now, added)
+
+    assert [entry['level'] for entry in json.loads(future.read_text())] == [10.0, 9.0, 8.0, 0.5]
+    assert json.loads(state.read_text())['level'] == sum(range(1, 8))
+    assert sorted(path.name for path in state.parent.iterdir()) == ['caff.json', 'caff_future.json']
+
+
+@pytest.mark.parametrize("storage_class", [JsonStorage, AtomicJsonStorage])
+def test_json_storage_next_due(json_files, storage_class):
+    """The .json file holds when the earliest pending dose falls due, and read_state() hides it"""
+    state, future = json_files
+    doses = [Dose(NOW + 600, NOW, 1.0), Dose(NOW + 1200, NOW, 2.0)]
+    for now, added, expected in [(NOW, doses, '2023-06-08 12:10:00'),
+                                 (NOW + 60, [], '2023-06-08 12:10:00'),  # on disk, undecoded
+                                 (NOW + 60, [Dose(NOW + 300, NOW, 0.5)], '2023-06-08 12:05:00'),
+                                 (NOW + 700, [], '2023-06-08 12:20:00'),
+                                 (NOW + 1200, [], None)]:
+        with open(state, 'r+') as iofile, open(future, 'r+') as iofile_future:
+            storage = storage_class(None, iofile, iofile_future)
+            run(storage, now, added)
+            storage.iofile.close()
+            storage.iofile_future.close()
+        assert json.loads(state.read_text())['next_due'] == expected
+        with open(state) as iofile:
+            assert 'next_due' not in JsonStorage(None, iofile, None).read_state()
+
+
+@pytest.mark.parametrize("storage_class", [JsonStorage, AtomicJsonStorage])
+def test_json_storage_compact(json_files, storage_class):
+    """The compact future file holds the same entries, and is read back the same way"""
+    state, future = json_files
+    doses = [Dose(NOW + 60 * i, NOW, float(i)) for i in range(1, 6)]
+    for now, added in [(NOW, doses), (NOW + 120, [])]:
+        with open(state, 'r+') as iofile, open(future, 'r+') as iofile_future:
+            storage = storage_class(None, iofile, iofile_future, compact=True)
+            due = run(storage, now, added)
+            storage.iofile.close()
+            storage.iofile_future.close()
+    assert list(due.level) == [1.0, 2.0]
+    assert '    ' not in future.read_text() and '", "' not in future.read_text()
+    assert [entry['level'] for entry in json.loads(future.read_text())] == [5.0, 4.0, 3.0]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("name", available())
+def test_json_storage_codec(json_files, name, compact):
+    """Every codec reads back what it wrote, whether it decodes through the mmap or the stream"""
+    state, future = json_files
+    doses = [Dose(NOW + 60 * i, NOW, float(i)) for i in range(1, 11)]
+    for now, added in [(NOW, doses), (NOW + 180, []), (NOW + 300, [Dose(NOW + 900, NOW, 0.5)])]:
+        with open(state, 'r+') as iofile, open(future, 'r+') as iofile_future:
+            storage = AtomicJsonStorage(None, iofile, iofile_future, compact, get_codec(name))
+            run(storage, now, added)
+            storage.iofile.close()
+            storage.iofile_future.close()
+    assert [entry['level'] for entry in json.loads(future.read_text())] == [0.5, 10.0, 9.0, 8.0, 7.0, 6.0]
+    assert json.loads(state.read_text()) == {'time': '2023-06-08 00:00:00', 'level': 15.0,
+                                             'next_due': '2023-06-08 12:06:00'}
+    storage = JsonStorage(None, None, io.StringIO(future.read_text()), codec=get_codec(name))
+    assert sorted(storage.read_future(NOW + 600).doses.level) == [6.0, 7.0, 8.0, 9.0, 10.0]
+
+
+@pytest.mark.parametrize("name", available())
+@pytest.mark.parametrize("state, doses", [
+    ({'level': float('nan')}, []),
+    ({'level': 1.0, 'absorbing': {'20.0': float('inf')}}, []),
+    ({'level': 1.0}, [Dose(NOW + 60, NOW, float('nan'))]),
+])
+def test_json_storage_refuses_non_finite(json_files, name, state, doses):
+    """Neither file is changed, where a codec would have written null"""
+    state_file, future = json_files
+    atomic_run(json_files, NOW, [Dose(NOW + 600, NOW, 1.0)])
+    before = state_file.read_text(), future.read_text()
+    with open(state_file, 'r+') as iofile, open(future, 'r+') as iofile_future:
+        storage = AtomicJsonStorage(None, iofile, iofile_future, codec=get_codec(name))
+        storage.read_state()
+        queue = storage.read_future(NOW)
+        for dose in doses:
+            queue.push(dose)
+        with pytest.raises(ValueError):
+            storage.write_future(queue)
+            storage.write_state(dict(state, time='2023-06-08 12:00:00'))
+    AtomicJsonStorage.recover(str(state_file), str(future))
+    assert (state_file.read_text(), future.read_text()) == before
+
+
+@pytest.mark.parametrize("name", available())
+@pytest.mark.parametrize("storage_class", [JsonStorage, AtomicJsonStorage])
+@pytest.mark.parametrize("minutes", [[45], [30, 15, 5], [40, 30, 12], [200, 5], [1, 20]])
+def test_json_storage_splices_added_doses(json_files, storage_class, name, minutes):
+    """Entries left on disk are copied undecoded; only the text from the first new dose on is rewritten"""
+    state, future = json_files
+    pending = [Dose(NOW + 600 * i, NOW, float(i)) for i in range(1, 6)]
+    atomic_run(json_files, NOW, pending)
+    before = future.read_text()
+    added = [Dose(NOW + 60 * m, NOW + 60, 0.5) for m in minutes]
+
+    with open(state, 'r+') as iofile, open(future, 'r+') as iofile_future:
+        storage = storage_class(None, iofile, iofile_future, codec=get_codec(name))
+        storage.load_pending = None  # the pending entries must not be decoded
+        run(storage, NOW + 60, added)
+        storage.iofile.close()
+        storage.iofile_future.close()
+
+    after = future.read_text()
+    expected = FutureQueue(DoseBatch.from_doses(pending))
+    expected.merge(DoseBatch.from_doses(added))
+    expected.pop_due(NOW + 60)
+    assert [(parse_epoch(entry['when_to_process']), entry['level']) for entry in json.loads(after)] == \
+        [(dose.when, dose.level) for dose in reversed(expected)]
+    later = [dose.when for dose in pending if dose.when > max(dose.when for dose in added)]
+    kept = before.index('}', before.index(format_epoch(min(later)))) + 1 if later else 1
+    assert after.startswith(before[:kept])
+    assert json.loads(state.read_text())['next_due'] == format_epoch(next(iter(expected)).when)
+
+
+def test_json_storage_keeps_next_due(json_files):
+    """write_state() alone, with the future file unchanged, keeps the stored next_due"""
+    state, future = json_files
+    with open(state, 'r+') as iofile, open(future, 'r+') as iofile_future:
+        run(JsonStorage(None, iofile, iofile_future), NOW, [Dose(NOW + 600, NOW, 1.0)])
+    with open(state, 'r+') as iofile:
+        storage = JsonStorage(None, iofile, None)
+        data_dict = storage.read_state()
+        data_dict['level'] += 5.0
+        storage.write_state(data_dict)
+    assert json.loads(state.read_text())['next_due'] == '2023-06-08 12:10:00'
+
+
+def test_atomic_json_storage_replaces_files(json_files):
+    state, future = json_files
+    inodes = state.stat().st_ino, future.stat().st_ino
+    atomic_run(json_files, NOW, [Dose(NOW + 60, NOW, 1.0)])
+    assert state.stat().st_ino != inodes[0] and future.stat().st_ino != inodes[1]
+
+
+@pytest.mark.parametrize("staged, expected_level", [
+    ({}, 0.0),  # nothing was staged
+    ({'future': '[{"partial'}, 0.0),  # crashed while staging the future file
+    ({'future': '[]', 'state': '{"time": "2023-06-08 12:00:00", "le'}, 0.0),  # while staging the state file
+    ({'future': '[]', 'state': '{"time": "2023-06-08 12:00:00", "level": 5.0}'}, 0.0),  # before the renames
+    ({'state': '{"time": "2023-06-08 12:00:00", "level": 5.0}'}, 5.0),  # between the renames
+    ({'state': '{"time": "2023-06-08 12:00:00", "le'}, 0.0),  # torn with the future file unchanged
+])
+def test_atomic_json_storage_recover(json_files, staged, expected_level):
+    state, future = json_files
+    state.write_text('{"time": "2023-06-08 11:00:00", "level": 0.0}')
+    for which, text in staged.items():
+        path = state if which == 'state' else future
+        (path.parent / (path.name + '.tmp')).write_text(text)
+
+    AtomicJsonStorage.recover(str(state), str(future))
+    assert json.loads(state.read_text())['level'] == expected_level
+    assert json.loads(future.read_text()) == []
+    assert sorted(path.name for path in state.parent.iterdir()) == ['caff.json', 'caff_future.json']
+
+
+def test_journal_drops_uncommitted_records(journal):
+    dose = Dose(NOW + 60, NOW, 1.0)
+    run(JournalStorage(None, journal), NOW, [dose])
+    size = len(journal.getvalue())
+    journal.seek(0, io.SEEK_END)
+    journal.write(JournalStorage.RECORD.pack(JournalStorage.DRAIN, NOW + 120, 0, 0.0))  # a run cut short
+
+    storage = JournalStorage(None, journal)
+    assert list(storage.read_future(NOW)) == [dose]
+    assert len(journal.getvalue()) == size
+
+
+def test_journal_write_future_only_stages(journal):
+    storage = JournalStorage(None, journal)
+    queue = storage.read_future(NOW)
+    queue.push(Dose(NOW + 60, NOW, 1.0))
+    storage.write_future(queue)
+    assert journal.getvalue() == b''
+    storage.write_state({'time': '2023-06-08 12:00:00', 'level': 0.0})
+    assert len(journal.getvalue()) == 3 * RECORD_SIZE
+
+
+def test_journal_compaction_on_disk(tmp_path, mocker):
+    mocker.patch.object(JournalStorage, 'COMPACT_MIN_RECORDS', 10)
+    path = tmp_path / 'caff.journal'
+    path.write_bytes(b'')
+    pending = Dose(NOW + 3600, NOW, 2.0)
+    with open(path, 'r+b') as journal:
+        run(JournalStorage(None, journal), NOW, [pending])
+    for minute in range(1, 8):
+        with open(path, 'r+b') as journal:
+            storage = JournalStorage(None, journal)
+            run(storage, NOW + 60 * minute, level_added=1.0)
+            storage.journal.close()
+
+    assert path.stat().st_size < 10 * RECORD_SIZE
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['caff.journal']
+    with open(path, 'r+b') as journal:
+        storage = JournalStorage(None, journal)
+        assert storage.read_state()['level'] == 7.0
+        assert list(storage.read_future(NOW)) == [pending]
+
+
+GUT_STATE = {'time': '2023-06-08 12:00:00', 'level': 12.5, 'absorbing': {'1200': 40.0, '2700': 7.5}}
+
+
+def test_journal_gut_amounts(journal, mocker):
+    storage = JournalStorage(None, journal)
+    storage.read_future(NOW)
+    storage.write_future(storage.pending)
+    storage.write_state(GUT_STATE)
+    assert JournalStorage(None, journal).read_state() == GUT_STATE
+
+    storage.write_state({'time': '2023-06-08 12:10:00', 'level': 20.0})  # absorbed
+    assert JournalStorage(None, journal).read_state() == {'time': '2023-06-08 12:10:00', 'level': 20.0}
+
+    mocker.patch.object(JournalStorage, 'COMPACT_MIN_RECORDS', 2)
+    storage.write_state(GUT_STATE)
+    assert len(journal.getvalue()) == 3 * RECORD_SIZE  # compacted
+    assert JournalStorage(None, journal).read_state() == GUT_STATE
+
+
+def test_sqlite_gut_amounts(connection):
+    storage = SqliteStorage(connection, 'alice')
+    storage.read_future(NOW)
+    storage.write_state(GUT_STATE)
+    assert SqliteStorage(connection, 'alice').read_state() == GUT_STATE
+    assert SqliteStorage(connection, 'bob').read_state() == {}
+    storage.write_state({'time': '2023-06-08 12:10:00', 'level': 20.0})
+    assert SqliteStorage(connection, 'alice').read_state() == {'time': '2023-06-08 12:10:00', 'level': 20.0}
+
+
+def test_journal_replay_applies_drains_in_order(journal):
+    storage = JournalStorage(None, journal)
+    storage.append([(JournalStorage.PENDING, NOW + 60, NOW, 1.0),
+                    (JournalStorage.PENDING, NOW + 60, NOW + 1, 2.0),
+                    (JournalStorage.PENDING, NOW + 120, NOW, 3.0),
+                    (JournalStorage.DRAIN, NOW + 90, 0, 0.0),
+                    (JournalStorage.PENDING, NOW + 30, NOW + 20, 4.0),  # written after the drain
+                    (JournalStorage.PENDING, NOW + 120, NOW + 20, 5.0),
+                    (JournalStorage.STATE, NOW, 0, 0.0)])
+
+    storage = JournalStorage(None, journal)
+    queue = storage.read_future(NOW)
+    assert list(queue.pop_due(NOW + 120)) == [Dose(NOW + 30, NOW + 20, 4.0), Dose(NOW + 120, NOW, 3.0),
+                                              Dose(NOW + 120, NOW + 20, 5.0)]
+
+
+def test_journal_replay_large(journal, mocker):
+    n = 200_000
+    storage = JournalStorage(None, journal)
+    storage.append([(JournalStorage.PENDING, NOW + i, NOW, 1.0) for i in range(n)]
+                   + [(JournalStorage.DRAIN, NOW + n // 2 - 1, 0, 0.0), (JournalStorage.STATE, NOW, 0, 0.0)])
+    insert = mocker.spy(DoseBatch, 'insert')
+
+    storage = JournalStorage(None, journal)
+    queue = storage.read_future(NOW)
+    assert len(queue) == n // 2
+    assert list(reversed(queue))[-1] == Dose(NOW + n // 2, NOW, 1.0)
+    assert insert.call_count == 0  # one pass; no dose is inserted into the queue
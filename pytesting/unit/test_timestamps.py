@@ -0,0 +1,81 @@
+# file: pytesting/unit/test_timestamps.py
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.timestamps import (TIME_FORMAT, to_epoch, from_epoch, days_from_civil, civil_from_days,
+                            parse_epoch, format_epoch, parse_datetime, format_datetime, clear_caches)
+
+
+@pytest.mark.parametrize("text", [
+    '1970-01-01 00:00:00',
+    '1969-12-31 23:59:59',
+    '2000-02-29 12:00:00',
+    '2020-04-01 12:51:00',
+    '2023-06-08 09:00:00',
+    '2100-03-01 00:00:01',
+    '1000-01-01 00:00:00',
+    '9999-12-31 23:59:59',
+])
+def test_parse_and_format_match_strptime(text):
+    dt = datetime.strptime(text, TIME_FORMAT)
+    assert parse_epoch(text) == to_epoch(dt)
+    assert format_epoch(parse_epoch(text)) == text
+    assert parse_datetime(text) == dt
+    assert format_datetime(dt) == dt.strftime(TIME_FORMAT)
+
+
+def test_days_round_trip():
+    start = datetime(1899, 12, 25)
+    for i in range(0, 400 * 366, 7):
+        day = start + timedelta(days=i)
+        days = days_from_civil(day.year, day.month, day.day)
+        assert days == (day - datetime(1970, 1, 1)).days
+        assert civil_from_days(days) == (day.year, day.month, day.day)
+
+
+def test_format_pads_years():
+    assert format_epoch(parse_epoch('0001-01-01 00:00:00')) == '0001-01-01 00:00:00'
+    assert format_datetime(datetime(1, 1, 1)) == '0001-01-01 00:00:00'
+
+
+def test_epoch_round_trip():
+    dt = datetime(2023, 6, 8, 9, 30, 15, 999999)
+    assert to_epoch(dt) == to_epoch(dt.replace(microsecond=0))
+    assert from_epoch(to_epoch(dt)) == dt.replace(microsecond=0)
+
+
+@pytest.mark.parametrize("text", [
+    '2023-06-08T09:00:00',
+    '2023-06-08 09:00',
+    '2023/06/08 09:00:00',
+    '2023-06-08_09:00:00',
+    '2023-13-08 09:00:00',
+    '2023-02-30 09:00:00',
+    '2023-06-08 24:00:00',
+    '2023-06-08 09:60:00',
+    '2023-06-08 09:00:0x',
+    '2023-06-08 09:00:+1',
+    '2023-06-08 09:00:00 ',
+    '2023-06-08 09:0\u0660:00',
+    '\uff12023-06-08 09:00:00',
+    '',
+])
+def test_parse_epoch_rejects_bad_input(text):
+    clear_caches()
+    with pytest.raises(ValueError):
+        parse_epoch(text)
+    parse_epoch('2023-06-08 12:00:00')  # with the date cached, the time is still checked
+    with pytest.raises(ValueError):
+        parse_epoch(text)
+
+
+def test_every_second_of_a_day_matches_strptime():
+    clear_caches()
+    start = datetime(2024, 2, 29)
+    for i in range(0, 86400, 7):
+        dt = start + timedelta(seconds=i)
+        text = dt.strftime(TIME_FORMAT)
+        assert parse_epoch(text) == to_epoch(dt)
+        assert format_epoch(to_epoch(dt)) == text
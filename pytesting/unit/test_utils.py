@@ -1,6 +1,7 @@
 # file: pytesting/test_utils.py
 
 from argparse import Namespace
+import configparser
 from datetime import datetime
 import src.utils
 import sys
@@ -10,10 +11,11 @@ import pytest
 from pytest_mock import mocker
 from freezegun import freeze_time
 
-from src.utils import (check_which_environment, parse_clas,
+from src.utils import (beverage_names, check_which_environment, parse_clas,
                        read_config_file, check_cla_match_env, init_storage,
                        delete_old_logfile, create_files, init_future, init_logfile,
-                       convert_walltime_to_mins, set_up)
+                       convert_walltime_to_mins, profile_filename, profile_name, read_half_life, set_up)
+from src.config import load_config
 import subprocess
 from src.caffeine_monitor import CaffeineMonitor
 import builtins
@@ -161,6 +163,14 @@ def test_bad_caff_env_value_exits(mocker):
         (["100", "-60"], {"mg": 100, "mins": -60}),  # Negative value for mins
         (["100", "20", "--bev", "whiskey"], ValueError),  # Invalid beverage type
         (["100", "-b"], ValueError),  # Missing beverage type after -b
+        (["100"], {"profile": "default"}),
+        (["100", "-p", "alice"], {"mg": 100, "profile": "alice"}),
+        (["--profile", "bob", "50", "10"], {"mg": 50, "mins": 10, "profile": "bob"}),
+        (["100", "-p", "Alice"], {"profile": "alice"}),  # one profile, whatever the case
+        (["import", "doses.csv", "-p", "alice"], {"mg": 0, "import_file": "doses.csv", "profile": "alice"}),
+        (["--import", "doses.jsonl"], {"import_file": "doses.jsonl"}),
+        (["100"], {"import_file": None}),
+        (["import", "doses.csv", "--daemon"], ValueError),
     ],
 )
 def test_parse_clas(args, expected):
@@ -324,6 +334,22 @@ def test_init_storage_stores_good_json_file(mocker):
     assert json.loads(''.join(mock_file_data)) == expected_data
 
 
+@pytest.mark.parametrize("fname, profile, expected", [
+    ('devel/caff_devel.json', 'default', 'devel/caff_devel.json'),
+    ('devel/caff_devel.json', 'alice', 'devel/caff_devel_alice.json'),
+    ('devel/caff_devel_future.json', 'bob-2', 'devel/caff_devel_future_bob-2.json'),
+    ('devel/caff_devel.log', 'x_y', 'devel/caff_devel_x_y.log'),
+])
+def test_profile_filename(fname, profile, expected):
+    assert profile_filename(fname, profile) == expected
+
+
+@pytest.mark.parametrize("profile", ['', '../etc', 'a b', 'a/b'])
+def test_profile_filename_invalid(profile):
+    with pytest.raises(ValueError, match="Invalid profile name"):
+        profile_filename('devel/caff_devel.json', profile)
+
+
 def test_delete_old_logfile_success(mocker):
     # Arrange
     filename = 'bogus.log'
@@ -427,3 +453,47 @@ def test_init_logfile(mocker):
     # Assert
     mock_open.assert_called_once_with(log_filename, 'a+')
     mock_print.assert_called_once_with("Start of log file", file=mock_open.return_value)
+
+
+def test_beverage_names():
+    config = configparser.ConfigParser()
+    config.read_string('[beverages]\nsoda = 0:1\ntea = 0:0.5, 30:0.5\n')
+    assert beverage_names(config) == ['coffee', 'soda', 'chocolate', 'tea']
+    assert beverage_names(configparser.ConfigParser()) == ['coffee', 'soda', 'chocolate']
+
+
+@pytest.mark.parametrize("text, profile, expected", [
+    ('', 'alice', 360.0),
+    ('[half_lives]\ndefault = 300\n', 'alice', 300.0),
+    ('[half_lives]\ndefault = 300\nalice = 480\n', 'alice', 480.0),
+    ('[half_lives]\nalice = 480\n', 'default', 360.0),
+])
+def test_read_half_life(text, profile, expected):
+    config = configparser.ConfigParser()
+    config.read_string(text)
+    assert read_half_life(config, profile) == expected
+
+
+@pytest.mark.parametrize("value", ['0', '-60', 'long'])
+def test_read_half_life_invalid(value):
+    config = configparser.ConfigParser()
+    config.read_string(f'[half_lives]\nalice = {value}\n')
+    with pytest.raises(ValueError):
+        read_half_life(config, 'alice')
+
+
+@pytest.mark.parametrize("profile", ['alice', 'Alice', 'ALICE'])
+def test_half_life_of_profile_name(profile, tmp_path):
+    """Names are lowercased where they are parsed, and configparser lowercases option names"""
+    ini_file = tmp_path / 'caffeine.ini'
+    ini_file.write_text('[half_lives]\ndefault = 300\nAlice = 480\n')
+    parser = configparser.ConfigParser()
+    parser.read(str(ini_file))
+    assert read_half_life(parser, profile_name(profile)) == 480.0
+    assert read_half_life(load_config(str(ini_file)), profile_name(profile)) == 480.0
+
+
+@pytest.mark.parametrize("profile", ['', '../etc', 'a b'])
+def test_profile_name_invalid(profile):
+    with pytest.raises(ValueError, match="Invalid profile name"):
+        profile_name(profile)
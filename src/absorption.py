@@ -0,0 +1,150 @@
+# file: src/absorption.py
+# created: 2026-10-16
+"""
+Absorption profiles: how a drink's caffeine reaches the bloodstream.
+
+A profile is a list of steps, each the minutes after drinking at which
+a fraction of the dose is absorbed. It is compiled once into parallel
+offset and fraction arrays, so that scheduling a drink is a single
+expansion over them, however many steps there are.
+
+A BatemanProfile instead absorbs the drink continuously, at a rate
+set by an absorption half-life, with no pending doses at all (see
+kinetics.py).
+
+Profiles are read from the [beverages] section of caffeine.ini, one
+line per beverage, as `minutes:fraction` steps, or as `bateman:` and
+an absorption half-life in minutes:
+    coffee = 0:0.25, 15:0.25, 30:0.25, 45:0.25
+    tea = bateman:20
+Beverages missing from the section keep their DEFAULT_PROFILES entry.
+"""
+from array import array
+import math
+
+from src import kinetics
+from src.doses import DoseBatch
+
+SECTION = 'beverages'
+DEFAULT_PROFILES = {
+    'coffee': '0:0.25, 15:0.25, 30:0.25, 45:0.25',
+    'soda': '0:0.65, 20:0.25, 40:0.1',
+    'chocolate': '0:0.25, 30:0.25, 60:0.25, 90:0.25',
+}
+
+
+class AbsorptionProfile:
+    """A beverage's steps, as offsets in seconds and fractions of the dose, latest first"""
+    __slots__ = ('offsets', 'fractions')
+    continuous = False
+
+    def __init__(self, steps):
+        """
+        :param steps: (minutes after drinking, fraction of the dose)
+                      pairs, in any order; the fractions sum to 1
+        :raises ValueError: if a step or the fractions' sum is invalid
+        """
+        steps = sorted(steps, reverse=True)
+        if not steps:
+            raise ValueError('An absorption profile needs at least one step')
+        if any(minutes < 0 or fraction <= 0 for minutes, fraction in steps):
+            raise ValueError('Absorption steps need minutes >= 0 and a fraction > 0')
+        total = math.fsum(fraction for __, fraction in steps)
+        if not math.isclose(total, 1.0):
+            raise ValueError(f'Absorption fractions sum to {total}, not 1')
+        self.offsets = array('q', [minutes * 60 for minutes, __ in steps])
+        self.fractions = array('d', [fraction for __, fraction in steps])
+
+    @classmethod
+    def parse(cls, text):
+        """
+        :param text: comma-separated `minutes:fraction` steps
+        :raises ValueError: if text is not in that format
+        """
+        steps = []
+        for step in text.split(','):
+            minutes, sep, fraction = step.partition(':')
+            if not sep:
+                raise ValueError(f'Invalid absorption step: {step.strip()!r}')
+            steps.append((int(minutes), float(fraction)))
+        return cls(steps)
+
+    def expand(self, mg, time_entered):
+        """
+        :param mg: the amount drunk
+        :param time_entered: epoch seconds at which it was drunk
+        :return: a DoseBatch of the drink's doses, latest first
+        """
+        return DoseBatch(array('q', map(time_entered.__add__, self.offsets)),
+                         array('q', [time_entered]) * len(self.offsets),
+                         array('d', map(float(mg).__mul__, self.fractions)))
+
+    def expand_many(self, mgs, times_entered):
+        """
+        As expand(), for many drinks at once: one pass per step rather
+        than one batch per drink
+        :param mgs: array('d') of the amounts drunk
+        :param times_entered: array('q') of the epoch seconds at which
+                              each was drunk
+        :return: a DoseBatch of every drink's doses, in no particular order
+        """
+        batch = DoseBatch()
+        for offset, fraction in zip(self.offsets, self.fractions):
+            batch.when.extend(map(offset.__add__, times_entered))
+            batch.entered.extend(times_entered)
+            batch.level.extend(map(fraction.__mul__, mgs))
+        return batch
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+class BatemanProfile:
+    """Continuous absorption, at the rate set by an absorption half-life"""
+    __slots__ = ('absorption_half_life',)
+    continuous = True
+    PREFIX = 'bateman:'
+
+    def __init__(self, absorption_half_life):
+        """
+        :param absorption_half_life: minutes for half the drink to leave the gut
+        :raises ValueError: if it is not positive
+        """
+        if not absorption_half_life > 0:
+            raise ValueError('An absorption half-life must be positive')
+        self.absorption_half_life = absorption_half_life
+
+    @classmethod
+    def parse(cls, text):
+        """:param text: 'bateman:' and the absorption half-life in minutes"""
+        return cls(float(text.strip()[len(cls.PREFIX):]))
+
+    def add(self, state, mg, minutes_ago, half_life):
+        """
+        Add mg drunk minutes_ago to state, a level dict
+        :return: the mg already in the blood
+        :raises ValueError: if minutes_ago is negative
+        """
+        return kinetics.add_drink(state, mg, self.absorption_half_life, half_life, minutes_ago)
+
+
+def load_profiles(config=None):
+    """
+    :param config: a configparser.ConfigParser, or None for the defaults only
+    :return: {beverage: AbsorptionProfile or BatemanProfile}
+    :raises ValueError: if a profile in config is invalid
+    Called by: utils.set_up(), CaffeineMonitor
+    """
+    texts = dict(DEFAULT_PROFILES)
+    if config is not None and SECTION in config:
+        texts.update(config[SECTION])
+    profiles = {}
+    for beverage, text in texts.items():
+        try:
+            if text.strip().startswith(BatemanProfile.PREFIX):
+                profiles[beverage] = BatemanProfile.parse(text)
+            else:
+                profiles[beverage] = AbsorptionProfile.parse(text)
+        except ValueError as e:
+            raise ValueError(f'Invalid absorption profile for {beverage}: {e}') from None
+    return profiles
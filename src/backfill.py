@@ -0,0 +1,126 @@
+# file: src/backfill.py
+# created: 2026-10-16
+"""
+Bulk import of historical drinks.
+
+Rows of (timestamp, mg, beverage) are read from a CSV file, with an
+optional header line, or from a JSON Lines file of objects with those
+keys; the beverage may be left out, for coffee:
+    timestamp,mg,beverage
+    2023-06-08 09:00:00,95,coffee
+    {"timestamp": "2023-06-08 13:30:00", "mg": 40, "beverage": "soda"}
+
+The rows are grouped by beverage and each group is expanded through
+its absorption profile in one pass, into one DoseBatch. The monitor
+then decays every dose already due in a single vectorized pass, keeps
+the rest pending, and writes storage once, however many rows there are.
+"""
+from array import array
+import csv
+import json
+import math
+
+from src.doses import DoseBatch
+from src.timestamps import parse_epoch, to_epoch
+
+DEFAULT_BEVERAGE = 'coffee'
+FIELDS = ('timestamp', 'mg', 'beverage')
+JSONL_SUFFIXES = ('.jsonl', '.ndjson')
+
+
+def load_drinks(fname):
+    """
+    :param fname: a .jsonl or .ndjson file, else a CSV file
+    :return: {beverage: (times, mgs)}: array('q') of the epoch seconds
+             at which each drink was drunk, and array('d') of its mg
+    :raises ValueError: naming the line of the first invalid row
+    Called by: caffeine_monitor.py
+    """
+    with open(fname, newline='') as infile:
+        rows = jsonl_rows(infile) if fname.endswith(JSONL_SUFFIXES) else csv_rows(infile)
+        return group_rows(rows)
+
+
+def csv_rows(infile):
+    """:return: an iterator of (line number, timestamp, mg, beverage)"""
+    for line_num, row in enumerate(csv.reader(infile), 1):
+        if not row or (line_num == 1 and row[0].strip() == FIELDS[0]):
+            continue
+        if len(row) not in (2, 3):
+            raise ValueError(f'line {line_num}: expected {",".join(FIELDS)}, got {",".join(row)}')
+        yield line_num, row[0].strip(), row[1], row[2].strip() if len(row) == 3 else DEFAULT_BEVERAGE
+
+
+def jsonl_rows(infile):
+    """:return: an iterator of (line number, timestamp, mg, beverage)"""
+    for line_num, line in enumerate(infile, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            yield line_num, record['timestamp'], record['mg'], record.get('beverage', DEFAULT_BEVERAGE)
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            raise ValueError(f'line {line_num}: invalid record {line.strip()!r} ({e!r})') from None
+
+
+def group_rows(rows):
+    """
+    :param rows: an iterable of (line number, timestamp, mg, beverage)
+    :return: {beverage: (times, mgs)}, as load_drinks() returns
+    :raises ValueError: naming the line of the first invalid row,
+                        including one whose mg is NaN or infinite
+    """
+    drinks = {}
+    for line_num, timestamp, mg, beverage in rows:
+        try:
+            time, mg = parse_epoch(timestamp), float(mg)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'line {line_num}: {e}') from None
+        if not math.isfinite(mg):
+            raise ValueError(f'line {line_num}: mg is not a finite number: {mg}')
+        if beverage not in drinks:
+            drinks[beverage] = (array('q'), array('d'))
+        times, mgs = drinks[beverage]
+        times.append(time)
+        mgs.append(mg)
+    return drinks
+
+
+def backfill(monitor, drinks):
+    """
+    Bring monitor's level up to date and add every drink in drinks to
+    it, in a single run that writes storage once
+    :param monitor: a CaffeineMonitor, not yet run
+    :param drinks: {beverage: (times, mgs)}, as load_drinks() returns
+    :return: the number of drinks added
+    :raises ValueError: if a beverage has no absorption profile, or a
+                        continuously absorbed drink is in the future
+    Called by: caffeine_monitor.py
+    """
+    unknown = sorted(drinks.keys() - monitor.beverages.keys())
+    if unknown:
+        raise ValueError(f'No absorption profile for {", ".join(unknown)}')
+    monitor.read_log()
+    monitor.read_file()
+    monitor.read_future_file()
+    if not monitor.first_run:
+        monitor.decay_prev_level()
+
+    now = to_epoch(monitor.current_time)
+    doses = DoseBatch()
+    for beverage, (times, mgs) in drinks.items():
+        profile = monitor.beverages[beverage]
+        if not profile.continuous:
+            doses.extend(profile.expand_many(mgs, times))
+            continue
+        monitor.beverage = beverage
+        for time, mg in zip(times, mgs):
+            monitor.mg_to_add, monitor.mins_ago = mg, (now - time) // 60
+            monitor.add_beverage()
+    monitor.future_list.merge(doses)  # sorted once, with the doses already pending
+    monitor.process_future_list()
+
+    monitor.update_time()
+    monitor.write_future_file()
+    monitor.write_file()
+    return sum(len(times) for times, __ in drinks.values())
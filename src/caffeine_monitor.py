@@ -8,140 +8,169 @@
 Give a rough estimate of the quantity of caffeine
 in the user's body, in mg
 """
+import os
+import sys
+
+if __name__ == '__main__':
+    if not __package__:  # run as a script, e.g. through the ./caff symlink, from any directory
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    # a plain run only shows the level: answer it before the imports below
+    from src.quick_level import quick_level
+    message = quick_level(sys.argv[1:])
+    if message is not None:
+        print(message)
+        sys.exit(0)
+
+from contextlib import ExitStack, closing
 from datetime import datetime, timedelta
-import json
 import logging
+import sqlite3
 
-from src.utils import set_up
-
-
-COFFEE_MINS_DECREMENT = 15
-SODA_MINS_DECREMENT = 20
+from src import kinetics
+from src.absorption import load_profiles
+from src.decay import decayed_amounts, elapsed_minutes, level_curve, projected_level
+from src.future_queue import FutureQueue
+from src.locking import LockTimeout, exclusive_lock
+from src.quick_level import describe_level
+from src.storage import AtomicJsonStorage, JournalStorage, SqliteStorage
+from src.timestamps import format_datetime, parse_epoch, to_epoch
+from src.utils import init_files, open_file, set_up
 
 
 class CaffeineMonitor:
     half_life = 360  # in minutes
+    beverages = load_profiles()  # {beverage: absorption profile}; replaced from caffeine.ini at startup
 
-    def __init__(self, logfile, iofile, iofile_future, first_run, ags):
+    def __init__(self, storage, first_run, ags):
         """
-        # :param logfile: an opened file handle
-        # :param iofile: an opened file handle
-        # :param iofile_future: an opened file handle
+        :param storage: a storage backend, such as JsonStorage or
+                        JournalStorage (see storage.py)
         :param ags: an argparse.Namespace object with .mg as the amount
                     of caffeine consumed, .mins as how long ago the
-                    caffeine was consumed, and .bev as the beverage
+                    caffeine was consumed, and .bev as the beverage;
+                    optionally .half_life, in minutes, to override
+                    the class's
         """
-        self.logfile = logfile
-        self.iofile = iofile
-        self.iofile_future = iofile_future
+        self.storage = storage
+        self.half_life = getattr(ags, 'half_life', None) or self.half_life
         self.data_dict = {}  # data to be read from and dumped to .json file
         self.mg_to_add = int(ags.mg)
         self.mg_to_add_now = 0.0
         self.mins_ago = int(ags.mins)
-        self.time_entered = datetime.now()
+        self.current_time = datetime.today().replace(microsecond=0)
+        self.time_entered = self.current_time
         self.when_to_process = self.time_entered - timedelta(minutes=self.mins_ago)
         self.mg_net_change = 0.0
         self.beverage = ags.bev
-        self.future_list = []
-        self.new_future_list = []
+        self.future_list = FutureQueue()
         self.log_line_one = ''
         self.first_run = first_run
-        self.current_time = datetime.today()
-        self.current_item = None
         self.log_contents = ()
+        self.future_dirty = first_run  # doses were added or drained; a first run writes both files
+        self.state_dirty = False  # the level changed other than by decay, or none was stored
 
     def main(self):
         """Driver"""
+        self.run()
+        print(self)
+
+    def run(self):
+        """
+        Read, update and write back the level and pending doses
+        Called by: main(), ProfileEngine.run()
+        """
         self.read_log()
         self.read_file()  # sets self.data_dict
         self.read_future_file()  # sets self.future_list
         if not self.first_run:
             self.decay_prev_level()
 
-        if self.beverage == "coffee":
-            self.add_coffee()
-        elif self.beverage == "soda":
-            self.add_soda()
+        self.add_beverage()
 
         self.process_future_list()
 
         self.update_time()
 
-        self.write_future_file()
-        self.write_file()
-        print(self)
+        # A level that has only decayed is implied by the stored one, so a
+        # pure query writes nothing; write_file() is the commit point
+        if self.future_dirty:
+            self.write_future_file()
+        if self.future_dirty or self.state_dirty:
+            self.write_file()
 
-    def read_log(self):
-        first_line = ''
-        last_line = ''
-        num_lines = 0
-        for log_line in self.logfile:
-            num_lines += 1
-            if not first_line:
-                first_line = log_line.strip()
-            last_line = log_line.strip()
+    def level_at(self, when):
+        """
+        Compute the level at any time from the stored level onward,
+        past or future, from the stored level and pending doses.
+        Nothing is written, and the monitor's own state is unchanged.
+        :param when: a naive datetime
+        :return: the level at when, in mg
+        :raises ValueError: if when is earlier than the stored time
+        Called by: ResidentMonitor.level_at()
+        """
+        seconds = to_epoch(when)
+        level, since, doses, gut = self.read_projection(seconds)
+        return projected_level(level, since, doses, seconds, self.half_life, gut)
 
-        if 0 <= num_lines < 2:
-            last_line = ''
+    def level_curve(self, start, end, step=timedelta(minutes=1)):
+        """
+        As level_at(), sampled from start to end every step, in one
+        vectorized pass over the pending doses
+        :param start: a naive datetime, no earlier than the stored time
+        :param end: a naive datetime; sampled if it falls on a step
+        :param step: a timedelta of whole seconds
+        :return: (times, levels): the epoch seconds sampled, as a range,
+                 and the level at each, in mg (see decay.level_curve())
+        Called by: ProfileEngine.level_curves()
+        """
+        times = range(to_epoch(start), to_epoch(end) + 1, int(step.total_seconds()))
+        level, since, doses, gut = self.read_projection(to_epoch(start))
+        return times, level_curve(level, since, doses, times, self.half_life, gut)
 
-        self.log_contents = (first_line, last_line, num_lines)
+    def read_projection(self, now):
+        """
+        :param now: epoch seconds up to which doses are read as due
+        :return: (level, since, doses, gut): the stored level, the epoch
+                 seconds at which it was stored, every pending dose and
+                 the gut amounts still being absorbed
+        """
+        state = self.storage.read_state()
+        queue = self.storage.read_future(now)
+        self.storage.load_pending(queue)
+        if not state:
+            return 0.0, now, queue.doses, None
+        return state['level'], parse_epoch(state['time']), queue.doses, state.get(kinetics.ABSORBING)
+
+    def read_log(self):
+        """Read first line, last line and line count without a full scan"""
+        self.log_contents = self.storage.read_log()
 
     def read_file(self):
-        """Read initial time and caffeine level from file"""
-        self.data_dict = json.load(self.iofile)
+        """Read initial time and caffeine level from storage"""
+        self.data_dict = self.storage.read_state()
         if not self.data_dict:
-            self.data_dict = {'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'level': 0.0}
+            self.data_dict = {'time': format_datetime(datetime.now()), 'level': 0.0}
+            self.state_dirty = True
 
     def read_future_file(self):
-        """Read future changes from file"""
-        try:
-            future_data = json.load(self.iofile_future)
-            self.future_list = sorted(
-                [
-                    {
-                        'when_to_process': datetime.strptime(item['when_to_process'], '%Y-%m-%d %H:%M:%S'),
-                        'time_entered': datetime.strptime(item['time_entered'], '%Y-%m-%d %H:%M:%S'),
-                        'level': item['level']
-                    }
-                    for item in future_data
-                ],
-                key=lambda x: x['when_to_process'],
-                reverse=True
-            )
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON data in {self.iofile_future.name}: {e}")
-            self.future_list = []  # Initialize an empty list if JSON data is invalid
-        except FileNotFoundError as e:
-            print(f"File not found: {self.iofile_future.name}")
-            self.future_list = []  # Initialize an empty list if the file doesn't exist
+        """
+        Read the doses that are due from storage. The storage may leave
+        doses not yet due unread, for its write_future() to pass through
+        """
+        self.future_list = self.storage.read_future(to_epoch(self.current_time))
 
     def write_file(self):
-        self.iofile.seek(0)
-        self.iofile.truncate(0)
-        json.dump(self.data_dict, self.iofile)
+        self.storage.write_state(self.data_dict)
 
     def write_future_file(self):
-        self.iofile_future.seek(0)
-        self.iofile_future.truncate()
-        self.new_future_list.sort(key=lambda x: x['when_to_process'], reverse=True)
-
-        # Convert datetime objects to formatted strings
-        serializable_data = [
-            {
-                'when_to_process': item['when_to_process'].strftime('%Y-%m-%d %H:%M:%S'),
-                'time_entered': item['time_entered'].strftime('%Y-%m-%d %H:%M:%S'),
-                'level': item['level']
-            }
-            for item in self.new_future_list
-        ]
-
-        json.dump(serializable_data, self.iofile_future, indent=4)
-
-    def write_log(self, mg_to_add):
+        self.storage.write_future(self.future_list)
+
+    def write_log(self, mg_to_add, mins_decayed=None):
         log_mesg = (f'level is {round(self.data_dict["level"], 1)} '
                     f'at {self.data_dict["time"]}')
         if self.mg_net_change:
-            mins_decayed = (self.current_time - self.when_to_process).total_seconds() / 60
+            if mins_decayed is None:
+                mins_decayed = (self.current_time - self.when_to_process).total_seconds() / 60
 
             log_mesg = (f'{self.mg_net_change:.1f} mg added ({mg_to_add:.1f} '
                         f'mg, decayed {mins_decayed:.1f} mins): ' + log_mesg)
@@ -154,136 +183,169 @@ class CaffeineMonitor:
         Reduce stored level to account for decay since that value
         was written
         """
-        stored_time = datetime.strptime(self.data_dict['time'], '%Y-%m-%d %H:%M:%S')
-        minutes_elapsed = (self.current_time - stored_time).total_seconds() / 60
-        self.data_dict['time'] = self.current_time.strftime('%Y-%m-%d %H:%M:%S')
+        stored_time = parse_epoch(self.data_dict['time'])
+        minutes_elapsed = (to_epoch(self.current_time) - stored_time) / 60
+        self.data_dict['time'] = format_datetime(self.current_time)
         self.data_dict['level'] *= pow(0.5, (minutes_elapsed / self.half_life))
+        kinetics.advance(self.data_dict, minutes_elapsed, self.half_life)
 
-    def decay_before_add(self):
+    def add_caffeine(self, mg_to_add, mins_decayed=None):
         """
-        Decay caffeine consumed some time ago
-        before it gets added to current level.
-
-        :return: net change rounded to 1 digit past decimal point
-        Called by: process_item()
+        Called by: self.add_due_items()
         """
-        amt_to_decay_local = self.current_item['level']
-
-        # calculate the time since this consumption
-        minutes_elapsed = (self.current_time - self.current_item['when_to_process']).total_seconds() / 60
-        amount_left_after_decay = amt_to_decay_local * pow(0.5, (minutes_elapsed / self.half_life))
-        self.mg_net_change = round(amount_left_after_decay, 1)
+        if not self.mg_net_change:
+            return
+        self.data_dict['level'] += self.mg_net_change
+        self.state_dirty = True
+        self.write_log(mg_to_add, mins_decayed)
 
-    def add_caffeine(self, mg_to_add):
+    def add_beverage(self):
         """
-        Called by: self.add_coffee()
+        Schedule self.mg_to_add of self.beverage as the doses its
+        absorption profile prescribes, or, for continuous absorption,
+        add it to the level and the gut
+        :raises KeyError: if the beverage has no absorption profile
+        :raises ValueError: if a continuously absorbed drink is in the future
         """
-        if not self.mg_net_change:
+        profile = self.beverages[self.beverage]
+        if profile.continuous:
+            if self.mg_to_add:
+                absorbed = profile.add(self.data_dict, self.mg_to_add, self.mins_ago, self.half_life)
+                self.state_dirty = True
+                logging.info(f'{self.mg_to_add:.1f} mg of {self.beverage} absorbing (half-life '
+                             f'{profile.absorption_half_life:g} mins, {absorbed:.1f} mg absorbed over '
+                             f'{self.mins_ago} mins): level is {round(self.data_dict["level"], 1)} '
+                             f'at {self.data_dict["time"]}')
             return
-        self.data_dict['level'] += self.mg_net_change
-        self.write_log(mg_to_add)
-
-    def add_coffee(self):
-        mg_to_add_now = self.mg_to_add / 4
-        time_entered = self.current_time - timedelta(minutes=self.mins_ago)
-
-        for i in range(4):
-            item = {
-                'when_to_process': time_entered + timedelta(minutes=i * COFFEE_MINS_DECREMENT),
-                'time_entered': time_entered,
-                'level': mg_to_add_now
-            }
-            self.future_list.append(item)
-
-    def add_soda(self):
-        mg_to_add_now = self.mg_to_add
-        time_entered = self.current_time - timedelta(minutes=self.mins_ago)
-
-        # First part (65%)
-        item1 = {
-            'when_to_process': time_entered,
-            'time_entered': time_entered,
-            'level': mg_to_add_now * 0.65
-        }
-        self.future_list.append(item1)
-
-        # Second part (25%)
-        item2 = {
-            'when_to_process': time_entered + timedelta(minutes=SODA_MINS_DECREMENT),
-            'time_entered': time_entered,
-            'level': mg_to_add_now * 0.25
-        }
-        self.future_list.append(item2)
-
-        # Third part (10%)
-        item3 = {
-            'when_to_process': time_entered + timedelta(minutes=2 * SODA_MINS_DECREMENT),
-            'time_entered': time_entered,
-            'level': mg_to_add_now * 0.1
-        }
-        self.future_list.append(item3)
+        if not self.mg_to_add:
+            return  # its doses would all be empty
+        time_entered = to_epoch(self.current_time) - self.mins_ago * 60
+        self.future_list.merge(profile.expand(self.mg_to_add, time_entered))
+        self.future_dirty = True
 
     def process_future_list(self):
-        self.future_list.sort(key=lambda x: x['when_to_process'], reverse=True)
-        while self.future_list:
-            self.current_item = self.future_list.pop()
-            self.time_entered = self.current_item['time_entered']
-            self.when_to_process = self.current_item['when_to_process']
-            self.mg_net_change = self.current_item['level']
-            self.process_item(self.current_item['level'])
-        self.new_future_list.sort(key=lambda x: x['when_to_process'], reverse=True)
-
-    def process_item(self, mg_to_add_local):
-        if self.mg_net_change == 0:
-            return
+        """
+        Drain the doses that are due from self.future_list and add
+        their decayed amounts; doses not yet due stay where they are
+        """
+        self.add_due_items(self.future_list.pop_due(to_epoch(self.current_time)))
 
-        # if self.time_entered >= self.current_time:
-        #     raise ValueError("time_entered cannot be in the future")
+    def add_due_items(self, due):
+        """
+        Decay every due dose in a single vectorized pass, then add
+        the results to the level in order, logging each one
+        :param due: a DoseBatch, earliest first
+        Called by: process_future_list()
+        """
+        if not len(due):
+            return
+        self.future_dirty = True
+        minutes = elapsed_minutes(to_epoch(self.current_time), due.when)
+        net_changes = decayed_amounts(due.level, minutes, self.half_life)
 
-        if self.when_to_process > self.current_time:  # item is still in the future
-            new_item = {"when_to_process": self.when_to_process, "time_entered": self.time_entered,
-                        "level": self.mg_net_change}
-            self.new_future_list.append(new_item)
-        elif self.when_to_process == self.current_time:  # item is in the present
-            self.add_caffeine(mg_to_add_local)
-        else:  # self.when_to_process < current_time:  # item is in the past
-            self.mins_ago = (self.current_time - self.when_to_process).total_seconds() / 60
-            self.decay_before_add()
-            self.add_caffeine(mg_to_add_local)
+        for mg_to_add, mins_decayed, net_change in zip(due.level, minutes, net_changes):
+            self.mg_net_change = net_change
+            self.add_caffeine(mg_to_add, mins_decayed)
 
     def update_time(self):
         """
         Called by: main()
         """
-        self.data_dict['time'] = datetime.strftime(datetime.today(), '%Y-%m-%d %H:%M:%S')
+        self.data_dict['time'] = format_datetime(datetime.today())
 
     def __str__(self):
-        return (f'Caffeine level is {round(self.data_dict["level"], 1)} '
-                f'mg at time {self.data_dict["time"]}')
+        return describe_level(self.data_dict['level'], self.data_dict['time'])
+
+
+def forward_to_daemon(args):
+    """
+    Hand this run to the daemon serving on args.socket_file, which holds
+    the lock for as long as it serves, and exit with its reply; runs it
+    cannot serve exit at once. Return if no daemon answers.
+    Called by: caffeine_monitor.py
+    """
+    from src.client import try_request
+    if args.daemon or args.service or args.recompute or args.import_file:
+        if try_request(args.socket_file, {'op': 'level', 'profile': args.profile}) is None:
+            return
+        print(f'A caffeine monitor daemon is serving on {args.socket_file}; stop it first')
+        sys.exit(1)
+    payload = {'op': 'add', 'mg': args.mg, 'mins': args.mins, 'bev': args.bev} if args.mg else {'op': 'level'}
+    reply = try_request(args.socket_file, {**payload, 'profile': args.profile})
+    if reply is None:
+        return
+    if not reply['ok']:
+        print(f'The caffeine monitor daemon on {args.socket_file} refused the request:', reply['error'])
+        sys.exit(1)
+    print(reply['message'])
+    sys.exit(0)
 
 
 if __name__ == '__main__':
-    log_filename, json_filename, json_filename_future, first_run, args = set_up()
-
-    try:
-        logfile = open(log_filename, 'r+')
-    except OSError as e:
-        print('Unable to open .log file', e)
-        raise
-    else:
-        with logfile:
+    log_filename, json_filename, json_filename_future, args = set_up()
+    CaffeineMonitor.beverages = args.beverages
+    CaffeineMonitor.half_life = args.half_life
+
+    with ExitStack() as stack:
+        # held until exit, by a daemon for as long as it serves
+        try:
+            stack.enter_context(exclusive_lock(args.lock_file, timeout=0))
+        except LockTimeout:
+            forward_to_daemon(args)  # exits if a daemon holds the lock
             try:
-                file = open(json_filename, 'r+')
-            except OSError as e:
-                print('Unable to open .json file', e)
+                stack.enter_context(exclusive_lock(args.lock_file))
+            except LockTimeout as e:
+                print('Another caffeine monitor is running:', e)
                 raise
+        first_run = init_files(log_filename, json_filename, json_filename_future, args)
+
+        if args.storage == 'sqlite':
+            # the daemon's handler threads share the connection, one at a time
+            connection = sqlite3.connect(args.db_file, check_same_thread=False)
+            storage = SqliteStorage(stack.enter_context(closing(connection)), args.profile)
+            if not (args.daemon or args.service):  # which serve every profile, and log for each
+                logging.getLogger().addHandler(storage.log_handler())
+        elif args.storage == 'journal':
+            storage = JournalStorage(open_file(stack, log_filename, 'r+', '.log file'),
+                                     open_file(stack, args.journal_file, 'r+b', 'journal file'))
+        else:
+            AtomicJsonStorage.recover(json_filename, json_filename_future)
+            storage = AtomicJsonStorage(open_file(stack, log_filename, 'r+', '.log file'),
+                                        open_file(stack, json_filename, 'r+', '.json file'),
+                                        open_file(stack, json_filename_future, 'r+', 'future .json file'),
+                                        compact=args.json_compact, codec=args.json_codec)
+        if args.recompute:
+            from src.history import recompute
+            levels = recompute(storage, args.half_life)
+            if levels is None:
+                print('No level is stored yet')
             else:
-                with file:
-                    try:
-                        file_future = open(json_filename_future, 'r+')
-                    except OSError as e:
-                        print('Unable to open future .json file', e)
-                        raise
-                    else:
-                        monitor = CaffeineMonitor(logfile, file, file_future, first_run, args)
-                        monitor.main()
+                print(f'With a half-life of {args.half_life:g} mins, the level of '
+                      f'{round(levels[0], 1)} mg is now {round(levels[1], 1)} mg')
+        elif args.import_file:
+            from src.backfill import backfill, load_drinks
+            monitor = CaffeineMonitor(storage, first_run, args)
+            try:
+                count = backfill(monitor, load_drinks(args.import_file))
+            except ValueError as e:
+                print(f'Unable to import {args.import_file}:', e)
+                raise
+            print(f'Imported {count} drinks from {args.import_file}')
+            print(monitor)
+        elif args.daemon or args.service:
+            if args.storage == 'sqlite':  # one process serves every profile in the database
+                from src.profiles import ProfileEngine
+                resident = ProfileEngine(connection, args.half_lives, args.profile)
+                resident.load()
+                logging.getLogger().addHandler(resident.log_handler())
+            else:
+                from src.daemon import ResidentMonitor
+                resident = ResidentMonitor(storage, args.profile)
+            if args.daemon:
+                from src.daemon import serve
+            else:
+                from src.service import serve
+            serve(resident, args.socket_file)
+        else:
+            monitor = CaffeineMonitor(storage, first_run, args)
+            monitor.main()
@@ -0,0 +1,117 @@
+# file: src/client.py
+# created: 2026-10-16
+"""
+Thin client for `caffeine_monitor.py --daemon`. It imports nothing
+beyond the standard library, and config.py only when it must look up
+the socket: -s SOCKET, else $CAFF_SOCKET, else the socket_file
+configured for $CAFF_ENV in caffeine.ini. -p NAME asks about another
+profile: a daemon of the sqlite backend serves them all on one socket;
+the others serve one each, on the socket named for it.
+"""
+import json
+import os
+import socket
+import sys
+
+USAGE = '''usage: python -m src.client [-s SOCKET] [-p NAME] level
+       python -m src.client [-s SOCKET] [-p NAME] add MG [MINS] [-b BEVERAGE]
+       python -m src.client [-s SOCKET] [-p NAME] history [N]
+       python -m src.client [-s SOCKET] [-p NAME] at "YYYY-MM-DD HH:MM:SS"'''
+
+
+FORWARD_TIMEOUT = 10.0  # seconds, as locking.LOCK_TIMEOUT
+
+
+def request(socket_file, payload, timeout=None):
+    """Send one request to the daemon and :return: its reply, as a dict"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_file)
+        sock.sendall(json.dumps(payload).encode() + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('rb') as reply:
+            return json.loads(reply.readline())
+
+
+def try_request(socket_file, payload):
+    """
+    :return: the reply of the daemon serving on socket_file to payload,
+             or None if no daemon answers there
+    Called by: quick_level.py, caffeine_monitor.py
+    """
+    try:
+        return request(socket_file, payload, FORWARD_TIMEOUT)
+    except (OSError, ValueError):  # no socket, a stale one, or no reply
+        return None
+
+
+def default_socket_file(profile=None):
+    """:return: the socket of the daemon that serves profile, or the default profile"""
+    socket_file = os.environ.get('CAFF_SOCKET')
+    if socket_file:
+        return socket_file
+    from src.config import DEFAULT_PROFILE, EnvironmentConfig, load_config, profile_name
+    env_config = EnvironmentConfig(load_config()[os.environ.get('CAFF_ENV', 'prod')])
+    return env_config.socket_file(env_config.file_profile(profile_name(profile or DEFAULT_PROFILE)))
+
+
+def parse_request(argv):
+    """:return: (socket_file or None, payload) for the command line argv"""
+    argv = list(argv)
+    socket_file = None
+    if argv[:1] == ['-s']:
+        socket_file, argv = argv[1], argv[2:]
+    bev = take_option(argv, ('-b', '--bev'), 'coffee')
+    profile = take_option(argv, ('-p', '--profile'), None)
+    payload = request_payload(argv, bev)
+    if profile is not None:
+        payload['profile'] = profile
+    return socket_file, payload
+
+
+def take_option(argv, flags, default):
+    """:return: the value of the option flags in argv, removing both from argv, else default"""
+    for flag in flags:
+        if flag in argv:
+            i = argv.index(flag)
+            value = argv[i + 1]
+            del argv[i:i + 2]
+            return value
+    return default
+
+
+def request_payload(argv, bev):
+    """:return: the request for argv, the command line without options"""
+    if argv[0] == 'at' and len(argv) == 2:
+        return {'op': 'level_at', 'time': argv[1]}
+    op, params = argv[0], [int(param) for param in argv[1:]]
+
+    if op == 'level' and not params:
+        return {'op': 'level'}
+    if op == 'add' and 1 <= len(params) <= 2:
+        return {'op': 'add', 'mg': params[0], 'mins': params[1] if len(params) > 1 else 0, 'bev': bev}
+    if op == 'history' and len(params) <= 1:
+        return {'op': 'history', **({'lines': params[0]} if params else {})}
+    raise ValueError(f'Invalid request: {" ".join(argv)}')
+
+
+def main(argv):
+    try:
+        socket_file, payload = parse_request(argv)
+    except (ValueError, IndexError):
+        print(USAGE)
+        return 2
+    try:
+        reply = request(socket_file or default_socket_file(payload.get('profile')), payload)
+    except OSError as e:
+        print('Unable to reach the caffeine monitor daemon', e)
+        return 1
+    if not reply['ok']:
+        print(reply['error'])
+        return 1
+    print('\n'.join(reply['lines']) if payload['op'] == 'history' else reply['message'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,188 @@
+# file: src/codec.py
+# created: 2026-10-16
+"""
+JSON codecs for the .json files.
+
+A codec reads and writes the state file and the future file, and
+decodes a run of future entries straight into a DoseBatch:
+    loads(data) -> object, from str or bytes
+    load(infile) -> object
+    dump(obj, outfile, **layout), where layout is {'indent': n} or
+                                  {'separators': (',', ':')}, as for json.dump()
+    decode_doses(data) -> a DoseBatch of the entries in data, a JSON
+                          array as str or bytes
+
+JsonCodec uses the standard library. MsgspecCodec, OrjsonCodec and
+UjsonCodec use those libraries, if they are installed; each is imported
+only when its codec is made, so importing this module costs nothing.
+MsgspecCodec decodes entries into typed structs rather than dicts.
+The fast codecs ignore the separators, which they never pad, and
+orjson indents by 2 whatever the indent; the future file readers
+accept any layout.
+
+Every codec raises json.JSONDecodeError (a ValueError) on invalid JSON,
+as the standard library does. NaN and infinities must not reach a
+codec: orjson and msgspec write them as null. JsonStorage refuses them
+(see storage.check_finite()).
+"""
+from array import array
+import json
+from operator import attrgetter, itemgetter
+
+from src.doses import DoseBatch
+from src.timestamps import parse_epoch
+
+AUTO = 'auto'
+
+
+def batch_from_entries(entries, field=itemgetter):
+    """
+    :param entries: the future file's entries, decoded
+    :param field: makes a getter for one of an entry's fields
+    :return: a DoseBatch of entries
+    """
+    return DoseBatch(array('q', map(parse_epoch, map(field('when_to_process'), entries))),
+                     epoch_column(list(map(field('time_entered'), entries))),
+                     array('d', map(field('level'), entries)))
+
+
+def epoch_column(texts):
+    """
+    :return: array('q') of texts as epoch seconds, parsing each distinct
+             text once: a drink's doses share the time it was entered
+    """
+    seconds = {text: parse_epoch(text) for text in set(texts)}
+    return array('q', map(seconds.__getitem__, texts))
+
+
+class JsonCodec:
+    """The standard library's json module"""
+    name = 'json'
+    module = 'json'
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def load(self, infile):
+        return json.load(infile)
+
+    def dump(self, obj, outfile, **layout):
+        json.dump(obj, outfile, **layout)
+
+    def decode_doses(self, data):
+        try:
+            return batch_from_entries(self.loads(data))
+        except (KeyError, TypeError) as e:
+            raise json.JSONDecodeError(f'Invalid future entry: {e!r}', '', 0) from None
+
+
+class OrjsonCodec(JsonCodec):
+    name = 'orjson'
+    module = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def loads(self, data):
+        return self.orjson.loads(data)  # orjson.JSONDecodeError is a json.JSONDecodeError
+
+    def load(self, infile):
+        return self.loads(infile.read())
+
+    def dump(self, obj, outfile, **layout):
+        option = self.orjson.OPT_INDENT_2 if layout.get('indent') else 0
+        outfile.write(self.orjson.dumps(obj, option=option).decode())
+
+
+class UjsonCodec(JsonCodec):
+    name = 'ujson'
+    module = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def loads(self, data):
+        try:
+            return self.ujson.loads(data)
+        except ValueError as e:  # ujson.JSONDecodeError
+            raise json.JSONDecodeError(str(e), '', 0) from None
+
+    def load(self, infile):
+        return self.loads(infile.read())
+
+    def dump(self, obj, outfile, **layout):
+        outfile.write(self.ujson.dumps(obj, indent=layout.get('indent') or 0))
+
+
+class MsgspecCodec(JsonCodec):
+    """Decodes future entries into typed structs, with no dict per entry"""
+    name = 'msgspec'
+    module = 'msgspec'
+
+    def __init__(self):
+        from typing import List
+        import msgspec
+
+        class FutureEntry(msgspec.Struct):
+            when_to_process: str
+            time_entered: str
+            level: float
+
+        self.msgspec = msgspec
+        self.entries_decoder = msgspec.json.Decoder(List[FutureEntry])
+
+    def loads(self, data):
+        try:
+            return self.msgspec.json.decode(data)
+        except self.msgspec.DecodeError as e:
+            raise json.JSONDecodeError(str(e), '', 0) from None
+
+    def load(self, infile):
+        return self.loads(infile.read())
+
+    def dump(self, obj, outfile, **layout):
+        buf = self.msgspec.json.encode(obj)
+        if layout.get('indent'):
+            buf = self.msgspec.json.format(buf, indent=layout['indent'])
+        outfile.write(buf.decode())
+
+    def decode_doses(self, data):
+        try:
+            entries = self.entries_decoder.decode(data)
+        except self.msgspec.DecodeError as e:  # also raised for an entry of the wrong shape
+            raise json.JSONDecodeError(str(e), '', 0) from None
+        return batch_from_entries(entries, attrgetter)
+
+
+CODECS = {codec.name: codec for codec in (MsgspecCodec, OrjsonCodec, UjsonCodec, JsonCodec)}  # fastest first
+STDLIB_CODEC = JsonCodec()
+
+
+def available():
+    """:return: the names of the codecs whose library is installed, fastest first"""
+    import importlib.util
+    return [name for name, codec in CODECS.items() if importlib.util.find_spec(codec.module) is not None]
+
+
+def get_codec(name=AUTO):
+    """
+    :param name: a key of CODECS, or 'auto' for the fastest that can
+                 be imported, else the standard library's
+    :return: a codec
+    :raises ValueError: if name is unknown, or its library cannot be imported
+    Called by: utils.set_up(), benchmarks
+    """
+    if name == AUTO:
+        for codec in CODECS.values():
+            try:
+                return codec()
+            except ImportError:  # not installed, or a broken install
+                continue
+    if name not in CODECS:
+        raise ValueError(f'Unknown JSON codec: {name} (expected {AUTO} or one of {", ".join(CODECS)})')
+    try:
+        return CODECS[name]()
+    except ImportError:
+        raise ValueError(f'JSON codec {name} needs the {CODECS[name].module} package') from None
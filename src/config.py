@@ -0,0 +1,220 @@
+# file: src/config.py
+# created: 2026-10-16
+"""
+Reading caffeine.ini: file names per profile, and half-lives.
+
+Kept apart from utils.py, and to the standard library, so that the
+fast path in quick_level.py can use it without loading argparse,
+logging or the monitor.
+
+caffeine.ini is found, and the relative file names in it resolved,
+from the project root rather than the working directory. load_config()
+keeps the parsed sections in a marshal sidecar, caffeine.ini.cache,
+stamped with the ini's mtime and size, so that configparser is neither
+imported nor run again until the ini changes.
+"""
+import marshal
+import os
+import re
+
+CONFIG_FILENAME = 'src/caffeine.ini'
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(PROJECT_ROOT, CONFIG_FILENAME)
+CACHE_SUFFIX = '.cache'
+DEFAULT_PROFILE = 'default'
+DEFAULT_HALF_LIFE = 360.0  # minutes
+HALF_LIVES_SECTION = 'half_lives'
+PROFILE_RE = re.compile(r'[A-Za-z0-9_-]+')
+BOOLEAN_STATES = {'1': True, 'yes': True, 'true': True, 'on': True,  # as ConfigParser.getboolean()
+                  '0': False, 'no': False, 'false': False, 'off': False}
+
+
+def read_config_file(config_file):
+    import configparser
+    conf = configparser.ConfigParser()
+    conf.read(config_file)
+    return conf
+
+
+def load_config(config_file=CONFIG_PATH):
+    """
+    :return: {section: {key: value}} from config_file, read from its
+             sidecar if that was written for the file as it is now;
+             it can be read wherever a ConfigParser would be
+    Called by: utils.py, quick_level.py, client.py
+    """
+    try:
+        stat = os.stat(config_file)
+    except OSError:
+        return {}  # as ConfigParser.read() does
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cache_file = config_file + CACHE_SUFFIX
+    try:
+        with open(cache_file, 'rb') as infile:
+            cached_stamp, sections = marshal.load(infile)
+        if cached_stamp == stamp:
+            return sections
+    except (OSError, EOFError, ValueError, TypeError):  # no sidecar yet, or a damaged one
+        pass
+    parser = read_config_file(config_file)
+    sections = {name: dict(parser[name]) for name in parser.sections()}
+    write_cache(cache_file, stamp, sections)
+    return sections
+
+
+def write_cache(cache_file, stamp, sections):
+    """Replace cache_file, if it can be written at all"""
+    staged = f'{cache_file}.{os.getpid()}'
+    try:
+        with open(staged, 'wb') as outfile:
+            marshal.dump((stamp, sections), outfile)
+        os.replace(staged, cache_file)
+    except OSError:
+        try:
+            os.remove(staged)
+        except OSError:
+            pass
+
+
+def project_path(fname):
+    """:return: fname, resolved against the project root if it is relative"""
+    return os.path.join(PROJECT_ROOT, fname)
+
+
+def profile_name(text):
+    """
+    :return: the profile named by text, lowercased: every backend keys
+             its files, rows and half-life on the same name, and
+             configparser lowercases the [half_lives] option names
+    :raises ValueError: if text is not a valid profile name
+    Called by: utils.create_parser(), daemon.read_request(), quick_level.parse_argv(),
+               client.default_socket_file()
+    """
+    if not PROFILE_RE.fullmatch(text):
+        raise ValueError(f"Invalid profile name: {text}")
+    return text.lower()
+
+
+def profile_filename(fname, profile):
+    """
+    :return: fname for the default profile; otherwise fname with
+             '_<profile>' added before its extension
+    """
+    if profile == DEFAULT_PROFILE:
+        return fname
+    if not PROFILE_RE.fullmatch(profile):
+        raise ValueError(f"Invalid profile name: {profile}")
+    root, ext = os.path.splitext(fname)
+    return f'{root}_{profile}{ext}'
+
+
+class EnvironmentConfig:
+    """
+    One environment's section of the config, with accessors for the
+    files it names, resolved against the project root
+    """
+    __slots__ = ('section',)
+
+    def __init__(self, section):
+        """:param section: e.g. load_config()['prod']"""
+        self.section = section
+
+    @property
+    def storage(self):
+        """:return: 'json' (the default), 'journal' or 'sqlite'"""
+        return self.section.get('storage', 'json')
+
+    @property
+    def json_compact(self):
+        """
+        :return: whether the future .json file is written without indentation
+        :raises ValueError: if json_compact is not a boolean
+        """
+        value = self.section.get('json_compact', 'no')
+        try:
+            return BOOLEAN_STATES[value.lower()]
+        except KeyError:
+            raise ValueError(f'json_compact is not a boolean: {value}') from None
+
+    @property
+    def json_codec(self):
+        """
+        :return: the name of the codec for the .json files (see
+                 codec.get_codec()): the standard library's unless the
+                 section opts in to another, or to 'auto'
+        """
+        return self.section.get('json_codec', 'json')
+
+    def file_profile(self, profile):
+        """
+        :return: the profile whose files hold profile's data: profile's
+                 own, except for the sqlite backend, which keeps every
+                 profile in the one database, behind one lock and served
+                 on one socket
+        """
+        return DEFAULT_PROFILE if self.storage == 'sqlite' else profile
+
+    def path(self, key, profile=DEFAULT_PROFILE, default=None):
+        """
+        :return: profile's file named by key, else by default
+        :raises KeyError: if key is missing and there is no default
+        :raises ValueError: if profile is not a valid name
+        """
+        fname = self.section[key] if default is None else self.section.get(key, default)
+        return project_path(profile_filename(fname, profile))
+
+    def json_file(self, profile=DEFAULT_PROFILE):
+        return self.path('json_file', profile)
+
+    def json_file_future(self, profile=DEFAULT_PROFILE):
+        return self.path('json_file_future', profile)
+
+    def log_file(self, profile=DEFAULT_PROFILE):
+        return self.path('log_file', profile)
+
+    def journal_file(self, profile=DEFAULT_PROFILE):
+        return self.path('journal_file', profile)
+
+    def db_file(self):
+        return self.path('db_file')
+
+    def socket_file(self, profile=DEFAULT_PROFILE):
+        """:return: socket_file, else the log file's name with a .sock extension"""
+        return self.path('socket_file', profile, os.path.splitext(self.section['log_file'])[0] + '.sock')
+
+    def lock_file(self, profile=DEFAULT_PROFILE):
+        """:return: lock_file, else the log file's name with a .lock extension"""
+        return self.path('lock_file', profile, os.path.splitext(self.section['log_file'])[0] + '.lock')
+
+
+def read_half_life(config, profile):
+    """
+    :return: profile's half-life in minutes, from the [half_lives] section
+             of config: its own entry, else the default profile's, else
+             DEFAULT_HALF_LIFE
+    :param profile: a name as profile_name() returns it
+    :raises ValueError: if the half-life is not a positive number
+    """
+    half_lives = config[HALF_LIVES_SECTION] if HALF_LIVES_SECTION in config else {}
+    text = half_lives.get(profile, half_lives.get(DEFAULT_PROFILE, DEFAULT_HALF_LIFE))
+    half_life = float(text)
+    if not half_life > 0:
+        raise ValueError(f'Invalid half-life for profile {profile}: {text}')
+    return half_life
+
+
+class HalfLives:
+    """Profiles' half-lives, read from config as each is first asked for"""
+    def __init__(self, config):
+        self.config = config
+        self.cache = {}
+
+    def get(self, profile):
+        """
+        :return: profile's half-life in minutes (see read_half_life())
+        :raises ValueError: if the half-life is not a positive number
+        Called by: ProfileEngine
+        """
+        if profile not in self.cache:
+            self.cache[profile] = read_half_life(self.config, profile)
+        return self.cache[profile]
@@ -0,0 +1,232 @@
+# file: src/daemon.py
+# created: 2026-10-16
+"""
+Resident mode: keep the level and pending doses in memory and serve
+requests on a Unix domain socket.
+
+Requests and replies are single lines of JSON:
+    {"op": "level"}
+    {"op": "add", "mg": 100, "mins": 0, "bev": "coffee"}
+    {"op": "history", "lines": 10}
+    {"op": "level_at", "time": "2023-06-08 18:00:00"}
+Replies carry "ok": true and the result, or "ok": false and "error".
+Any request may name a "profile"; without one it is for the profile
+the daemon was started with. A ResidentMonitor serves that profile
+only; a ProfileEngine (see profiles.py), which the sqlite backend
+uses, serves every profile in the database.
+
+A level query costs no file I/O unless it drains a due dose; storage
+is written through only when the level or the pending doses change.
+"""
+from argparse import Namespace
+from datetime import datetime
+import json
+import os
+import socketserver
+import threading
+
+from src.caffeine_monitor import CaffeineMonitor, describe_level
+from src.config import DEFAULT_PROFILE, profile_name
+from src.storage import MemoryStorage
+from src.timestamps import format_datetime, parse_datetime, to_epoch
+
+DEFAULT_HISTORY_LINES = 10
+MAX_MINS = 10 * 366 * 24 * 60  # how far back or ahead a dose may be added; well inside datetime's range
+
+
+class ResidentMonitor:
+    """A storage backend's level and pending doses, loaded once and kept in memory"""
+    def __init__(self, backend, profile=DEFAULT_PROFILE):
+        """
+        :param backend: a storage backend, such as JsonStorage (see storage.py)
+        :param profile: whose level and doses backend holds
+        """
+        self.backend = backend
+        self.profile = profile
+        state = backend.read_state()
+        queue = backend.read_future(to_epoch(datetime.today()))
+        backend.load_pending(queue)
+        self.memory = MemoryStorage(state, queue.doses[:])
+
+    @property
+    def half_life(self):
+        """The class's, which caffeine_monitor.py sets for the profile served"""
+        return CaffeineMonitor.half_life
+
+    def for_profile(self, profile=None):
+        """
+        :return: self, for a request naming profile, or none
+        :raises ValueError: if profile is another one
+        Called by: MonitorServer, MonitorService
+        """
+        if profile not in (None, self.profile):
+            raise ValueError(f'This daemon serves profile {self.profile} only; '
+                             f'start another with -p {profile}, or use the sqlite backend')
+        return self
+
+    def run(self, mg=0, mins=0, bev='coffee'):
+        """
+        Bring the level up to date, adding mg of bev consumed mins ago,
+        and write it through if it changed; if anything fails, the
+        level and pending doses are left as they were
+        :return: the CaffeineMonitor that did the work
+        """
+        checkpoint = self.checkpoint()
+        try:
+            monitor, changed = self.apply(mg, mins, bev)
+            if changed:
+                self.save(monitor.current_time)
+        except Exception:
+            self.rollback(checkpoint)
+            raise
+        return monitor
+
+    def checkpoint(self):
+        """:return: a copy of the level and pending doses, for rollback()"""
+        return dict(self.memory.state), self.memory.queue.doses[:]
+
+    def rollback(self, checkpoint):
+        """Restore the level and pending doses as checkpoint() found them"""
+        state, doses = checkpoint
+        self.memory = MemoryStorage(state, doses)
+
+    def apply(self, mg=0, mins=0, bev='coffee'):
+        """
+        As run(), in memory only
+        :return: (monitor, changed), where changed is True if a dose
+                 was added or drained
+        """
+        pending = len(self.memory.queue)
+        monitor = CaffeineMonitor(self.memory, not self.memory.state,
+                                  Namespace(mg=mg, mins=mins, bev=bev, half_life=self.half_life))
+        monitor.run()
+        return monitor, bool(mg) or len(self.memory.queue) != pending
+
+    def level_at(self, when):
+        """:return: the level at datetime when, computed in memory (see CaffeineMonitor.level_at())"""
+        args = Namespace(mg=0, mins=0, bev='coffee', half_life=self.half_life)
+        return CaffeineMonitor(self.memory, False, args).level_at(when)
+
+    def next_due(self):
+        """:return: epoch seconds at which the next pending dose is due, or None"""
+        when = self.memory.queue.doses.when
+        return when[-1] if when else None
+
+    def save(self, now):
+        """Write the level and pending doses through to the backend"""
+        self.backend.load_pending(self.backend.read_future(to_epoch(now)))
+        self.backend.write_future(self.memory.queue)
+        self.backend.write_state(self.memory.state)
+
+    def history(self, n):
+        return self.backend.read_history(n)
+
+
+class MonitorRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            reply = self.server.dispatch(line)
+            self.wfile.write(json.dumps(reply).encode() + b'\n')
+
+
+class MonitorServer(socketserver.ThreadingUnixStreamServer):
+    """Serves a ResidentMonitor or a ProfileEngine; requests are handled one at a time"""
+    daemon_threads = True
+
+    def __init__(self, socket_file, resident):
+        """
+        :param socket_file: path for the socket; a stale one is replaced
+        :param resident: a ResidentMonitor, or a ProfileEngine
+        """
+        if os.path.exists(socket_file):
+            os.unlink(socket_file)
+        super().__init__(socket_file, MonitorRequestHandler)
+        os.chmod(socket_file, 0o600)
+        self.resident = resident
+        self.lock = threading.Lock()
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+    def dispatch(self, line):
+        """:return: the reply to one request line, as a dict"""
+        try:
+            op, profile, params = read_request(line)
+            with self.lock:
+                resident = self.resident.for_profile(profile)
+                if op == 'history':
+                    return {'ok': True, 'lines': resident.history(**params)}
+                if op == 'level_at':
+                    return level_at_reply(resident.level_at(**params), params['when'])
+                return level_reply(resident.run(**params))
+        except Exception as e:  # reply to every request, whatever went wrong with it
+            return error_reply(e)
+
+
+def read_request(line):
+    """
+    :return: (op, profile, params) for one request line, where profile
+             is None if the request names none, and params are the
+             keyword arguments for ResidentMonitor.run(), .history()
+             or .level_at()
+    :raises ValueError, KeyError, TypeError: if the request is invalid
+    """
+    request = json.loads(line)
+    op = request['op']
+    profile = request.get('profile')
+    if profile is not None:
+        if not isinstance(profile, str):
+            raise ValueError(f'Invalid profile name: {profile}')
+        profile = profile_name(profile)
+    return op, profile, read_params(op, request)
+
+
+def read_params(op, request):
+    """:return: the keyword arguments for op, from request (see read_request())"""
+    if op == 'level':
+        return {}
+    if op == 'add':
+        bev = request.get('bev', 'coffee')
+        if bev not in CaffeineMonitor.beverages:
+            raise ValueError(f'Unknown beverage: {bev}')
+        mins = int(request.get('mins', 0))
+        if abs(mins) > MAX_MINS:
+            raise ValueError(f'mins must be between {-MAX_MINS} and {MAX_MINS}')
+        return {'mg': int(request['mg']), 'mins': mins, 'bev': bev}
+    if op == 'history':
+        return {'n': int(request.get('lines', DEFAULT_HISTORY_LINES))}
+    if op == 'level_at':
+        return {'when': parse_datetime(request['time'])}
+    raise ValueError(f'Unknown op: {op}')
+
+
+def level_reply(monitor):
+    return {'ok': True, 'level': monitor.data_dict['level'], 'time': monitor.data_dict['time'],
+            'message': str(monitor)}
+
+
+def level_at_reply(level, when):
+    time = format_datetime(when)
+    return {'ok': True, 'level': level, 'time': time, 'message': describe_level(level, time)}
+
+
+def error_reply(e):
+    return {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+
+
+def serve(resident, socket_file):
+    """
+    Serve requests until interrupted
+    :param resident: a ResidentMonitor, or a ProfileEngine
+    Called by: caffeine_monitor.py
+    """
+    with MonitorServer(socket_file, resident) as server:
+        print(f'Serving on {socket_file}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
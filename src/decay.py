@@ -0,0 +1,170 @@
+# file: src/decay.py
+# created: 2026-10-16
+"""
+Closed-form exponential decay of many doses in one pass.
+NumPy is used when it is installed; otherwise the same arithmetic
+runs over array('d') columns.
+"""
+from array import array
+from functools import lru_cache
+from itertools import repeat
+
+from src.future_queue import first_at_or_before
+from src.kinetics import projected_blood
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TABLE_SECONDS = 2 * 86400  # elapsed times covered by decay_table()
+CURVE_CELLS = 1 << 16  # samples times doses that level_curve() decays at once
+TIE_TOLERANCE = 1e-6  # how near a tie at the first decimal level_curve() rounds with round()
+
+
+def elapsed_minutes(now, when):
+    """
+    :param now: the current time, in epoch seconds
+    :param when: array('q') of epoch seconds
+    :return: minutes from each element of when to now
+    """
+    if np is not None:
+        return (now - np.frombuffer(when, dtype=np.int64)) / 60
+    return array('d', [(now - w) / 60 for w in when])
+
+
+def decay_factors(minutes, half_life):
+    """:return: 0.5 ** (minutes / half_life) for each element of minutes"""
+    if np is not None:
+        return np.power(0.5, np.asarray(minutes, dtype=np.float64) / half_life)
+    return array('d', [pow(0.5, m / half_life) for m in minutes])
+
+
+@lru_cache(maxsize=8)
+def decay_table(half_life):
+    """
+    :return: an ndarray of 0.5 ** (s / 60 / half_life) for every whole
+             second s from 0 to TABLE_SECONDS, built once per half-life
+    """
+    return np.power(0.5, np.arange(TABLE_SECONDS) / 60 / half_life)
+
+
+def decay_factors_seconds(seconds, half_life):
+    """
+    As decay_factors(), for an int64 ndarray of whole seconds elapsed.
+    Factors are looked up in decay_table(), which gives the same values
+    np.power() would; seconds outside the table are computed exactly.
+    Requires NumPy.
+    """
+    table = decay_table(half_life)
+    if seconds.size and (seconds.min() < 0 or seconds.max() >= TABLE_SECONDS):
+        inside = (seconds >= 0) & (seconds < TABLE_SECONDS)
+        factors = np.power(0.5, seconds / 60 / half_life)
+        factors[inside] = table[seconds[inside]]
+        return factors
+    return table[seconds]
+
+
+def decayed_amounts(levels, minutes, half_life):
+    """
+    Decay each dose in levels by the matching element of minutes.
+
+    Amounts are rounded to one decimal place with round(), except
+    that a dose with no elapsed time is returned unchanged.
+    :param levels: array('d') of mg
+    :param minutes: minutes elapsed since each dose became due
+    :return: a list of floats, one per dose
+    """
+    if not levels:
+        return []
+    if np is not None:
+        levels_np = np.frombuffer(levels, dtype=np.float64)
+        minutes_np = np.asarray(minutes, dtype=np.float64)
+        products = (levels_np * decay_factors(minutes_np, half_life)).tolist()
+        amounts = list(map(round, products, repeat(1)))
+        for i in np.flatnonzero(minutes_np == 0).tolist():
+            amounts[i] = levels[i]
+        return amounts
+    factors = decay_factors(minutes, half_life)
+    return [level if m == 0 else round(level * factor, 1)
+            for level, m, factor in zip(levels, minutes, factors)]
+
+
+def projected_level(level, since, doses, when, half_life, gut=None):
+    """
+    The level at time when, in closed form: the stored level decayed
+    from since to when, plus what the gut absorbs meanwhile, plus every
+    pending dose due by when, decayed from its time to process. This is
+    the level CaffeineMonitor.run() would record at when, had nothing
+    been added in between.
+    :param level: the stored level, in mg
+    :param since: epoch seconds at which level was stored
+    :param doses: a DoseBatch of pending doses, latest first
+    :param when: epoch seconds, no earlier than since
+    :param gut: the stored state's gut amounts (see kinetics.py), or None
+    :return: the level at when, in mg
+    :raises ValueError: if when is earlier than since
+    """
+    if when < since:
+        raise ValueError('Cannot project the level to a time before it was stored')
+    level *= pow(0.5, (when - since) / 60 / half_life)
+    if gut:
+        level += projected_blood(gut, half_life, (when - since) / 60)
+    due = doses[first_at_or_before(doses.when, when):]
+    amounts = decayed_amounts(due.level, elapsed_minutes(when, due.when), half_life)
+    return sum(reversed(amounts), level)  # earliest first, in run()'s order
+
+
+def level_curve(level, since, doses, times, half_life, gut=None):
+    """
+    The level at each of many times, as projected_level() computes it,
+    without a pass per sample: with NumPy, a samples-by-doses matrix of
+    decayed amounts, with factors from decay_table(), is masked to the
+    doses due by each sample and summed along its rows. The samples are
+    taken in chunks of at most CURVE_CELLS matrix cells. Amounts near a
+    tie at the first decimal are rounded with round(), as
+    decayed_amounts() rounds them.
+    :param level: the stored level, in mg
+    :param since: epoch seconds at which level was stored
+    :param doses: a DoseBatch of pending doses, latest first
+    :param times: epoch seconds, in ascending order, none earlier than since
+    :param gut: the stored state's gut amounts (see kinetics.py), or None
+    :return: the level at each of times, in mg, as an ndarray, or as
+             array('d') without NumPy
+    :raises ValueError: if a time is earlier than since
+    """
+    if not len(times):
+        return np.empty(0) if np is not None else array('d')
+    if times[0] < since:
+        raise ValueError('Cannot project the level to a time before it was stored')
+    due = doses[first_at_or_before(doses.when, times[-1]):]
+    if np is not None:
+        times_np = np.asarray(times, dtype=np.int64)
+        curve = level * decay_factors_seconds(times_np - since, half_life)
+        if gut:
+            curve += projected_blood(gut, half_life, (times_np - since) / 60, np.exp)
+        levels_np = np.frombuffer(due.level, dtype=np.float64)
+        when_np = np.frombuffer(due.when, dtype=np.int64)
+        rows = max(1, CURVE_CELLS // max(1, len(due)))
+        for start in range(0, len(times_np), rows):
+            seconds = times_np[start:start + rows, np.newaxis] - when_np
+            products = levels_np * decay_factors_seconds(np.maximum(seconds, 0), half_life)
+            amounts = np.round(products, 1)
+            # np.round() scales by 10 first, so it may break a near tie the other way from round()
+            near_tie = np.abs(products * 10 % 1 - 0.5) < TIE_TOLERANCE
+            amounts[near_tie] = list(map(round, products[near_tie].tolist(), repeat(1)))
+            amounts = np.where(seconds == 0, levels_np, amounts)
+            amounts[seconds < 0] = 0.0
+            curve[start:start + rows] += amounts.sum(axis=1)
+        return curve
+
+    due.reverse()  # earliest first
+    curve = array('d')
+    for t in times:
+        amounts = [lv if t == w else round(lv * pow(0.5, (t - w) / 60 / half_life), 1)
+                   for w, lv in zip(due.when, due.level) if w <= t]
+        stored = level * pow(0.5, (t - since) / 60 / half_life)
+        if gut:
+            stored += projected_blood(gut, half_life, (t - since) / 60)
+        curve.append(sum(amounts, stored))
+    return curve
@@ -0,0 +1,97 @@
+# file: src/doses.py
+# created: 2026-10-16
+"""
+Compact representations of pending doses
+"""
+from array import array
+
+
+class Dose:
+    """
+    One pending dose.
+
+    when: epoch seconds at which the dose is to be processed
+    entered: epoch seconds at which the dose was consumed
+    level: mg of caffeine
+    """
+    __slots__ = ('when', 'entered', 'level')
+
+    def __init__(self, when, entered, level):
+        self.when = when
+        self.entered = entered
+        self.level = level
+
+    def __eq__(self, other):
+        if not isinstance(other, Dose):
+            return NotImplemented
+        return (self.when, self.entered, self.level) == (other.when, other.entered, other.level)
+
+    def __repr__(self):
+        return f'Dose(when={self.when}, entered={self.entered}, level={self.level})'
+
+
+class DoseBatch:
+    """
+    Doses stored column by column, in parallel arrays:
+    'when' and 'entered' as array('q'), 'level' as array('d').
+    A dose costs 24 bytes, and the columns can be handed to the
+    decay engine without conversion.
+    """
+    __slots__ = ('when', 'entered', 'level')
+
+    def __init__(self, when=None, entered=None, level=None):
+        self.when = array('q') if when is None else when
+        self.entered = array('q') if entered is None else entered
+        self.level = array('d') if level is None else level
+
+    @classmethod
+    def from_doses(cls, doses):
+        batch = cls()
+        for dose in doses:
+            batch.append(dose)
+        return batch
+
+    def append(self, dose):
+        self.when.append(dose.when)
+        self.entered.append(dose.entered)
+        self.level.append(dose.level)
+
+    def extend(self, other):
+        """Append every dose of DoseBatch other"""
+        self.when.extend(other.when)
+        self.entered.extend(other.entered)
+        self.level.extend(other.level)
+
+    def insert(self, i, dose):
+        self.when.insert(i, dose.when)
+        self.entered.insert(i, dose.entered)
+        self.level.insert(i, dose.level)
+
+    def reverse(self):
+        self.when.reverse()
+        self.entered.reverse()
+        self.level.reverse()
+
+    def __len__(self):
+        return len(self.when)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return DoseBatch(self.when[index], self.entered[index], self.level[index])
+        return Dose(self.when[index], self.entered[index], self.level[index])
+
+    def __delitem__(self, index):
+        del self.when[index]
+        del self.entered[index]
+        del self.level[index]
+
+    def __iter__(self):
+        return map(Dose, self.when, self.entered, self.level)
+
+    def __eq__(self, other):
+        if not isinstance(other, DoseBatch):
+            return NotImplemented
+        return (self.when, self.entered, self.level) == (other.when, other.entered, other.level)
+
+    def __repr__(self):
+        return f'DoseBatch({list(self)!r})'
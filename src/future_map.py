@@ -0,0 +1,112 @@
+# file: src/future_map.py
+# created: 2026-10-16
+"""
+Memory-mapped read path for the future .json file.
+
+The same search as future_stream.py, but over a read-only mmap of the
+file instead of seek()/read() calls: probes look for '{' and '}' in
+place and pick 'when_to_process' out with a regex, so the binary
+search copies nothing but a 19-byte timestamp per probe. Only the due
+window is ever decoded.
+
+The due window is handed whole to a codec (see codec.py), which
+decodes it straight into a DoseBatch.
+
+Files that cannot be mapped (empty files, in-memory streams) fall back
+to future_stream.py.
+"""
+import json
+import mmap
+import os
+import re
+
+from src.codec import STDLIB_CODEC
+from src.doses import DoseBatch
+from src.timestamps import parse_epoch
+
+WHITESPACE = b' \t\n\r'
+WHEN_RE = re.compile(rb'"when_to_process"\s*:\s*"([^"]*)"')
+
+
+def map_file(infile):
+    """:return: a read-only mmap of infile, or None if it cannot be mapped"""
+    try:
+        fileno = infile.fileno()
+        size = os.fstat(fileno).st_size
+    except (AttributeError, OSError, TypeError):  # io.UnsupportedOperation is an OSError
+        return None
+    return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) if size else None
+
+
+def array_bounds(buf):
+    """
+    :return: (first, end): the offset just past the opening '[' and
+             the offset of the closing ']'
+    :raises json.JSONDecodeError: if buf does not hold a JSON array
+    """
+    first, end = 0, len(buf)
+    while first < end and buf[first] in WHITESPACE:
+        first += 1
+    while end > first and buf[end - 1] in WHITESPACE:
+        end -= 1
+    if first == end or buf[first] != ord('['):
+        raise json.JSONDecodeError('Expecting a JSON array', '', first)
+    if end - first < 2 or buf[end - 1] != ord(']'):
+        raise json.JSONDecodeError('Expecting a closing ]', '', end)
+    return first + 1, end - 1
+
+
+def when_at_or_after(buf, pos, end):
+    """
+    :return: (start, when) for the first entry starting in [pos, end),
+             where when is its 'when_to_process' in epoch seconds, or
+             (None, None) if there is none
+    """
+    start = buf.find(b'{', pos, end)
+    if start == -1:
+        return None, None
+    stop = buf.find(b'}', start, end)
+    match = WHEN_RE.search(buf, start, stop) if stop != -1 else None
+    if match is None:
+        raise json.JSONDecodeError("Expecting an entry with 'when_to_process'", '', start)
+    return start, parse_epoch(match.group(1).decode('ascii'))
+
+
+def find_first_due(buf, now, first, end):
+    """
+    Binary search for the first entry with when_to_process <= now
+    :param now: epoch seconds
+    :return: the offset of that entry's '{', or None if no entry is due
+    """
+    lo, hi = first, end
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start, when = when_at_or_after(buf, mid, end)
+        if start is None or when <= now:
+            hi = mid
+        else:
+            lo = start + 1
+    return when_at_or_after(buf, lo, end)[0]
+
+
+def read_doses(buf, start, end, codec=STDLIB_CODEC):
+    """
+    :param codec: decodes the entries, in one call
+    :return: a DoseBatch of the entries between offsets start and end
+    """
+    stop = last_entry_end(buf, start, end)
+    if stop is None:
+        return DoseBatch()
+    return codec.decode_doses(b'[' + buf[start:stop] + b']')
+
+
+def last_when(buf, first, pos):
+    """:return: when_to_process of the last entry in [first, pos), or None"""
+    start = buf.rfind(b'{', first, pos)
+    return None if start == -1 else when_at_or_after(buf, start, pos)[1]
+
+
+def last_entry_end(buf, first, pos):
+    """:return: the offset just past the last '}' in [first, pos), or None"""
+    brace = buf.rfind(b'}', first, pos)
+    return None if brace == -1 else brace + 1
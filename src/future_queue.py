@@ -0,0 +1,100 @@
+# file: src/future_queue.py
+# created: 2026-10-16
+"""
+Queue of pending doses ordered by time to process
+"""
+from array import array
+from itertools import islice
+
+from src.doses import DoseBatch
+
+
+def first_at_or_before(when, t):
+    """
+    :param when: a sequence sorted latest first
+    :return: the index of the first element of when that is <= t
+    """
+    lo, hi = 0, len(when)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if when[mid] > t:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def sort_latest_first(batch):
+    """:return: batch, or a sorted copy of it if it is not latest first"""
+    when = batch.when
+    if all(a >= b for a, b in zip(when, islice(when, 1, None))):
+        return batch
+    order = sorted(range(len(when)), key=when.__getitem__, reverse=True)
+    return DoseBatch(array('q', map(when.__getitem__, order)),
+                     array('q', map(batch.entered.__getitem__, order)),
+                     array('d', map(batch.level.__getitem__, order)))
+
+
+class FutureQueue:
+    """
+    Pending doses in a DoseBatch, kept sorted latest first.
+
+    Due doses sit at the end of the columns, so draining k of them
+    costs O(log n + k); new doses go in at a position found by binary
+    search. The batch is sorted once, when it is built, and never again.
+    """
+    def __init__(self, doses=None):
+        """
+        :param doses: a DoseBatch in any order. A batch that is already
+                      latest first is used as is.
+        """
+        self.doses = DoseBatch() if doses is None else sort_latest_first(doses)
+
+    def push(self, dose):
+        """Insert dose; of doses due at the same time, the oldest pops first"""
+        self.doses.insert(first_at_or_before(self.doses.when, dose.when), dose)
+
+    def merge(self, doses):
+        """
+        Add a DoseBatch of doses in one linear pass over the queue: the
+        batch is sorted latest first on its own, and each of its doses
+        goes in at a position found by binary search, ahead of queued
+        doses due at the same time, as push() would put it.
+        """
+        doses = sort_latest_first(doses)
+        queued = self.doses
+        if not len(queued):
+            self.doses = DoseBatch(doses.when[:], doses.entered[:], doses.level[:])
+            return
+        merged = DoseBatch()
+        start = 0
+        for i, when in enumerate(doses.when):
+            cut = first_at_or_before(queued.when, when)  # never before start: doses is latest first
+            merged.extend(queued[start:cut])
+            merged.append(doses[i])
+            start = cut
+        merged.extend(queued[start:])
+        self.doses = merged
+
+    def pop_due(self, now):
+        """
+        Remove and return every dose with when <= now
+        :param now: epoch seconds
+        :return: a DoseBatch, earliest first
+        """
+        cut = first_at_or_before(self.doses.when, now)
+        due = self.doses[cut:]
+        due.reverse()
+        del self.doses[cut:]
+        return due
+
+    def __len__(self):
+        return len(self.doses)
+
+    def __iter__(self):
+        """Yield pending doses, earliest first"""
+        return reversed(list(self.doses))
+
+    def __reversed__(self):
+        """Yield pending doses, latest first"""
+        return iter(self.doses)
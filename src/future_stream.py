@@ -0,0 +1,180 @@
+# file: src/future_stream.py
+# created: 2026-10-16
+"""
+Incremental reading of the future .json file.
+
+The file is a JSON array of flat objects, written latest
+'when_to_process' first, so the doses that are due form its suffix.
+find_first_due() locates that suffix by binary search over character
+offsets, decoding O(log n) entries; iter_entries() then decodes the
+suffix one entry at a time from a bounded buffer. The not-yet-due
+prefix need never be decoded at all.
+
+Entries hold only numbers and timestamp strings, so a '{' in the file
+always starts an entry. The file is ASCII (json.dump escapes anything
+else), so character offsets are also byte offsets.
+"""
+import json
+import os
+
+from src.doses import DoseBatch
+from src.timestamps import parse_epoch
+
+CHUNK_SIZE = 1 << 16
+PROBE_SIZE = 512  # enough to hold one entry with room to spare
+WHITESPACE = ' \t\n\r'
+
+_decoder = json.JSONDecoder()
+
+
+def array_bounds(infile):
+    """
+    :return: (first, end): the offset just past the opening '[' and
+             the offset of the closing ']'
+    :raises json.JSONDecodeError: if the file is not a JSON array
+    """
+    infile.seek(0)
+    head = infile.read(PROBE_SIZE)
+    stripped = head.lstrip(WHITESPACE)
+    if not stripped.startswith('['):
+        raise json.JSONDecodeError('Expecting a JSON array', head, len(head) - len(stripped))
+    first = len(head) - len(stripped) + 1
+
+    size = infile.seek(0, os.SEEK_END)
+    tail_start = max(first, size - PROBE_SIZE)
+    infile.seek(tail_start)
+    tail = infile.read()
+    stripped = tail.rstrip(WHITESPACE)
+    if not stripped.endswith(']'):
+        raise json.JSONDecodeError('Expecting a closing ]', tail, len(stripped))
+    return first, tail_start + len(stripped) - 1
+
+
+def decode_at(infile, start):
+    """
+    Decode the entry whose '{' is at offset start
+    :return: (entry, end), where end is the offset just past its '}'
+    """
+    size = PROBE_SIZE
+    while True:
+        infile.seek(start)
+        text = infile.read(size)
+        try:
+            entry, length = _decoder.raw_decode(text)
+        except json.JSONDecodeError:
+            if len(text) < size:  # hit EOF; the entry really is malformed
+                raise
+            size *= 2
+            continue
+        return entry, start + length
+
+
+def entry_at_or_after(infile, pos, end):
+    """
+    :return: (start, entry) for the first entry starting in [pos, end),
+             or (None, None) if there is none
+    """
+    while pos < end:
+        infile.seek(pos)
+        text = infile.read(min(PROBE_SIZE, end - pos))
+        brace = text.find('{')
+        if brace != -1:
+            start = pos + brace
+            return start, decode_at(infile, start)[0]
+        pos += len(text)
+    return None, None
+
+
+def find_first_due(infile, now, first, end):
+    """
+    Binary search for the first entry with when_to_process <= now
+    :param now: epoch seconds
+    :return: the offset of that entry's '{', or None if no entry is due
+    """
+    lo, hi = first, end
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start, entry = entry_at_or_after(infile, mid, end)
+        if start is None or parse_epoch(entry['when_to_process']) <= now:
+            hi = mid
+        else:
+            lo = start + 1
+    return entry_at_or_after(infile, lo, end)[0]
+
+
+def iter_entries(infile, start, end):
+    """
+    Decode the entries between offsets start and end one at a time
+    :return: a generator of (entry, entry_start, entry_end)
+    :raises json.JSONDecodeError: on anything but entries, commas and
+                                  whitespace between start and end
+    """
+    buf = ''
+    buf_start = start  # file offset of buf[0]
+    i = 0
+    at_eof = False
+    while True:
+        while i < len(buf) and buf[i] in WHITESPACE + ',':
+            i += 1
+        if buf_start + i >= end:
+            return
+        if i >= len(buf) or (buf[i] == '{' and buf.find('}', i) == -1 and not at_eof):
+            # keep at most one partial entry in memory
+            buf, buf_start, i = buf[i:], buf_start + i, 0
+            read_pos = buf_start + len(buf)
+            infile.seek(read_pos)
+            more = infile.read(min(CHUNK_SIZE, end - read_pos))
+            at_eof = not more
+            buf += more
+            if not buf:
+                return
+            continue
+        if buf[i] != '{':
+            raise json.JSONDecodeError('Expecting an entry', buf, i)
+        entry, entry_end = _decoder.raw_decode(buf, i)
+        yield entry, buf_start + i, buf_start + entry_end
+        i = entry_end
+
+
+def read_doses(infile, start, end):
+    """:return: a DoseBatch of the entries between offsets start and end"""
+    doses = DoseBatch()
+    for entry, __, __ in iter_entries(infile, start, end):
+        doses.when.append(parse_epoch(entry['when_to_process']))
+        doses.entered.append(parse_epoch(entry['time_entered']))
+        doses.level.append(entry['level'])
+    return doses
+
+
+def last_when(infile, first, pos):
+    """:return: when_to_process of the last entry in [first, pos), or None"""
+    while pos > first:
+        window_start = max(first, pos - PROBE_SIZE)
+        infile.seek(window_start)
+        brace = infile.read(pos - window_start).rfind('{')
+        if brace != -1:
+            return parse_epoch(decode_at(infile, window_start + brace)[0]['when_to_process'])
+        pos = window_start
+    return None
+
+
+def last_entry_end(infile, first, pos):
+    """:return: the offset just past the last '}' in [first, pos), or None"""
+    while pos > first:
+        window_start = max(first, pos - PROBE_SIZE)
+        infile.seek(window_start)
+        brace = infile.read(pos - window_start).rfind('}')
+        if brace != -1:
+            return window_start + brace + 1
+        pos = window_start
+    return None
+
+
+def close_array_at(outfile, pos):
+    """
+    Truncate the file just after the entry ending at pos and close the
+    array there, leaving every earlier entry untouched on disk
+    """
+    outfile.seek(pos)
+    outfile.write('\n]')
+    outfile.truncate()
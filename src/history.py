@@ -0,0 +1,128 @@
+# file: src/history.py
+# created: 2026-10-16
+"""
+Re-derive the level from the dose history in the log, for when a
+profile's half-life changes.
+
+Every dose added to the level is logged with its undecayed amount
+and how long it had been decaying, and every continuously absorbed
+drink with its absorption half-life, so the log holds each dose's
+amount and start time. The level at any time, under any half-life,
+is then one vectorized sum over them, with no run-by-run replay. The
+log is started afresh with the stored level, so it holds every dose
+the level is made of. The gut amounts are rebuilt from the logged
+drinks as well, since the level already counts what left the gut.
+"""
+from array import array
+from datetime import datetime
+import logging
+import math
+import re
+
+from src import kinetics
+from src.decay import decay_factors, np
+from src.kinetics import bateman
+from src.timestamps import format_datetime, parse_epoch, to_epoch
+
+# see CaffeineMonitor.write_log() and .add_beverage()
+DOSE_RE = re.compile(r'mg added \((-?[0-9.]+) mg, decayed (-?[0-9.]+) mins\): level is \S+ '
+                     r'at ([0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2})$', re.MULTILINE)
+DRINK_RE = re.compile(r'^INFO: (-?[0-9.]+) mg of \S+ absorbing \(half-life ([0-9.]+) mins, [^)]* over '
+                      r'(-?[0-9]+) mins\): level is \S+ at ([0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2})$',
+                      re.MULTILINE)
+
+
+def read_doses(text):
+    """
+    :param text: log lines, joined by newlines
+    :return: (starts, amounts): array('q') of the epoch seconds at which
+             each logged dose began to decay, and array('d') of its mg
+    """
+    starts, amounts = array('q'), array('d')
+    for mg, mins, time in DOSE_RE.findall(text):
+        starts.append(parse_epoch(time) - round(float(mins) * 60))
+        amounts.append(float(mg))
+    return starts, amounts
+
+
+def read_drinks(text):
+    """
+    :param text: log lines, joined by newlines
+    :return: [(epoch seconds drunk, mg, absorption half-life in minutes)]
+             for every continuously absorbed drink
+    """
+    return [(parse_epoch(time) - int(mins) * 60, float(mg), float(half_life))
+            for mg, half_life, mins, time in DRINK_RE.findall(text)]
+
+
+def history_level(lines, now, half_life):
+    """
+    :param lines: the log, oldest line first
+    :param now: epoch seconds, no earlier than the last logged dose
+    :param half_life: the elimination half-life, in minutes
+    :return: the level at now of every dose in lines
+    """
+    text = '\n'.join(lines)
+    starts, amounts = read_doses(text)
+    if np is not None:
+        minutes = (now - np.frombuffer(starts, dtype=np.int64)) / 60
+        level = float(np.frombuffer(amounts, dtype=np.float64) @ decay_factors(minutes, half_life))
+    else:
+        minutes = array('d', [(now - start) / 60 for start in starts])
+        level = sum(amount * factor for amount, factor in zip(amounts, decay_factors(minutes, half_life)))
+    for drunk, mg, absorption_half_life in read_drinks(text):
+        level += bateman(mg, absorption_half_life, half_life, (now - drunk) / 60)[0]
+    return level
+
+
+def gut_amounts(drinks, now):
+    """
+    :param drinks: as read_drinks() returns them
+    :param now: epoch seconds, no earlier than the last drink
+    :return: (gut, rest): {str(absorption half-life in seconds): mg} of
+             what is still in the gut at now, as kinetics keeps it, and
+             the mg of the amounts too small to keep there
+    """
+    gut = {}
+    for drunk, mg, absorption_half_life in drinks:
+        key = str(round(absorption_half_life * 60))
+        left = mg * math.exp(-kinetics.rate(absorption_half_life) * (now - drunk) / 60)
+        gut[key] = gut.get(key, 0.0) + left
+    rest = sum(amount for amount in gut.values() if amount < kinetics.GUT_EPSILON)
+    return {key: amount for key, amount in gut.items() if amount >= kinetics.GUT_EPSILON}, rest
+
+
+def recompute(storage, half_life):
+    """
+    Replace the stored level, and the gut amounts, with those the logged
+    dose history gives under half_life; pending doses are kept as they are
+    :return: (old level, new level), both at now, or None if no level is
+             stored; the old level is the stored one carried to now, as
+             a run would carry it
+    Called by: caffeine_monitor.py
+    """
+    now = datetime.today().replace(microsecond=0)
+    state = storage.read_state()
+    if not state:
+        return None
+    lines = storage.read_history(storage.read_log()[2])
+    level = history_level(lines, to_epoch(now), half_life)
+    gut, rest = gut_amounts(read_drinks('\n'.join(lines)), to_epoch(now))
+
+    queue = storage.read_future(to_epoch(now))
+    storage.load_pending(queue)
+    storage.write_future(queue)
+    minutes = (to_epoch(now) - parse_epoch(state['time'])) / 60
+    old_state = dict(state, level=state['level'] * pow(0.5, minutes / half_life))
+    kinetics.advance(old_state, minutes, half_life)
+    old_level = old_state['level']
+    level += rest
+    state['level'] = level
+    state['time'] = format_datetime(now)
+    state.pop(kinetics.ABSORBING, None)
+    if gut:
+        state[kinetics.ABSORBING] = gut
+    logging.info(f'level recomputed with a half-life of {half_life:g} mins: '
+                 f'{round(old_level, 1)} mg is now {round(level, 1)} mg at {state["time"]}')
+    storage.write_state(state)
+    return old_level, level
@@ -0,0 +1,91 @@
+# file: src/kinetics.py
+# created: 2026-10-16
+"""
+Continuous absorption, evaluated with the Bateman equation.
+
+A drink absorbed continuously is not split into pending doses. Its
+caffeine sits in the gut, which empties into the blood at the rate
+set by the beverage's absorption half-life; the blood is eliminated
+at the rate set by CaffeineMonitor.half_life. From a gut amount G and
+rate constants ka (absorption) and ke (elimination), t minutes on:
+    gut:   G * exp(-ka * t)
+    blood: G * ka / (ka - ke) * (exp(-ke * t) - exp(-ka * t))
+
+Drinks that share an absorption half-life share one gut amount, kept
+in the state as state['absorbing'] = {str(half-life in seconds): mg}.
+"""
+import math
+
+ABSORBING = 'absorbing'
+GUT_EPSILON = 0.05  # mg; a smaller gut amount is moved to the blood at once
+
+
+def rate(half_life):
+    """:return: the rate constant, per minute, for a half-life in minutes"""
+    return math.log(2) / half_life
+
+
+def bateman(gut, absorption_half_life, half_life, minutes, exp=math.exp):
+    """
+    :param gut: mg in the gut
+    :param absorption_half_life: minutes
+    :param half_life: the elimination half-life, in minutes
+    :param minutes: minutes elapsed; an ndarray of them if exp is np.exp
+    :return: (mg absorbed into the blood and not yet eliminated, mg
+             left in the gut), minutes later
+    """
+    ka, ke = rate(absorption_half_life), rate(half_life)
+    left = gut * exp(-ka * minutes)
+    if math.isclose(ka, ke):
+        return gut * ke * minutes * exp(-ke * minutes), left
+    return gut * ka / (ka - ke) * (exp(-ke * minutes) - exp(-ka * minutes)), left
+
+
+def advance(state, minutes, half_life):
+    """
+    Move state's gut amounts on by minutes: add what reaches the blood,
+    less what is eliminated meanwhile, to state['level']. Decaying the
+    level already in the blood is left to the caller.
+    Called by: CaffeineMonitor.decay_prev_level()
+    """
+    if not state.get(ABSORBING):
+        return
+    gut = state[ABSORBING] = dict(state[ABSORBING])  # the stored state may share the old one
+    for key, amount in list(gut.items()):
+        absorbed, left = bateman(amount, int(key) / 60, half_life, minutes)
+        state['level'] += absorbed
+        if left < GUT_EPSILON:
+            state['level'] += left
+            del gut[key]
+        else:
+            gut[key] = left
+    if not gut:
+        del state[ABSORBING]
+
+
+def add_drink(state, mg, absorption_half_life, half_life, minutes_ago):
+    """
+    Add mg drunk minutes_ago to state: the part already absorbed to
+    the level, the rest to the gut
+    :raises ValueError: if minutes_ago is negative
+    :return: the mg added to the level
+    Called by: BatemanProfile.add()
+    """
+    if minutes_ago < 0:
+        raise ValueError('A continuously absorbed drink cannot be entered in advance')
+    absorbed, left = bateman(float(mg), absorption_half_life, half_life, minutes_ago)
+    state['level'] += absorbed
+    key = str(round(absorption_half_life * 60))
+    gut = state[ABSORBING] = dict(state.get(ABSORBING, {}))
+    gut[key] = gut.get(key, 0.0) + left
+    return absorbed
+
+
+def projected_blood(gut, half_life, minutes, exp=math.exp):
+    """
+    :param gut: state['absorbing'], or None
+    :param minutes: minutes elapsed; an ndarray of them if exp is np.exp
+    :return: the mg the gut adds to the blood, minutes later
+    Called by: decay.projected_level(), decay.level_curve(), MonitorService
+    """
+    return sum(bateman(amount, int(key) / 60, half_life, minutes, exp)[0] for key, amount in (gut or {}).items())
@@ -0,0 +1,55 @@
+# file: src/locking.py
+# created: 2026-10-16
+"""
+Cross-process locking with fcntl.flock(), so that overlapping runs
+take turns at the read-modify-write cycle instead of losing doses
+"""
+from contextlib import contextmanager
+import fcntl
+import time
+
+LOCK_TIMEOUT = 10.0  # seconds
+POLL_INTERVAL = 0.05
+
+
+class LockTimeout(Exception):
+    pass
+
+
+@contextmanager
+def exclusive_lock(lock_filename, timeout=LOCK_TIMEOUT):
+    """
+    Hold an exclusive lock on lock_filename, which is created if need be
+    :raises LockTimeout: if another process holds it for timeout seconds
+    """
+    with held_lock(lock_filename, fcntl.LOCK_EX, timeout):
+        yield
+
+
+@contextmanager
+def shared_lock(lock_filename, timeout=LOCK_TIMEOUT):
+    """
+    Hold a shared lock on lock_filename, alongside other readers
+    :raises LockTimeout: if a writer holds it for timeout seconds
+    Called by: quick_level.py
+    """
+    with held_lock(lock_filename, fcntl.LOCK_SH, timeout):
+        yield
+
+
+@contextmanager
+def held_lock(lock_filename, operation, timeout):
+    with open(lock_filename, 'a') as lock_file:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f'{lock_filename} is held by another process') from None
+                time.sleep(POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,143 @@
+# file: src/log_reader.py
+# created: 2026-10-16
+"""
+Read the first line, last lines and line count of a log file
+without scanning the whole file
+"""
+import os
+
+INDEX_SUFFIX = '.idx'
+BLOCK_SIZE = 4096
+
+
+def index_filename(log_filename):
+    return f'{log_filename}{INDEX_SUFFIX}'
+
+
+def read_first_line(infile):
+    """
+    Return the first non-blank line of a binary file, stripped.
+    Only the head of the file is read.
+    """
+    infile.seek(0)
+    for raw_line in infile:
+        line = raw_line.decode().strip()
+        if line:
+            return line
+    return ''
+
+
+def read_last_line(infile):
+    """
+    Return the last line of a binary file, stripped, by reading
+    backwards from EOF one block at a time.
+    """
+    return (read_last_lines(infile, 1) or [''])[0]
+
+
+def read_last_lines(infile, n):
+    """
+    Return the last n lines of a binary file, stripped, oldest first.
+    Only the blocks holding those lines are read, backwards from EOF.
+    """
+    end = infile.seek(0, os.SEEK_END)
+    if end == 0 or n <= 0:
+        return []
+    infile.seek(end - 1)
+    if infile.read(1) == b'\n':
+        end -= 1  # ignore the newline that terminates the last line
+
+    tail = b''
+    newlines = 0
+    pos = end
+    while pos > 0 and newlines < n:
+        step = min(BLOCK_SIZE, pos)
+        pos -= step
+        infile.seek(pos)
+        block = infile.read(step)
+        newlines += block.count(b'\n')
+        tail = block + tail  # tail is always infile[pos:end]
+    return [line.decode().strip() for line in tail.split(b'\n')[-n:]]
+
+
+def read_log_tail(log_filename, n):
+    """:return: the last n lines of the log, oldest first"""
+    with open(log_filename, 'rb') as infile:
+        return read_last_lines(infile, n)
+
+
+def count_newlines(infile, start, end):
+    """Count b'\\n' bytes in infile between offsets start and end"""
+    infile.seek(start)
+    count = 0
+    remaining = end - start
+    while remaining > 0:
+        block = infile.read(min(BLOCK_SIZE * 16, remaining))
+        if not block:
+            break
+        count += block.count(b'\n')
+        remaining -= len(block)
+    return count
+
+
+def read_index(idx_filename):
+    """:return: (inode, size, newlines) from the sidecar, or None"""
+    try:
+        with open(idx_filename) as idx_file:
+            inode, size, newlines = (int(field) for field in idx_file.read().split())
+    except (OSError, ValueError):
+        return None
+    return inode, size, newlines
+
+
+def write_index(idx_filename, inode, size, newlines):
+    try:
+        with open(idx_filename, 'w') as idx_file:
+            idx_file.write(f'{inode} {size} {newlines}\n')
+    except OSError:
+        pass  # the index is only a cache; it is rebuilt on the next read
+
+
+def discard_index(log_filename):
+    try:
+        os.unlink(index_filename(log_filename))
+    except OSError:
+        pass
+
+
+def count_lines(infile, log_filename):
+    """
+    Return the number of lines in the log. The newline count is kept
+    in a sidecar index, so only bytes appended since the last call
+    are scanned.
+    """
+    stat = os.fstat(infile.fileno())
+    idx_filename = index_filename(log_filename)
+    index = read_index(idx_filename)
+
+    if index is not None and index[0] == stat.st_ino and index[1] <= stat.st_size:
+        __, indexed_size, newlines = index
+        newlines += count_newlines(infile, indexed_size, stat.st_size)
+    else:  # missing, stale, or the log was truncated or replaced
+        newlines = count_newlines(infile, 0, stat.st_size)
+
+    if index is None or index[1:] != (stat.st_size, newlines):
+        write_index(idx_filename, stat.st_ino, stat.st_size, newlines)
+
+    if stat.st_size:
+        infile.seek(stat.st_size - 1)
+        if infile.read(1) != b'\n':
+            newlines += 1  # last line has no terminating newline
+    return newlines
+
+
+def read_log_summary(log_filename):
+    """
+    :return: (first_line, last_line, num_lines), where last_line is ''
+             if the log holds fewer than two lines
+    """
+    with open(log_filename, 'rb') as infile:
+        num_lines = count_lines(infile, log_filename)
+        first_line = read_first_line(infile)
+        last_line = read_last_line(infile) if num_lines >= 2 else ''
+    return first_line, last_line, num_lines
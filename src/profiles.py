@@ -0,0 +1,210 @@
+# file: src/profiles.py
+# created: 2026-10-16
+"""
+Many profiles' levels and pending doses, resident in one process.
+
+ProfileEngine loads every profile from an SQLite database in three
+queries, answers level queries and dose additions for any profile in
+memory, and saves the profiles that changed in one transaction. The
+daemon and the service host one for the sqlite backend, through a
+ProfileResident for each request's profile.
+"""
+from argparse import Namespace
+from datetime import timedelta
+from itertools import groupby
+import logging
+
+from src import kinetics
+from src.caffeine_monitor import CaffeineMonitor
+from src.config import DEFAULT_PROFILE
+from src.daemon import ResidentMonitor
+from src.doses import DoseBatch
+from src.storage import MemoryStorage, SqliteLogHandler, SqliteStorage
+from src.timestamps import format_epoch, parse_epoch
+
+
+class ProfileEngine:
+    def __init__(self, connection, half_lives=None, default_profile=DEFAULT_PROFILE):
+        """
+        :param connection: a sqlite3.Connection to a database laid out
+                           by SqliteStorage
+        :param half_lives: {profile: half-life in minutes} for profiles
+                           that differ from CaffeineMonitor.half_life,
+                           or a config.HalfLives
+        :param default_profile: the profile of requests that name none
+        """
+        self.connection = connection
+        self.half_lives = half_lives or {}
+        self.default_profile = default_profile
+        self.connection.executescript(SqliteStorage.SCHEMA)
+        self.profiles = {}  # name -> MemoryStorage
+        self.current = default_profile  # whose run is writing log lines
+
+    def load(self):
+        """Read every profile's level and pending doses"""
+        states = {profile: {'time': format_epoch(time), 'level': level}
+                  for profile, time, level in self.connection.execute(
+                      'SELECT profile, time, level FROM state')}
+        for profile, half_life, amount in self.connection.execute(
+                'SELECT profile, half_life, amount FROM absorbing'):
+            if profile in states:
+                states[profile].setdefault(kinetics.ABSORBING, {})[str(half_life)] = amount
+        pending = {}
+        rows = self.connection.execute(
+            'SELECT profile, when_to_process, time_entered, level FROM pending '
+            'ORDER BY profile, when_to_process DESC')
+        for profile, group in groupby(rows, key=lambda row: row[0]):
+            doses = pending[profile] = DoseBatch()
+            for __, when, entered, level in group:
+                doses.when.append(when)
+                doses.entered.append(entered)
+                doses.level.append(level)
+        self.profiles = {profile: MemoryStorage(states.get(profile), pending.get(profile))
+                         for profile in states.keys() | pending.keys()}
+
+    def storage(self, profile):
+        """:return: the profile's MemoryStorage, created empty if it is new"""
+        if profile not in self.profiles:
+            self.profiles[profile] = MemoryStorage()
+        return self.profiles[profile]
+
+    def run(self, profile, mg=0, mins=0, bev='coffee'):
+        """
+        Bring the profile up to date, adding mg of bev consumed mins ago
+        :return: the CaffeineMonitor that did the work
+        """
+        storage = self.storage(profile)
+        self.current = profile
+        monitor = CaffeineMonitor(storage, not storage.state, self.args(profile, mg, mins, bev))
+        monitor.run()
+        return monitor
+
+    def args(self, profile, mg=0, mins=0, bev='coffee'):
+        """:return: the arguments for a CaffeineMonitor of profile's"""
+        return Namespace(mg=mg, mins=mins, bev=bev, half_life=self.half_life(profile))
+
+    def half_life(self, profile):
+        """:return: profile's half-life, in minutes"""
+        return self.half_lives.get(profile) or CaffeineMonitor.half_life
+
+    def for_profile(self, profile=None):
+        """
+        :return: a ProfileResident for profile, or for the default profile
+        Called by: MonitorServer, MonitorService
+        """
+        return ProfileResident(self, profile or self.default_profile)
+
+    def log_handler(self):
+        """:return: a logging.Handler that adds log lines to the log table, for the profile being run"""
+        handler = SqliteLogHandler(self)
+        handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        return handler
+
+    def write_log_line(self, line):
+        self.connection.execute('INSERT INTO log (profile, line) VALUES (?, ?)', (self.current, line))
+
+    def history(self, profile, n):
+        """:return: profile's last n log lines, oldest first"""
+        rows = self.connection.execute('SELECT line FROM log WHERE profile = ? ORDER BY id DESC LIMIT ?',
+                                       (profile, n)).fetchall()
+        return [line for line, in reversed(rows)]
+
+    def level(self, profile):
+        """:return: the profile's current level, in mg"""
+        return self.run(profile).data_dict['level']
+
+    def levels(self, profiles=None):
+        """:return: {profile: current level} for profiles, or for every loaded profile"""
+        return {profile: self.level(profile)
+                for profile in (self.profiles if profiles is None else profiles)}
+
+    def level_curves(self, start, end, step=timedelta(minutes=1), profiles=None):
+        """
+        :return: (times, {profile: levels}) for profiles, or for every
+                 loaded profile, sampled as CaffeineMonitor.level_curve()
+                 samples them; nothing is changed
+        """
+        curves = {}
+        times = None
+        for profile in (self.profiles if profiles is None else profiles):
+            monitor = CaffeineMonitor(self.storage(profile), False, self.args(profile))
+            times, curves[profile] = monitor.level_curve(start, end, step)
+        return times, curves
+
+    def add(self, profile, mg, mins=0, bev='coffee'):
+        """:return: the profile's level after adding the dose"""
+        return self.run(profile, mg, mins, bev).data_dict['level']
+
+    def add_many(self, doses):
+        """
+        :param doses: an iterable of (profile, mg, mins, bev)
+        :return: {profile: level after its last dose}
+        """
+        return {profile: self.add(profile, mg, mins, bev) for profile, mg, mins, bev in doses}
+
+    def save(self):
+        """Write back every profile that changed, in one transaction"""
+        dirty = [(profile, storage) for profile, storage in self.profiles.items() if storage.dirty]
+        if not dirty:
+            return
+        with self.connection:
+            self.connection.executemany('DELETE FROM pending WHERE profile = ?',
+                                        ((profile,) for profile, __ in dirty))
+            self.connection.executemany(
+                'INSERT INTO pending (profile, when_to_process, time_entered, level) VALUES (?, ?, ?, ?)',
+                ((profile, when, entered, level)
+                 for profile, storage in dirty
+                 for when, entered, level in zip(storage.queue.doses.when, storage.queue.doses.entered,
+                                                 storage.queue.doses.level)))
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO state (profile, time, level) VALUES (?, ?, ?)',
+                ((profile, parse_epoch(storage.state['time']), storage.state['level'])
+                 for profile, storage in dirty if storage.state))
+            self.connection.executemany('DELETE FROM absorbing WHERE profile = ?',
+                                        ((profile,) for profile, __ in dirty))
+            self.connection.executemany(
+                'INSERT INTO absorbing (profile, half_life, amount) VALUES (?, ?, ?)',
+                ((profile, int(key), amount)
+                 for profile, storage in dirty
+                 for key, amount in storage.state.get(kinetics.ABSORBING, {}).items()))
+        for __, storage in dirty:
+            storage.dirty = False
+
+
+class ProfileResident(ResidentMonitor):
+    """
+    One of a ProfileEngine's profiles, served as a ResidentMonitor
+    serves its backend's; saving it saves every profile that changed.
+
+    Only apply() and rollback() add a new profile to the engine: the
+    service saves in a worker thread, which iterates the engine's
+    profiles while level_at() queries go on being answered.
+    """
+    def __init__(self, engine, profile):
+        self.engine = engine
+        self.profile = profile
+
+    @property
+    def memory(self):
+        """The profile's MemoryStorage, or an empty one, not kept, if the profile is new"""
+        storage = self.engine.profiles.get(self.profile)
+        return MemoryStorage() if storage is None else storage
+
+    @memory.setter
+    def memory(self, storage):
+        self.engine.profiles[self.profile] = storage
+
+    @property
+    def half_life(self):
+        return self.engine.half_life(self.profile)
+
+    def apply(self, mg=0, mins=0, bev='coffee'):
+        self.engine.current = self.profile
+        self.engine.storage(self.profile)  # a new profile is kept from its first run
+        return super().apply(mg, mins, bev)
+
+    def save(self, now):
+        self.engine.save()
+
+    def history(self, n):
+        return self.engine.history(self.profile, n)
@@ -0,0 +1,151 @@
+# file: src/quick_level.py
+# created: 2026-10-16
+"""
+Fast path for a plain run, which only shows the level: a command line
+of nothing but -d or -q and -p NAME.
+
+It imports nothing beyond the standard library and a few small
+modules of this package: no argparse, logging, NumPy or storage
+backends. Under a shared lock, it reads the config and the .json file,
+and projects the stored level to now in closed form, as
+CaffeineMonitor.level_at() does. The .json file says when the next
+pending dose falls due; until then the projection is the stored level
+times one decay factor, and the future file is not opened. After it,
+only the due end of the future file is read. Nothing is written; the
+due doses are folded into the stored level by the next run that
+changes it.
+
+If a daemon holds the lock, which it does for as long as it serves,
+the query is sent to it on its socket instead. Anything else takes the
+full path: other arguments, a $CAFF_ENV that does not match, a first
+run, the journal or sqlite backend without a daemon, a commit to
+recover, or a lock held by a writer.
+"""
+from datetime import datetime
+import json
+import os
+
+from src import future_map, future_stream
+from src.config import DEFAULT_PROFILE, EnvironmentConfig, load_config, profile_name, read_half_life
+from src.doses import DoseBatch
+from src.kinetics import ABSORBING, projected_blood
+from src.locking import LockTimeout, shared_lock
+from src.timestamps import format_epoch, parse_epoch, to_epoch
+
+ENV_FLAGS = {'-d': 'devel', '--devel': 'devel', '-q': 'pytesting', '--pytesting': 'pytesting'}
+PROFILE_FLAGS = ('-p', '--profile')
+STAGED_SUFFIX = '.tmp'  # as storage.STAGED_SUFFIX and storage.NEXT_DUE, which are not imported here
+NEXT_DUE = 'next_due'
+
+
+def parse_argv(argv):
+    """
+    :param argv: the command line arguments
+    :return: (environment, profile) if argv only asks for the level,
+             else None
+    """
+    environment, profile = 'prod', DEFAULT_PROFILE
+    args = iter(argv)
+    for arg in args:
+        if arg in ENV_FLAGS and environment == 'prod':
+            environment = ENV_FLAGS[arg]
+        elif arg in PROFILE_FLAGS:
+            try:
+                profile = profile_name(next(args))
+            except (StopIteration, ValueError):
+                return None
+        else:
+            return None
+    return environment, profile
+
+
+def quick_level(argv):
+    """
+    :param argv: the command line arguments
+    :return: the level's description, as a full run prints it, or None
+             if the full path must be taken
+    Called by: caffeine_monitor.py
+    """
+    parsed = parse_argv(argv)
+    if parsed is None or os.environ.get('CAFF_ENV') != parsed[0]:
+        return None
+    environment, profile = parsed
+    config = load_config()
+    try:
+        env_config = EnvironmentConfig(config[environment])
+        socket_file = env_config.socket_file(env_config.file_profile(profile))
+        if env_config.storage != 'json':
+            return daemon_level(socket_file, profile)
+        json_filename = env_config.json_file(profile)
+        json_future_filename = env_config.json_file_future(profile)
+        lock_file = env_config.lock_file(profile)
+        half_life = read_half_life(config, profile)
+    except (KeyError, ValueError):
+        return None
+    if any(os.path.exists(fname + STAGED_SUFFIX) for fname in (json_filename, json_future_filename)):
+        return None
+    try:
+        with shared_lock(lock_file, timeout=0):
+            level, now = read_level(json_filename, json_future_filename, half_life,
+                                    to_epoch(datetime.today()))
+    except LockTimeout:
+        return daemon_level(socket_file, profile)
+    except (OSError, ValueError):  # json.JSONDecodeError is a ValueError
+        return None
+    return describe_level(level, format_epoch(now))
+
+
+def daemon_level(socket_file, profile):
+    """
+    :return: the level's description from the daemon serving on
+             socket_file, or None if none answers
+    """
+    from src.client import try_request
+    reply = try_request(socket_file, {'op': 'level', 'profile': profile})
+    return reply['message'] if reply is not None and reply['ok'] else None
+
+
+def read_level(json_filename, json_future_filename, half_life, now):
+    """
+    Project the stored level to now, as decay.projected_level() does,
+    with plain floats for the few doses that are due
+    :param now: epoch seconds
+    :return: (level, now)
+    :raises ValueError: if a file cannot be decoded, or now is earlier
+                        than the stored time
+    """
+    with open(json_filename) as infile:
+        state = json.load(infile)
+    since = parse_epoch(state['time'])
+    if now < since:
+        raise ValueError('The stored level is dated in the future')
+    if NEXT_DUE in state and (state[NEXT_DUE] is None or now < parse_epoch(state[NEXT_DUE])):
+        due = DoseBatch()  # nothing falls due by now
+    else:
+        due = read_due(json_future_filename, now)
+
+    minutes = (now - since) / 60
+    level = state['level'] * pow(0.5, minutes / half_life)
+    level += projected_blood(state.get(ABSORBING), half_life, minutes)
+    for when, amount in zip(reversed(due.when), reversed(due.level)):  # earliest first, in run()'s order
+        level += amount if when == now else round(amount * pow(0.5, (now - when) / 60 / half_life), 1)
+    return level, now
+
+
+def read_due(json_future_filename, now):
+    """:return: a DoseBatch of the doses due by now, latest first, decoding no others"""
+    with open(json_future_filename) as infile:
+        buf = future_map.map_file(infile)
+        source, reader = (infile, future_stream) if buf is None else (buf, future_map)
+        try:
+            first, end = reader.array_bounds(source)
+            due_start = reader.find_first_due(source, now, first, end)
+            return DoseBatch() if due_start is None else reader.read_doses(source, due_start, end)
+        finally:
+            if buf is not None:
+                buf.close()
+
+
+def describe_level(level, time):
+    """Called by: quick_level(), CaffeineMonitor.__str__(), MonitorService"""
+    return f'Caffeine level is {round(level, 1)} mg at time {time}'
@@ -0,0 +1,176 @@
+# file: src/service.py
+# created: 2026-10-16
+"""
+asyncio front end for a ResidentMonitor or a ProfileEngine, for many
+concurrent clients.
+
+It speaks the same line protocol as daemon.py on a Unix domain socket,
+so src/client.py works with either. Every change goes through a single
+writer task, which applies whatever requests have queued up in memory
+and then writes storage once. Level queries are answered from a
+snapshot of each profile's last level, decayed to the current time,
+until its next pending dose falls due; only then do they go to the
+writer.
+
+Storage is written from a worker thread, so snapshot and level_at
+replies carry on during a commit. Requests are only answered once
+their commit is done. If a request fails, it gets an error reply and
+the level is left as it was. If the commit fails, every request in
+the batch gets the error and the level is rolled back.
+"""
+import asyncio
+from datetime import datetime
+import json
+import os
+
+from src import kinetics
+from src.caffeine_monitor import describe_level
+from src.daemon import error_reply, level_at_reply, level_reply, read_request
+from src.timestamps import format_datetime, parse_epoch, to_epoch
+
+BACKLOG = 1024  # pending connections; asyncio's default of 100 overflows under bursts
+
+
+class MonitorService:
+    def __init__(self, resident):
+        """:param resident: a daemon.ResidentMonitor, or a profiles.ProfileEngine"""
+        self.resident = resident
+        self.requests = asyncio.Queue()  # (resident, params, future) for the writer task
+        # profile -> (level, epoch seconds, next_due or None, gut amounts or None)
+        self.snapshots = {}
+        self.backend_lock = asyncio.Lock()  # one worker thread uses the backend at a time
+        self.num_saves = 0
+
+    def take_snapshot(self, resident, monitor):
+        state = monitor.data_dict
+        gut = state.get(kinetics.ABSORBING)
+        self.snapshots[resident.profile] = (state['level'], parse_epoch(state['time']), resident.next_due(),
+                                            dict(gut) if gut else None)
+
+    def read_snapshot(self, resident, now):
+        """:return: a level reply for datetime now, or None if resident's snapshot is stale"""
+        snapshot = self.snapshots.get(resident.profile)
+        if snapshot is None:
+            return None
+        level, time, next_due, gut = snapshot
+        seconds = to_epoch(now)
+        if next_due is not None and seconds >= next_due:
+            return None
+        half_life = resident.half_life
+        level *= pow(0.5, (seconds - time) / 60 / half_life)
+        if gut:
+            level += kinetics.projected_blood(gut, half_life, (seconds - time) / 60)
+        time_str = format_datetime(now)
+        return {'ok': True, 'level': level, 'time': time_str, 'message': describe_level(level, time_str)}
+
+    async def writer(self):
+        """Apply queued requests in memory, then write storage once for all of them"""
+        while True:
+            batch = [await self.requests.get()]
+            while not self.requests.empty():
+                batch.append(self.requests.get_nowait())
+            before = {}  # profile -> (resident, checkpoint before the batch)
+            replies = []
+            monitors = {}  # profile -> (resident, its last monitor)
+            changed = {}  # profile -> (resident, time of its last change)
+            for resident, params, future in batch:
+                checkpoint = resident.checkpoint()
+                before.setdefault(resident.profile, (resident, checkpoint))
+                try:
+                    monitor, changed_now = resident.apply(**params)
+                except Exception as e:  # a bad request must not stop the writer
+                    resident.rollback(checkpoint)
+                    replies.append((future, error_reply(e)))
+                    continue
+                monitors[resident.profile] = (resident, monitor)
+                if changed_now:
+                    changed[resident.profile] = (resident, monitor.current_time)
+                replies.append((future, level_reply(monitor)))
+            if changed:
+                try:
+                    async with self.backend_lock:  # a ProfileEngine saves every profile at the first
+                        for resident, now in changed.values():
+                            await asyncio.to_thread(resident.save, now)
+                except Exception as e:
+                    for resident, checkpoint in before.values():
+                        resident.rollback(checkpoint)
+                        self.snapshots.pop(resident.profile, None)
+                    replies = [(future, error_reply(e)) for future, __ in replies]
+                    monitors = {}
+                else:
+                    self.num_saves += 1
+            for resident, monitor in monitors.values():
+                self.take_snapshot(resident, monitor)
+            for future, reply in replies:
+                if not future.done():  # its client may have gone
+                    future.set_result(reply)
+
+    async def submit(self, resident, params):
+        future = asyncio.get_running_loop().create_future()
+        await self.requests.put((resident, params, future))
+        return await future
+
+    async def dispatch(self, line):
+        """:return: the reply to one request line, as a dict"""
+        try:
+            op, profile, params = read_request(line)
+            resident = self.resident.for_profile(profile)
+            if op == 'history':
+                async with self.backend_lock:
+                    lines = await asyncio.to_thread(resident.history, **params)
+                return {'ok': True, 'lines': lines}
+            if op == 'level_at':  # read only, from memory: nothing awaits between reading and replying
+                return level_at_reply(resident.level_at(**params), params['when'])
+        except Exception as e:  # reply to every request, whatever went wrong with it
+            return error_reply(e)
+        if op == 'level':
+            reply = self.read_snapshot(resident, datetime.today())
+            if reply is not None:
+                return reply
+        return await self.submit(resident, params)
+
+    async def handle_client(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                reply = await self.dispatch(line)
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_file, started=None):
+        """
+        Serve on socket_file until cancelled
+        :param started: an asyncio.Event to set once the socket is listening
+        """
+        if os.path.exists(socket_file):
+            os.unlink(socket_file)
+        writer_task = asyncio.create_task(self.writer())
+        server = await asyncio.start_unix_server(self.handle_client, socket_file, backlog=BACKLOG)
+        os.chmod(socket_file, 0o600)
+        if started is not None:
+            started.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer_task.cancel()
+            try:
+                os.unlink(socket_file)
+            except OSError:
+                pass
+
+
+def serve(resident, socket_file):
+    """
+    Serve requests until interrupted
+    :param resident: a daemon.ResidentMonitor, or a profiles.ProfileEngine
+    Called by: caffeine_monitor.py
+    """
+    print(f'Serving on {socket_file}')
+    try:
+        asyncio.run(MonitorService(resident).serve(socket_file))
+    except KeyboardInterrupt:
+        pass
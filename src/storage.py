@@ -0,0 +1,740 @@
+# file: src/storage.py
+# created: 2026-10-16
+"""
+Storage backends for CaffeineMonitor.
+
+A backend holds the caffeine level, the pending doses and the log.
+It provides:
+    read_log() -> (first_line, last_line, num_lines)
+    read_history(n) -> the last n log lines, oldest first
+    read_state() -> {'time': str, 'level': float}, with 'absorbing' gut
+                    amounts if any (see kinetics.py), or {} if none is stored
+    read_future(now) -> a FutureQueue holding at least every dose due by now
+    load_pending(queue) -> merge into queue any pending doses read_future() skipped
+    write_future(queue)
+    write_state(data_dict)
+
+JsonStorage keeps the original .json files, JournalStorage an
+append-only binary journal and SqliteStorage an SQLite database.
+MemoryStorage keeps a profile resident for ProfileEngine.
+"""
+from collections import Counter
+import io
+import json
+import logging
+import math
+import os
+import struct
+
+from src import future_map, future_stream, kinetics
+from src.codec import STDLIB_CODEC
+from src.doses import Dose, DoseBatch
+from src.future_queue import FutureQueue
+from src.future_stream import last_entry_end
+from src.log_reader import read_log_summary, read_log_tail
+from src.timestamps import format_epoch, parse_epoch
+
+STAGED_SUFFIX = '.tmp'
+NEXT_DUE = 'next_due'  # in the .json file: when the earliest pending dose falls due, or null if none is pending
+INDENTED_FORMAT = {'indent': 4}
+COMPACT_FORMAT = {'separators': (',', ':')}
+
+
+class JsonStorage:
+    """
+    The original layout: a .log file, a .json file holding the level
+    and a future .json file holding the pending doses, latest first.
+
+    The .json file also holds a snapshot of when the earliest pending
+    dose falls due, written with the level; until then, the level can
+    be read without the future file (see quick_level.py)
+    """
+    def __init__(self, logfile, iofile, iofile_future, compact=False, codec=STDLIB_CODEC):
+        """
+        :param logfile: an opened file handle
+        :param iofile: an opened file handle
+        :param iofile_future: an opened file handle
+        :param compact: write the future file without indentation
+        :param codec: reads and writes both files (see codec.py)
+        """
+        self.logfile = logfile
+        self.iofile = iofile
+        self.iofile_future = iofile_future
+        self.codec = codec
+        self.future_format = COMPACT_FORMAT if compact else INDENTED_FORMAT
+        self.pending_on_disk = None  # (start, stop) offsets of undecoded entries in iofile_future
+        self.future_map = None  # read-only mmap of iofile_future, while it is being read
+        self.next_pending = None  # epoch seconds of the earliest dose read_future() left on disk, or None
+        self.next_due = None  # epoch seconds of the earliest dose write_future() wrote, or None
+        self.future_written = False  # whether next_due is known to write_state()
+        self.stored_snapshot = {}  # NEXT_DUE as read_state() found it, if it did
+
+    def read_log(self):
+        return read_log_summary(self.logfile.name)
+
+    def read_history(self, n):
+        return read_log_tail(self.logfile.name, n)
+
+    def read_state(self):
+        self.iofile.seek(0)
+        state = self.codec.load(self.iofile)
+        self.stored_snapshot = {NEXT_DUE: state.pop(NEXT_DUE)} if NEXT_DUE in state else {}
+        return state
+
+    def read_future(self, now):
+        """
+        Read the doses due by now (epoch seconds) from the future file,
+        through an mmap where the file can be mapped.
+        Entries not yet due are left undecoded on disk.
+        """
+        self.pending_on_disk = None
+        self.next_pending = None
+        try:
+            source, reader = self.future_source()
+            first, end = reader.array_bounds(source)
+            due_start = reader.find_first_due(source, now, first, end)
+            if due_start is None:
+                due_start = end
+            queue = FutureQueue(self.read_doses(source, reader, due_start, end))
+            if reader.last_entry_end(source, first, due_start) is not None:
+                self.pending_on_disk = (first, due_start)
+                self.next_pending = reader.last_when(source, first, due_start)
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON data in {self.iofile_future.name}: {e}")
+            queue = FutureQueue()  # Initialize an empty queue if JSON data is invalid
+        except FileNotFoundError as e:
+            print(f"File not found: {self.iofile_future.name}")
+            queue = FutureQueue()  # Initialize an empty queue if the file doesn't exist
+        return queue
+
+    def future_source(self):
+        """
+        :return: (source, reader): the mmap of the future file and the
+                 future_map module, or the file itself and future_stream
+        """
+        if self.future_map is None:
+            self.future_map = future_map.map_file(self.iofile_future)
+        if self.future_map is None:
+            return self.iofile_future, future_stream
+        return self.future_map, future_map
+
+    def read_doses(self, source, reader, start, stop):
+        """
+        :return: a DoseBatch of the entries between offsets start and
+                 stop, decoded through self.codec from an mmap; a file
+                 that cannot be mapped is decoded incrementally instead
+        """
+        if reader is future_map:
+            return future_map.read_doses(source, start, stop, self.codec)
+        return future_stream.read_doses(source, start, stop)
+
+    def close_future_map(self):
+        if self.future_map is not None:
+            self.future_map.close()
+            self.future_map = None
+
+    def load_pending(self, queue):
+        """Decode the not-yet-due entries read_future() left on disk"""
+        if self.pending_on_disk is None:
+            return
+        start, stop = self.pending_on_disk
+        source, reader = self.future_source()
+        queue.merge(self.read_doses(source, reader, start, stop))
+        self.pending_on_disk = None
+
+    def write_future(self, queue):
+        check_finite('dose', queue.doses.level)
+        if self.pending_on_disk is not None:
+            # Keep the entries read_future() left on disk as they are,
+            # and rewrite the file only from where queue's doses go in
+            self.close_future_map()
+            cut, tail = self.splice_pending(queue)
+            self.iofile_future.seek(cut)
+            self.iofile_future.write(tail)
+            self.iofile_future.truncate()
+            self.iofile_future.flush()
+            return
+        self.load_pending(queue)
+        self.close_future_map()
+        self.set_next_due(earliest_when(queue))
+
+        self.iofile_future.seek(0)
+        self.iofile_future.truncate()
+        self.codec.dump(future_entries(queue), self.iofile_future, **self.future_format)
+        self.iofile_future.flush()  # a resident monitor reads it back through mmap
+
+    def splice_pending(self, queue):
+        """
+        Splice the entries for queue's doses in among the entries
+        read_future() left on disk, without decoding those: entries
+        pending later than every dose in queue stay where they are,
+        and only those from the first insertion point on are read back.
+        :return: (cut, tail): the offset of the future file from which
+                 it changes, and the text to write from there on,
+                 closing the array
+        """
+        start, stop = self.pending_on_disk
+        infile = self.iofile_future
+        end = last_entry_end(infile, start, stop)
+        gap, added = self.encode_entries(queue)
+        earliest = earliest_when(queue)
+        self.set_next_due(self.next_pending if earliest is None else min(earliest, self.next_pending))
+        self.pending_on_disk = None
+        if not added:
+            return end, '\n]'
+        whens = [when for when, level in zip(queue.doses.when, queue.doses.level) if level != 0]
+        cut = future_stream.find_first_due(infile, whens[0], start, end)
+        if cut is None:
+            cut = end
+        infile.seek(cut)
+        text = infile.read(end - cut)
+        old = io.StringIO(text)
+        parts, pos = [], 0
+        for when, entry in zip(whens, added):
+            # ahead of entries due at the same time, as FutureQueue.merge() puts it
+            at = future_stream.find_first_due(old, when, pos, len(text))
+            if at is None:
+                parts += [text[pos:], ',', gap, entry]
+                pos = len(text)
+            else:
+                parts += [text[pos:at], entry, ',', gap]
+                pos = at
+        parts += [text[pos:], '\n]']
+        return cut, ''.join(parts)
+
+    def encode_entries(self, queue):
+        """
+        :return: (gap, entries): the whitespace the codec writes before
+                 an entry, and the text of each of queue's entries
+                 (see future_entries()), latest first, as the codec
+                 writes them in the future file's layout
+        """
+        out = io.StringIO()
+        self.codec.dump(future_entries(queue), out, **self.future_format)
+        text = out.getvalue()
+        first = text.find('{')
+        if first == -1:
+            return '', []
+        entries, pos = [], first
+        while pos != -1:
+            stop = text.index('}', pos) + 1  # entries hold no nested objects
+            entries.append(text[pos:stop])
+            pos = text.find('{', stop)
+        return text[text.index('[') + 1:first], entries
+
+    def set_next_due(self, when):
+        self.next_due = when
+        self.future_written = True
+
+    def snapshot(self, data_dict):
+        """
+        :return: data_dict, with next_due as write_future() has just set
+                 it, else as read_state() found it: the future file is
+                 unchanged if it was not written
+        :raises ValueError: if the level or an amount absorbing is not finite
+        """
+        check_finite('level', [data_dict['level'], *data_dict.get(kinetics.ABSORBING, {}).values()])
+        if not self.future_written:
+            return dict(data_dict, **self.stored_snapshot)
+        self.future_written = False
+        return dict(data_dict, **{NEXT_DUE: None if self.next_due is None else format_epoch(self.next_due)})
+
+    def write_state(self, data_dict):
+        state = self.snapshot(data_dict)
+        self.iofile.seek(0)
+        self.iofile.truncate(0)
+        self.codec.dump(state, self.iofile)
+        self.iofile.flush()
+
+
+def check_finite(name, values):
+    """
+    :raises ValueError: if any of values is NaN or infinite; some codecs
+                        would write it as null, which cannot be read back
+    """
+    if not all(map(math.isfinite, values)):
+        raise ValueError(f'Refusing to store a {name} that is not a finite number')
+
+
+def future_entries(queue):
+    """:return: the future file's entries for queue's doses, latest first"""
+    # Convert epoch seconds to formatted strings, latest first
+    doses = queue.doses
+    return [
+        {
+            'when_to_process': format_epoch(when),
+            'time_entered': format_epoch(entered),
+            'level': level
+        }
+        for when, entered, level in zip(doses.when, doses.entered, doses.level)
+        if level != 0
+    ]
+
+
+def earliest_when(queue):
+    """:return: when the earliest dose future_entries() keeps falls due, or None"""
+    doses = queue.doses
+    return next((when for when, level in zip(reversed(doses.when), reversed(doses.level)) if level != 0), None)
+
+
+class AtomicJsonStorage(JsonStorage):
+    """
+    JsonStorage whose writes are staged in temporary files and made
+    visible by os.replace(): the future file first, then the state
+    file. A leftover staged future file therefore means the renames
+    had not begun, and a leftover staged state file on its own means
+    only the last rename was lost; recover() sorts out either case
+    before the files are opened.
+    """
+    COPY_SIZE = 1 << 16
+
+    def __init__(self, logfile, iofile, iofile_future, compact=False, codec=STDLIB_CODEC):
+        super().__init__(logfile, iofile, iofile_future, compact, codec)
+        self.future_staged = False
+
+    @staticmethod
+    def recover(json_filename, json_future_filename):
+        """
+        Finish or undo a commit cut short by a crash
+        Called by: caffeine_monitor.py, before the files are opened
+        """
+        state_tmp, future_tmp = staged_filename(json_filename), staged_filename(json_future_filename)
+        if not os.path.exists(future_tmp) and os.path.exists(state_tmp):
+            try:
+                with open(state_tmp) as infile:
+                    json.load(infile)
+            except ValueError:
+                os.remove(state_tmp)  # torn while being staged
+            else:
+                os.replace(state_tmp, json_filename)  # the future file is already in place
+                return
+        for tmp in (future_tmp, state_tmp):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def write_future(self, queue):
+        """Stage the new future file"""
+        check_finite('dose', queue.doses.level)
+        with open(staged_filename(self.iofile_future.name), 'w') as outfile:
+            if self.pending_on_disk is not None:
+                # Copy the entries read_future() left on disk, undecoded,
+                # up to where queue's doses go in
+                self.close_future_map()
+                remaining, tail = self.splice_pending(queue)
+                self.iofile_future.seek(0)
+                while remaining > 0:
+                    chunk = self.iofile_future.read(min(self.COPY_SIZE, remaining))
+                    outfile.write(chunk)
+                    remaining -= len(chunk)
+                outfile.write(tail)
+            else:
+                self.load_pending(queue)
+                self.codec.dump(future_entries(queue), outfile, **self.future_format)
+                self.set_next_due(earliest_when(queue))
+            sync(outfile)
+        self.close_future_map()
+        self.future_staged = True
+
+    def write_state(self, data_dict):
+        """Stage the new state file, then commit both files"""
+        state = self.snapshot(data_dict)
+        with open(staged_filename(self.iofile.name), 'w') as outfile:
+            self.codec.dump(state, outfile)
+            sync(outfile)
+        if self.future_staged:
+            os.replace(staged_filename(self.iofile_future.name), self.iofile_future.name)
+            self.future_staged = False
+        os.replace(staged_filename(self.iofile.name), self.iofile.name)
+        sync_directory(self.iofile.name)
+        self.iofile = reopen(self.iofile)
+        self.iofile_future = reopen(self.iofile_future)
+
+
+def staged_filename(filename):
+    return f'{filename}{STAGED_SUFFIX}'
+
+
+def sync(outfile):
+    """Flush outfile and, if it is a file on disk, fsync it"""
+    outfile.flush()
+    try:
+        fileno = outfile.fileno()
+    except OSError:  # io.UnsupportedOperation: an in-memory file
+        return
+    os.fsync(fileno)
+
+
+def sync_directory(filename):
+    """Make renames in filename's directory durable"""
+    fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def reopen(infile):
+    """:return: infile's path opened afresh in its mode, after infile is closed"""
+    infile.close()
+    return open(infile.name, infile.mode)
+
+
+class JournalStorage:
+    """
+    A .log file plus an append-only journal of fixed-size binary
+    records, each a struct of (kind, time, time, level):
+
+    STATE:   (time of reading, unused, level)
+    PENDING: (when to process, time entered, level) -- a dose added
+    DRAIN:   (time, unused, unused) -- every pending dose due by then
+             has been added to the level
+    GUT:     (absorption half-life in seconds, unused, mg) -- written
+             with each STATE record, for drinks still being absorbed
+             (see kinetics.py)
+
+    A run appends only the records for what changed, in one write that
+    ends with a STATE record; records after the last STATE record are
+    the remains of a run cut short, and are dropped on replay. Once
+    dead records outnumber live ones, the journal is rewritten, through
+    a temporary file, as its pending doses and one STATE record.
+    """
+    RECORD = struct.Struct('<Bqqd')
+    STATE, PENDING, DRAIN, GUT = range(4)
+    COMPACT_MIN_RECORDS = 1024
+
+    def __init__(self, logfile, journal):
+        """
+        :param logfile: an opened file handle
+        :param journal: a file handle opened in binary read/write mode
+        """
+        self.logfile = logfile
+        self.journal = journal
+        self.num_records = 0
+        self.state = {}
+        self.pending = None  # FutureQueue, once the journal is replayed
+        self.now = None
+        self.recorded = Counter()  # pending doses already in the journal
+        self.staged_records = []  # written by write_state(), with the STATE record
+
+    def replay(self):
+        """
+        Rebuild the state and pending doses from the journal, unpacking
+        records in place from an mmap where the journal can be mapped
+        """
+        mapped = future_map.map_file(self.journal)
+        if mapped is None:
+            self.journal.seek(0)
+            data = self.journal.read()
+        else:
+            data = mapped
+        whole = len(data) - len(data) % self.RECORD.size
+        while whole and data[whole - self.RECORD.size] != self.STATE:
+            whole -= self.RECORD.size  # not committed
+
+        doses = DoseBatch()  # in journal order
+        drains = []  # (number of doses written before it, time) per DRAIN
+        gut = {}
+        with memoryview(data) as view, view[:whole] as records:
+            for kind, t1, t2, level in self.RECORD.iter_unpack(records):
+                if kind == self.STATE:
+                    self.state = {'time': format_epoch(t1), 'level': level}
+                    if gut:
+                        self.state[kinetics.ABSORBING] = gut
+                        gut = {}
+                elif kind == self.GUT:
+                    gut[str(t1)] = level
+                elif kind == self.PENDING:
+                    doses.append(Dose(t1, t2, level))
+                elif kind == self.DRAIN:
+                    drains.append((len(doses), t1))
+        self.pending = FutureQueue(self.survivors(doses, drains))
+        size = len(data)
+        if mapped is not None:
+            mapped.close()
+        if whole != size:  # drop what a crash cut short
+            self.journal.truncate(whole)
+        self.num_records = whole // self.RECORD.size
+
+    @staticmethod
+    def survivors(doses, drains):
+        """
+        Apply every DRAIN to the doses written before it, in one pass
+        from the end of the journal, instead of pushing and popping
+        doses one record at a time.
+        :param doses: a DoseBatch in journal order
+        :param drains: (number of doses written before it, time) per DRAIN record
+        :return: a DoseBatch of the doses no DRAIN removed, latest
+                 written first, so that of doses due at the same time
+                 the oldest pops first
+        """
+        kept = DoseBatch()
+        cutoff = None
+        for i in range(len(doses) - 1, -1, -1):
+            while drains and drains[-1][0] > i:
+                t = drains.pop()[1]
+                cutoff = t if cutoff is None else max(cutoff, t)
+            if cutoff is None or doses.when[i] > cutoff:
+                kept.when.append(doses.when[i])
+                kept.entered.append(doses.entered[i])
+                kept.level.append(doses.level[i])
+        return kept
+
+    def read_log(self):
+        return read_log_summary(self.logfile.name)
+
+    def read_history(self, n):
+        return read_log_tail(self.logfile.name, n)
+
+    def read_state(self):
+        if self.pending is None:
+            self.replay()
+        return dict(self.state)
+
+    def read_future(self, now):
+        if self.pending is None:
+            self.replay()
+        self.now = now
+        queue = self.pending
+        self.recorded = Counter((d.when, d.entered, d.level) for d in queue if d.when > now)
+        return queue
+
+    def load_pending(self, queue):
+        pass  # read_future() returns every pending dose
+
+    def append(self, records):
+        self.journal.seek(0, os.SEEK_END)
+        self.journal.write(b''.join(self.RECORD.pack(*record) for record in records))
+        sync(self.journal)
+        self.num_records += len(records)
+
+    def write_future(self, queue):
+        """Stage a DRAIN record, and a PENDING record per new dose"""
+        current = Counter((d.when, d.entered, d.level) for d in queue if d.level != 0)
+        records = []
+        if self.now is not None:
+            records.append((self.DRAIN, self.now, 0, 0.0))
+        records.extend((self.PENDING, when, entered, level)
+                       for (when, entered, level), count in (current - self.recorded).items()
+                       for __ in range(count))
+        self.staged_records = records
+        self.recorded = current
+        self.pending = FutureQueue(queue.doses[:])  # the caller may go on using queue
+
+    def write_state(self, data_dict):
+        """Commit the staged records, GUT records and a STATE record in one write"""
+        self.append(self.staged_records + self.state_records(data_dict))
+        self.staged_records = []
+        self.state = dict(data_dict)
+        live = 1 + len(self.recorded)
+        if self.num_records > self.COMPACT_MIN_RECORDS and self.num_records > 2 * live:
+            self.compact()
+
+    def state_records(self, data_dict):
+        """:return: the GUT records, if any, and the STATE record for data_dict"""
+        records = [(self.GUT, int(key), 0, amount)
+                   for key, amount in data_dict.get(kinetics.ABSORBING, {}).items()]
+        records.append((self.STATE, parse_epoch(data_dict['time']), 0, data_dict['level']))
+        return records
+
+    def compact(self):
+        """Rewrite the journal as the pending doses and one commit of the state"""
+        records = [(self.PENDING, when, entered, level)
+                   for (when, entered, level), count in self.recorded.items()
+                   for __ in range(count)]
+        records.extend(self.state_records(self.state))
+        self.num_records = 0
+        name = getattr(self.journal, 'name', None)
+        if not isinstance(name, str):  # not a file on disk: rewrite in place
+            self.journal.seek(0)
+            self.journal.truncate()
+            self.append(records)
+            return
+        journal = self.journal
+        with open(staged_filename(name), 'wb') as self.journal:
+            self.append(records)
+        os.replace(staged_filename(name), name)
+        sync_directory(name)
+        self.journal = reopen(journal)
+
+
+class SqliteStorage:
+    """
+    Level, pending doses and log lines for any number of profiles in
+    one SQLite database. Pending doses are indexed by (profile,
+    when_to_process), so the due doses are a range query; a run's
+    writes are committed in one transaction by write_state().
+    """
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS state (
+            profile TEXT PRIMARY KEY,
+            time INTEGER NOT NULL,
+            level REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS pending (
+            profile TEXT NOT NULL,
+            when_to_process INTEGER NOT NULL,
+            time_entered INTEGER NOT NULL,
+            level REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS pending_due ON pending (profile, when_to_process);
+        CREATE TABLE IF NOT EXISTS absorbing (
+            profile TEXT NOT NULL,
+            half_life INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            PRIMARY KEY (profile, half_life)
+        );
+        CREATE TABLE IF NOT EXISTS log (
+            id INTEGER PRIMARY KEY,
+            profile TEXT NOT NULL,
+            line TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS log_profile ON log (profile, id);
+    '''
+
+    def __init__(self, connection, profile='default'):
+        """
+        :param connection: a sqlite3.Connection
+        :param profile: whose level and doses to read and write
+        """
+        self.connection = connection
+        self.profile = profile
+        self.now = None
+        self.recorded = Counter()  # pending doses already in the database
+        self.connection.executescript(self.SCHEMA)
+
+    def log_handler(self):
+        """:return: a logging.Handler that adds log lines to the log table"""
+        handler = SqliteLogHandler(self)
+        handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        return handler
+
+    def write_log_line(self, line):
+        self.connection.execute('INSERT INTO log (profile, line) VALUES (?, ?)', (self.profile, line))
+
+    def read_log(self):
+        """:return: (first_line, last_line, num_lines), as read_log_summary() does"""
+        select = 'SELECT line FROM log WHERE profile = ? ORDER BY id {} LIMIT 1'
+        first = self.connection.execute(select.format('ASC'), (self.profile,)).fetchone()
+        last = self.connection.execute(select.format('DESC'), (self.profile,)).fetchone()
+        num_lines, = self.connection.execute('SELECT COUNT(*) FROM log WHERE profile = ?',
+                                             (self.profile,)).fetchone()
+        return (first[0] if first else '', last[0] if num_lines >= 2 else '', num_lines)
+
+    def read_history(self, n):
+        rows = self.connection.execute('SELECT line FROM log WHERE profile = ? ORDER BY id DESC LIMIT ?',
+                                       (self.profile, n)).fetchall()
+        return [line for line, in reversed(rows)]
+
+    def read_state(self):
+        row = self.connection.execute('SELECT time, level FROM state WHERE profile = ?',
+                                      (self.profile,)).fetchone()
+        if row is None:
+            return {}
+        state = {'time': format_epoch(row[0]), 'level': row[1]}
+        gut = {str(half_life): amount for half_life, amount in self.connection.execute(
+            'SELECT half_life, amount FROM absorbing WHERE profile = ?', (self.profile,))}
+        if gut:
+            state[kinetics.ABSORBING] = gut
+        return state
+
+    def select_doses(self, condition, params):
+        """:return: a DoseBatch of this profile's pending doses matching condition, latest first"""
+        doses = DoseBatch()
+        rows = self.connection.execute(
+            'SELECT when_to_process, time_entered, level FROM pending '
+            f'WHERE profile = ? AND {condition} ORDER BY when_to_process DESC',
+            (self.profile, *params))
+        for when, entered, level in rows:
+            doses.when.append(when)
+            doses.entered.append(entered)
+            doses.level.append(level)
+        return doses
+
+    def read_future(self, now):
+        """Select the doses due by now (epoch seconds); later ones stay in the database"""
+        self.now = now
+        self.recorded = Counter()
+        return FutureQueue(self.select_doses('when_to_process <= ?', (now,)))
+
+    def load_pending(self, queue):
+        if self.now is None:
+            return
+        doses = self.select_doses('when_to_process > ?', (self.now,))
+        queue.merge(doses)
+        self.recorded.update(zip(doses.when, doses.entered, doses.level))
+
+    def write_future(self, queue):
+        """Delete the drained doses and insert the new ones"""
+        if self.now is not None:
+            self.connection.execute('DELETE FROM pending WHERE profile = ? AND when_to_process <= ?',
+                                    (self.profile, self.now))
+        doses = queue.doses
+        current = Counter((when, entered, level)
+                          for when, entered, level in zip(doses.when, doses.entered, doses.level)
+                          if level != 0)
+        self.connection.executemany(
+            'INSERT INTO pending (profile, when_to_process, time_entered, level) VALUES (?, ?, ?, ?)',
+            ((self.profile, when, entered, level)
+             for (when, entered, level), count in (current - self.recorded).items()
+             for __ in range(count)))
+        self.recorded = current
+
+    def write_state(self, data_dict):
+        """Store the level and commit everything written since read_future()"""
+        self.connection.execute('INSERT OR REPLACE INTO state (profile, time, level) VALUES (?, ?, ?)',
+                                (self.profile, parse_epoch(data_dict['time']), data_dict['level']))
+        self.connection.execute('DELETE FROM absorbing WHERE profile = ?', (self.profile,))
+        self.connection.executemany('INSERT INTO absorbing (profile, half_life, amount) VALUES (?, ?, ?)',
+                                    ((self.profile, int(key), amount)
+                                     for key, amount in data_dict.get(kinetics.ABSORBING, {}).items()))
+        self.connection.commit()
+
+
+class MemoryStorage:
+    """One profile's level and pending doses, held in memory"""
+    def __init__(self, state=None, doses=None):
+        """
+        :param state: {'time': str, 'level': float}, or None
+        :param doses: a DoseBatch of pending doses, or None
+        """
+        self.state = dict(state) if state else {}
+        self.queue = FutureQueue(doses)
+        self.dirty = False  # changed since it was loaded or saved
+
+    def read_log(self):
+        return '', '', 0
+
+    def read_history(self, n):
+        return []
+
+    def read_state(self):
+        return dict(self.state)
+
+    def read_future(self, now):
+        return self.queue
+
+    def load_pending(self, queue):
+        pass  # every pending dose is in memory already
+
+    def write_future(self, queue):
+        if 0 in queue.doses.level:  # as the other backends, keep no empty doses
+            queue = FutureQueue(DoseBatch.from_doses(dose for dose in queue.doses if dose.level != 0))
+        self.queue = queue
+        self.dirty = True
+
+    def write_state(self, data_dict):
+        self.state = dict(data_dict)
+        self.dirty = True
+
+
+class SqliteLogHandler(logging.Handler):
+    """Sends log records to the log table, through SqliteStorage or ProfileEngine"""
+    def __init__(self, storage):
+        super().__init__()
+        self.storage = storage
+
+    def emit(self, record):
+        try:
+            self.storage.write_log_line(self.format(record))
+        except Exception:
+            self.handleError(record)
@@ -0,0 +1,138 @@
+# file: src/timestamps.py
+# created: 2026-10-16
+"""
+Conversions between naive datetimes, integer epoch seconds and
+'YYYY-MM-DD HH:MM:SS' strings.
+
+Epoch seconds here count wall-clock time from 1970-01-01 00:00:00
+with no time zone, so differences between them are the same as
+differences between the naive datetimes they came from.
+
+The string codec splits a timestamp at fixed offsets instead of
+calling datetime.strptime()/strftime(), which are slow in CPython.
+A time of day is converted by table lookups of its hour, minute and
+second, which also validate them; dates are cached, since pending
+doses share a handful of them.
+"""
+from datetime import date as dt_date, datetime, timedelta
+import re
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+ONE_SECOND = timedelta(seconds=1)
+SECONDS_PER_DAY = 86400
+
+
+def to_epoch(dt):
+    """Naive datetime -> integer epoch seconds (microseconds dropped)"""
+    return (dt - EPOCH) // ONE_SECOND
+
+
+def from_epoch(seconds):
+    """Integer epoch seconds -> naive datetime"""
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def days_from_civil(year, month, day):
+    """Days from 1970-01-01 to the given proleptic Gregorian date"""
+    year -= month <= 2
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def civil_from_days(days):
+    """Inverse of days_from_civil(): :return: (year, month, day)"""
+    days += 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + (3 if mp < 10 else -9)
+    return yoe + era * 400 + (month <= 2), month, day
+
+
+# Tables and caches for the codec. A time of day is looked up in three
+# parts, each with its separator: ' HH', ':MM' and ':SS'; the tables hold
+# only valid parts, so a lookup both checks and converts one. Keys enter
+# _date_seconds only after validation, so a string whose date and time
+# parts are all found is a well-formed timestamp.
+_hour_seconds = {f' {hour:02d}': hour * 3600 for hour in range(24)}
+_minute_seconds = {f':{minute:02d}': minute * 60 for minute in range(60)}
+_second_seconds = {f':{second:02d}': second for second in range(60)}
+_hour_strings = list(_hour_seconds)  # hour -> ' HH'
+_sixty_strings = list(_second_seconds)  # minute or second -> ':MM'
+_date_seconds = {}  # 'YYYY-MM-DD' -> epoch seconds at midnight
+_date_strings = {}  # days since epoch -> 'YYYY-MM-DD'
+MAX_CACHED_DATES = 16384  # 45 years; a few MB at most
+DATE_RE = re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}')
+
+
+def clear_caches():
+    """Forget the cached dates, as in a fresh process. Called by: benchmarks"""
+    _date_seconds.clear()
+    _date_strings.clear()
+
+
+def _parse_slow(text):
+    """Validate and cache the date half of text, then parse it"""
+    error = ValueError(f"time data '{text}' does not match format '{TIME_FORMAT}'")
+    date = text[:10]
+    if date not in _date_seconds:
+        if not DATE_RE.fullmatch(date):
+            raise error
+        try:
+            days = dt_date.fromisoformat(date).toordinal() - EPOCH_ORDINAL  # checks the day is in its month
+        except ValueError:
+            raise error from None
+        if len(_date_seconds) >= MAX_CACHED_DATES:
+            _date_seconds.clear()
+        _date_seconds[date] = days * SECONDS_PER_DAY
+    try:
+        return (_date_seconds[date] + _hour_seconds[text[10:13]]
+                + _minute_seconds[text[13:16]] + _second_seconds[text[16:]])
+    except KeyError:
+        raise error from None
+
+
+def parse_epoch(text):
+    """
+    'YYYY-MM-DD HH:MM:SS' -> integer epoch seconds
+    :raises ValueError: if text is not in that format
+    """
+    try:
+        return (_date_seconds[text[:10]] + _hour_seconds[text[10:13]]
+                + _minute_seconds[text[13:16]] + _second_seconds[text[16:]])
+    except KeyError:
+        return _parse_slow(text)
+
+
+def format_epoch(seconds):
+    """Integer epoch seconds -> 'YYYY-MM-DD HH:MM:SS'"""
+    days, secs = divmod(seconds, SECONDS_PER_DAY)
+    hour, secs = divmod(secs, 3600)
+    minute, second = divmod(secs, 60)
+    try:
+        date = _date_strings[days]
+    except KeyError:
+        if len(_date_strings) >= MAX_CACHED_DATES:
+            _date_strings.clear()
+        year, month, day = civil_from_days(days)
+        date = _date_strings[days] = f'{year:04d}-{month:02d}-{day:02d}'
+    return date + _hour_strings[hour] + _sixty_strings[minute] + _sixty_strings[second]
+
+
+def parse_datetime(text):
+    """'YYYY-MM-DD HH:MM:SS' -> naive datetime"""
+    return from_epoch(parse_epoch(text))
+
+
+def format_datetime(dt):
+    """Naive datetime -> 'YYYY-MM-DD HH:MM:SS' (microseconds dropped)"""
+    return (f'{dt.year:04d}-{dt.month:02d}-{dt.day:02d} '
+            f'{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}')
@@ -4,13 +4,17 @@ import os
 import re
 import sys
 import argparse
-import configparser
 from datetime import datetime
 import json
 from pathlib import Path
 import logging
 
-CONFIG_FILENAME = 'src/caffeine.ini'
+from src.absorption import DEFAULT_PROFILES, SECTION as BEVERAGES_SECTION, load_profiles
+from src.codec import get_codec
+from src.config import (CONFIG_FILENAME, DEFAULT_PROFILE, EnvironmentConfig, HalfLives, load_config,
+                        profile_filename, profile_name, read_config_file, read_half_life)
+from src.log_reader import discard_index
+from src.timestamps import format_datetime
 
 
 def check_which_environment():
@@ -40,12 +44,35 @@ def create_parser():
                                                                'hours in the future, it is assumed to represent a '
                                                                'time in the previous day.')
 
+    parser.add_argument('-p', '--profile', default=DEFAULT_PROFILE, type=profile_name,
+                        help="whose caffeine level to track, whatever the case (default: 'default')")
+    serve_group = parser.add_mutually_exclusive_group()
+    serve_group.add_argument('--daemon', action='store_true',
+                             help='stay resident and serve requests on a Unix domain socket (see src/client.py)')
+    serve_group.add_argument('--service', action='store_true',
+                             help='as --daemon, with an asyncio server for many concurrent clients')
+    serve_group.add_argument('--recompute', action='store_true',
+                             help="re-derive the level from the logged doses with the profile's half-life")
+    serve_group.add_argument('--import', dest='import_file', metavar='FILE',
+                             help='add every (timestamp, mg, beverage) row of a CSV or JSON Lines file '
+                                  'in one run; also given as `import FILE`')
+
     bev_parser = parser.add_argument_group('beverage options')
-    bev_parser.add_argument('-b', '--bev', choices=['coffee', 'soda', 'chocolate'], default='coffee', help="beverage: 'coffee' (default), 'soda', or 'chocolate'")
+    bev_parser.add_argument('-b', '--bev', choices=beverage_names(load_config()), default='coffee',
+                            help="beverage: 'coffee' (default), 'soda', 'chocolate', or another "
+                                 "named in the [beverages] section of caffeine.ini")
 
     return parser
 
 
+def beverage_names(config):
+    """:return: the beverages with an absorption profile, default or configured"""
+    names = list(DEFAULT_PROFILES)
+    if BEVERAGES_SECTION in config:
+        names.extend(name for name in config[BEVERAGES_SECTION] if name not in DEFAULT_PROFILES)
+    return names
+
+
 def validate_args(parser, args):
     # Check for multiple instances of -b/--bev argument
     if args.count('--bev') + args.count('-b') > 1:
@@ -117,6 +144,8 @@ def parse_clas(args=None):
         args = sys.argv[1:]
 
     parser = create_parser()
+    if args[:1] == ['import']:  # the import subcommand
+        args = ['--import'] + args[1:]
 
     try:
         args = parser.parse_args(args)
@@ -156,6 +185,7 @@ def create_files(log_filename, json_filename, json_future_filename):
         first_run = True
         init_storage(json_filename)
         delete_old_logfile(log_filename)  # if it exists
+        discard_index(log_filename)
         init_logfile(log_filename)
         if not my_file_future.is_file():
             init_future(json_future_filename)
@@ -165,10 +195,20 @@ def create_files(log_filename, json_filename, json_future_filename):
     return first_run
 
 
-def read_config_file(config_file):
-    conf = configparser.ConfigParser()
-    conf.read(config_file)
-    return conf
+def create_journal(log_filename, journal_filename):
+    """
+    Create an empty journal, and a fresh log file, if there is no
+    journal yet or it is empty
+    :return: True if this is the first run
+    """
+    journal = Path(journal_filename)
+    if journal.is_file() and os.path.getsize(journal) > 0:
+        return False
+    init_journal(journal_filename)
+    delete_old_logfile(log_filename)  # if it exists
+    discard_index(log_filename)
+    init_logfile(log_filename)
+    return True
 
 
 def check_cla_match_env(cur_env, ags):
@@ -200,7 +240,7 @@ def check_cla_match_env(cur_env, ags):
 
 def init_storage(fname):
     """Create a .json file with initial values for time and level"""
-    time_now = datetime.strftime(datetime.today(), '%Y-%m-%d %H:%M:%S')
+    time_now = format_datetime(datetime.today())
     start_level = 0
     try:
         with open(fname, 'w') as outfile:
@@ -221,6 +261,28 @@ def init_future(fname):
         raise
 
 
+def init_journal(fname):
+    """Create an empty journal file"""
+    try:
+        with open(fname, 'wb'):
+            pass
+    except OSError as er:
+        print('Unable to create journal file in `init_journal()`', er)
+        raise
+
+
+def open_file(stack, fname, mode, description):
+    """
+    Open fname and register it with contextlib.ExitStack stack
+    Called by: caffeine_monitor.py
+    """
+    try:
+        return stack.enter_context(open(fname, mode))
+    except OSError as e:
+        print(f'Unable to open {description}', e)
+        raise
+
+
 def delete_old_logfile(fname):
     try:
         os.remove(fname)
@@ -231,7 +293,7 @@ def delete_old_logfile(fname):
 
 def init_logfile(fname):
     """
-    Called by: set_up()
+    Called by: create_files(), create_journal()
     """
     try:
         with open(fname, 'a+') as logfile:
@@ -249,17 +311,55 @@ def set_up():
         sys.exit(0)
 
     current_environment = check_which_environment()
-    config = read_config_file(CONFIG_FILENAME)
+    config = load_config()
 
     check_cla_match_env(current_environment, args)
 
-    json_filename = config[current_environment]['json_file']
-    json_future_filename = config[current_environment]['json_file_future']
-    log_filename = config[current_environment]['log_file']
+    env_config = EnvironmentConfig(config[current_environment])
+    try:
+        args.beverages = load_profiles(config)
+        args.half_life = read_half_life(config, args.profile)
+        args.half_lives = HalfLives(config)  # every profile's, for a daemon of the sqlite backend
+        args.json_compact = env_config.json_compact
+        args.json_codec = get_codec(env_config.json_codec)
+    except ValueError as e:
+        print(f'Error in {CONFIG_FILENAME}:', e)
+        raise
+
+    args.storage = env_config.storage
+    # the sqlite backend keeps every profile in one database; the others get files per profile
+    file_profile = env_config.file_profile(args.profile)
+    json_filename = env_config.json_file(file_profile)
+    json_future_filename = env_config.json_file_future(file_profile)
+    log_filename = env_config.log_file(file_profile)
+
+    if args.storage == 'journal':
+        args.journal_file = env_config.journal_file(file_profile)
+    elif args.storage == 'sqlite':
+        args.db_file = env_config.db_file()
 
-    first_run = create_files(log_filename, json_filename, json_future_filename)
+    args.socket_file = env_config.socket_file(file_profile)
+    args.lock_file = env_config.lock_file(file_profile)
+    return log_filename, json_filename, json_future_filename, args
 
-    logging.basicConfig(filename=config[current_environment]['log_file'],
+
+def init_files(log_filename, json_filename, json_future_filename, args):
+    """
+    Create the storage files if this is the first run, and log to
+    log_filename from then on
+    :param args: as set_up() returns them
+    :return: True if this is the first run
+    Called by: caffeine_monitor.py, with the exclusive lock held, so
+               that two first runs cannot both create the files
+    """
+    if args.storage == 'journal':
+        first_run = create_journal(log_filename, args.journal_file)
+    elif args.storage == 'sqlite':
+        first_run = not Path(args.db_file).is_file() or os.path.getsize(args.db_file) == 0
+    else:
+        first_run = create_files(log_filename, json_filename, json_future_filename)
+
+    logging.basicConfig(filename=log_filename,
                         level=logging.INFO,
                         format='%(levelname)s: %(message)s')
-    return log_filename, json_filename, json_future_filename, first_run, args
+    return first_run